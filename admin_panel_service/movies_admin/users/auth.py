@@ -1,11 +1,11 @@
 import http
 import json
 
-import jwt
 import requests
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth import get_user_model
 
+from .jwks import decode_token
 from .models import Permission, Group
 from .settings import settings
 
@@ -25,11 +25,7 @@ class CustomBackend(BaseBackend):
         request.session['access_token'] = data['access_token']
         request.session['refresh_token'] = data['refresh_token']
 
-        decoded_token = jwt.decode(
-            jwt=data['access_token'],
-            key='secret',
-            algorithms=['HS256']
-        )
+        decoded_token = decode_token(data['access_token'])
         user, created = User.objects.get_or_create(id=decoded_token['user_id'])
         user.username = decoded_token.get('sub')
 
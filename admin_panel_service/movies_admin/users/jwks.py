@@ -0,0 +1,17 @@
+import jwt
+
+from .settings import settings
+
+
+# PyJWKClient хранит ключи в памяти процесса по kid и перезапрашивает JWKS только для неизвестного kid
+jwks_client = jwt.PyJWKClient(
+    settings.JWKS_URL,
+    cache_keys=True,
+    lifespan=settings.JWKS_LIFESPAN,
+    headers={'X-Request-Id': 'auth_service'},
+)
+
+
+def decode_token(token: str) -> dict:
+    signing_key = jwks_client.get_signing_key_from_jwt(token)
+    return jwt.decode(token, signing_key.key, algorithms=[settings.JWT_ALGORITHM])
@@ -1,12 +1,33 @@
+import logging
+
 import jwt
 import requests
 
 from django.contrib.auth import logout
 from django.shortcuts import redirect
 
+from .jwks import decode_token
 from .settings import settings
 
 
+# токен, который нельзя проверить: подпись неизвестным ключом, недоступный JWKS или испорченный токен.
+# ExpiredSignatureError - подкласс InvalidTokenError, поэтому обрабатывается раньше
+INVALID_TOKEN_ERRORS = (jwt.PyJWKClientError, jwt.InvalidTokenError, KeyError)
+
+
+def refresh_tokens(request) -> bool:
+    try:
+        refresh_token = request.session['refresh_token']
+        response = requests.post(settings.REFRESH_TOKENS_URL, headers={'Authorization': f'Bearer {refresh_token}', 'X-Request-Id': 'auth_service'})
+        tokens = response.json()
+        request.session['access_token'] = tokens['access_token']
+        request.session['refresh_token'] = tokens['refresh_token']
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logging.warning('Failed to refresh tokens: %s', e)
+        return False
+    return True
+
+
 class AccessTokenFreshnessMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -14,12 +35,14 @@ class AccessTokenFreshnessMiddleware:
     def __call__(self, request):
         if request.user.is_authenticated:
             try:
-                jwt.decode(request.session['access_token'], 'secret', algorithms=['HS256'])
+                decode_token(request.session['access_token'])
             except jwt.ExpiredSignatureError:
-                refresh_token = request.session['refresh_token']
-                response = requests.post(settings.REFRESH_TOKENS_URL, headers={'Authorization': f'Bearer {refresh_token}', 'X-Request-Id': 'auth_service'})
-                request.session['access_token'] = response.json()['access_token']
-                request.session['refresh_token'] = response.json()['refresh_token']
+                if not refresh_tokens(request):
+                    logout(request)
+            except INVALID_TOKEN_ERRORS as e:
+                # пользователь становится анонимным, и админка отправит его на страницу входа
+                logging.warning('Invalid access token, logging out: %s', e)
+                logout(request)
         response = self.get_response(request)
         return response
 
@@ -31,8 +54,10 @@ class RefreshTokenFreshnessMiddleware:
     def __call__(self, request):
         if request.user.is_authenticated:
             try:
-                jwt.decode(request.session['refresh_token'], 'secret', algorithms=['HS256'])
-            except jwt.ExpiredSignatureError:
+                decode_token(request.session['refresh_token'])
+            except INVALID_TOKEN_ERRORS as e:
+                if not isinstance(e, jwt.ExpiredSignatureError):
+                    logging.warning('Invalid refresh token, logging out: %s', e)
                 logout(request)
                 return redirect('admin:login')
 
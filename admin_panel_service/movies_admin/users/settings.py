@@ -7,6 +7,9 @@ class Settings:
     LOGOUT_URL = 'http://auth_service_fastapi:8000/auth/api/v1/users/logout'
     CHANGE_PASSWORD_URL = 'http://auth_service_fastapi:8000/auth/api/v1/users/change_password'
     LOG_IN_URL = 'http://auth_service_fastapi:8000/auth/api/v1/users/signin'
+    JWKS_URL = 'http://auth_service_fastapi:8000/auth/.well-known/jwks.json'
+    JWKS_LIFESPAN = 300
+    JWT_ALGORITHM = 'RS256'
 
 
 settings = Settings()
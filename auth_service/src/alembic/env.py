@@ -15,6 +15,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from db.postgres import Base
 from models.entity import *
 from db.postgres import dsn
+from db.partitions import LOGIN_HISTORY_TABLE
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -39,6 +40,15 @@ print(target_metadata)
 # ... etc.
 
 url = dsn
+
+
+def include_name(name, type_, parent_names) -> bool:
+    # партиции истории входов создаются приложением (db/partitions.py), а не миграциями
+    if type_ == 'table':
+        return not name.startswith(f'{LOGIN_HISTORY_TABLE}_')
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -56,6 +66,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
     )
 
     with context.begin_transaction():
@@ -63,7 +74,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_name=include_name)
 
     with context.begin_transaction():
         context.run_migrations()
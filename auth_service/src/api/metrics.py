@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from core.metrics import metrics_response
+
+
+router = APIRouter()
+
+
+@router.get('', include_in_schema=False)
+async def metrics() -> Response:
+    return metrics_response()
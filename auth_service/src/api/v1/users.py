@@ -4,7 +4,6 @@ from http import HTTPStatus
 from typing import Annotated
 
 import httpx
-from async_fastapi_jwt_auth import AuthJWT
 from async_fastapi_jwt_auth.exceptions import FreshTokenRequired
 from fastapi.security import HTTPBearer
 from fastapi.encoders import jsonable_encoder
@@ -22,8 +21,9 @@ from schemas.entity import (
     GroupAssign,
     UserPaginatedHistoryInDb,
 )
-from services.user_services import get_user_service, UserService
+from services.user_services import get_user_service, UserService, RotationResult
 from services.user import UserPermissionsService, get_user_permissions_service
+from services.auth_jwt import KeyringAuthJWT
 from services.authorization import AuthorizationChecker
 
 MAX_SESSION_NUMBER = 5
@@ -33,7 +33,7 @@ router = APIRouter()
 
 
 # Настройки модуля async_fastapi_jwt_auth
-@AuthJWT.load_config
+@KeyringAuthJWT.load_config
 def get_config():
     return JWTSettings()
 
@@ -102,16 +102,13 @@ async def create_user(
 ) -> UserInDB | HTTPException:
     user_dto = jsonable_encoder(user_create)
 
-    repeated_pass_true = await user_service.check_repeated_password(user_dto.get('password'), user_dto.get('password'))
-
-    user_exist = await user_service.check_exist_user(user_dto)
-    if not repeated_pass_true or user_exist:
+    repeated_pass_true = await user_service.check_repeated_password(
+        user_dto.get('password'), user_dto.get('repeated_password')
+    )
+    if not repeated_pass_true:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Некорректное имя пользователя или пароль")
 
-    user_email_unique = await user_service.check_unique_email(user_dto)
-    if not user_email_unique:
-        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Пользователь с данным email уже зарегистрирован")
-
+    # занятые username и email определяются по ограничениям уникальности при вставке
     user = await user_service.create_user(user_dto)
     return user
 
@@ -151,7 +148,7 @@ async def change_password(
 async def login(
         user_signin: UserSighIn,
         user_service: UserService = Depends(get_user_service),
-        Authorize: AuthJWT = Depends(),
+        Authorize: KeyringAuthJWT = Depends(),
         user_agent: Annotated[str | None, Header()] = None,
 ):
     """Вход пользователя в аккаунт."""
@@ -161,25 +158,22 @@ async def login(
             detail='Вы пытаетесь зайти с неизвестного устройства'
         )
 
+    # одним запросом получаем пользователя, его права и состояние сессий
+    signin_state = await user_service.get_signin_state(user_signin.username, user_agent)
+
     # проверяем валидность имени пользователя и пароля
-    user = await user_service.get_user_by_username(user_signin.username)
-    if not user or not user.check_password(user_signin.password):
+    if not signin_state or not await user_service.check_password(signin_state.user, user_signin.password):
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail="Неверное имя пользователя или пароль"
         )
+    user = signin_state.user
 
-    # проверяем, что пользователь уже не вошел с данного устройства
-    active_user_login = await user_service.check_if_user_login(str(user.id), user_agent)
-    if active_user_login:
-        # Check if refresh token was expired
-        if await user_service.check_unexpected_refresh_token_freshness(str(user.id), user_agent):
-            await user_service.put_logout_history_in_db(str(user.id), user_agent)
-            await user_service.del_refresh_session_in_db(str(user.id), user_agent)
-        else:
-            return JSONResponse(
-                status_code=HTTPStatus.BAD_REQUEST,
-                content={'detail': 'Данный пользователь уже совершил вход с данного устройства'})
+    # проверяем, что пользователь уже не вошел с данного устройства (если refresh токен не истек)
+    if signin_state.device_logged_in and not signin_state.device_session_expired:
+        return JSONResponse(
+            status_code=HTTPStatus.BAD_REQUEST,
+            content={'detail': 'Данный пользователь уже совершил вход с данного устройства'})
 
     user_claims = {
         'user_id': str(user.id),
@@ -198,14 +192,17 @@ async def login(
 
     # защита от превышения максимально возможного количества сессий
     session_number = await user_service.count_refresh_sessions(str(user.id))
-    if session_number > MAX_SESSION_NUMBER:
-        await user_service.del_all_refresh_sessions_in_db(user)
 
+    # одной транзакцией закрываем истекшую сессию устройства, при превышении лимита - все сессии,
+    # записываем refresh токен и историю входа
     decrypted_token = await Authorize.get_raw_jwt(refresh_token)
-    await user_service.put_refresh_session_in_db(str(user.id), user_agent, decrypted_token)
-
-    # записываем историю входа в аккаунт
-    await user_service.put_login_history_in_db(str(user.id), user_agent)
+    await user_service.open_session(
+        str(user.id),
+        user_agent,
+        decrypted_token,
+        close_device_session=signin_state.device_logged_in,
+        close_all_sessions=session_number > MAX_SESSION_NUMBER,
+    )
 
     return JSONResponse(content={
         'access_token': access_token,
@@ -221,7 +218,7 @@ async def login(
 )
 async def logout(
         user_service: UserService = Depends(get_user_service),
-        Authorize: AuthJWT = Depends(),
+        Authorize: KeyringAuthJWT = Depends(),
         user_agent: Annotated[str | None, Header()] = None,
         authorization: str = Depends(security)
 ):
@@ -261,7 +258,7 @@ async def logout(
 )
 async def refresh(
         user_service: UserService = Depends(get_user_service),
-        Authorize: AuthJWT = Depends(),
+        Authorize: KeyringAuthJWT = Depends(),
         user_agent: Annotated[str | None, Header()] = None,
         authorization: str = Depends(security),
 ):
@@ -278,19 +275,8 @@ async def refresh(
     decrypted_token = await Authorize.get_raw_jwt()
     user_id = decrypted_token['user_id']
 
-    # удаляем сессию из таблицы refresh_sessions
-    session_exist = await user_service.check_if_session_exist(user_id, user_agent)
-    if session_exist:
-        await user_service.del_refresh_session_in_db(user_id, user_agent)
-    else:
-        raise HTTPException(
-            status_code=HTTPStatus.UNAUTHORIZED,
-            detail='Невалидный токен для данного устройства',
-        )
-
     # создаем пару access и refresh токенов
     username = await Authorize.get_jwt_subject()
-    user = await user_service.get_user_by_user_id(user_id)
     user_claims = {
         'user_id': user_id,
         'groups_permissions': await user_service.get_user_groups_permissions(user_id)
@@ -305,9 +291,21 @@ async def refresh(
         user_claims=user_claims
     )
 
-    # сохраняем refresh токен и информацию об устройстве, с которого был совершен вход, в базу данных
+    # одной транзакцией заменяем сессию предъявленного refresh токена на новую
     new_decrypted_token = await Authorize.get_raw_jwt(refresh_token)
-    await user_service.put_refresh_session_in_db(user_id, user_agent, new_decrypted_token)
+    rotation = await user_service.rotate_refresh_session(
+        user_id, user_agent, decrypted_token['jti'], new_decrypted_token
+    )
+    if rotation is RotationResult.REUSED:
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail='Refresh токен уже был использован, все сессии завершены',
+        )
+    if rotation is not RotationResult.ROTATED:
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail='Невалидный токен для данного устройства',
+        )
 
     return JSONResponse(
         status_code=HTTPStatus.OK,
@@ -324,17 +322,15 @@ async def refresh(
 )
 async def get_history(
         user_id: UUID,
-        page_size: int = Query(ge=1, default=2),
-        page_number: int = Query(ge=1, default=1),
+        page_size: int = Query(ge=1, le=100, default=2),
+        cursor: str | None = Query(default=None, description='Курсор следующей страницы из предыдущего ответа'),
         user_service: UserService = Depends(get_user_service),
 ):
-    history = await user_service.get_login_history(user_id, page_size, page_number)
-    count = await user_service.get_login_history_count(user_id)
-    previous, next_page = await user_service.calc_previous_and_next_pages(page_number, page_size, count)
+    history, next_cursor = await user_service.get_login_history(user_id, page_size, cursor)
 
     result = {
-        'previous': previous,
-        'next': next_page,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
         'items': history
     }
 
@@ -394,7 +390,7 @@ async def login_via_social(
 @router.get('/auth_yandex')
 async def auth_via_yandex(
         request: Request,
-        Authorize: AuthJWT = Depends(),
+        Authorize: KeyringAuthJWT = Depends(),
         user_service: UserService = Depends(get_user_service),
         user_agent: Annotated[str | None, Header()] = None,
 ):
@@ -444,14 +440,15 @@ async def auth_via_yandex(
 
     # защита от превышения максимально возможного количества сессий
     session_number = await user_service.count_refresh_sessions(str(user.id))
-    if session_number > MAX_SESSION_NUMBER:
-        await user_service.del_all_refresh_sessions_in_db(user)
 
+    # одной транзакцией записываем refresh токен и историю входа в аккаунт
     decrypted_token = await Authorize.get_raw_jwt(refresh_token)
-    await user_service.put_refresh_session_in_db(str(user.id), user_agent, decrypted_token)
-
-    # записываем историю входа в аккаунт
-    await user_service.put_login_history_in_db(str(user.id), user_agent)
+    await user_service.open_session(
+        str(user.id),
+        user_agent,
+        decrypted_token,
+        close_all_sessions=session_number > MAX_SESSION_NUMBER,
+    )
 
     return JSONResponse(content={
         'access_token': access_token,
@@ -468,7 +465,7 @@ async def auth_via_yandex(
 async def remove_social_account(
         request: Request,
         social_name: str,
-        Authorize: AuthJWT = Depends(),
+        Authorize: KeyringAuthJWT = Depends(),
         user_service: UserService = Depends(get_user_service),
         authorization: str = Depends(security),
 ):
@@ -478,10 +475,9 @@ async def remove_social_account(
 
     decrypted_token = await Authorize.get_raw_jwt()
     user_id = decrypted_token['user_id']
-    user = await user_service.get_user_by_id(user_id)
 
     # удаляем сессию из таблицы users_socials
-    for social in user.user_social_networks:
+    for social in await user_service.get_user_social_networks(user_id):
         if social.social_name == social_name:
             await user_service.del_user_social(social_name, social.social_id)
             break
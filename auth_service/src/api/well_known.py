@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Response
+
+from core.config import settings
+from core.keyring import get_keyring
+
+
+router = APIRouter()
+
+
+@router.get(
+    '/jwks.json',
+    summary='Открытые ключи подписи JWT',
+    description='Возвращает открытые ключи в формате JWKS для локальной проверки токенов другими сервисами'
+)
+async def jwks() -> Response:
+    return Response(
+        content=get_keyring().jwks_body,
+        media_type='application/json',
+        headers={'Cache-Control': f'public, max-age={settings.JWKS_MAX_AGE}'}
+    )
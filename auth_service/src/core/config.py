@@ -1,6 +1,6 @@
 import os
 from datetime import timedelta
-from typing import Any
+from typing import Any, Literal
 from logging import config as logging_config
 
 from pydantic import PostgresDsn, field_validator, ValidationInfo
@@ -22,7 +22,77 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = 'postgres'
     POSTGRES_SCHEME: str = 'postgresql+asyncpg'
 
+    # Пул соединений с Postgres (на один воркер)
+    POSTGRES_POOL_SIZE: int = 10
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 30
+    POSTGRES_POOL_RECYCLE: int = 30 * 60
+    POSTGRES_POOL_PRE_PING: bool = True
+    # Число соединений, открываемых при старте приложения
+    POSTGRES_POOL_WARM_UP: int = 5
+    POSTGRES_STATEMENT_CACHE_SIZE: int = 100
+    POSTGRES_ECHO: bool = False
+
     ENABLE_TRACER: bool = True
+    JAEGER_HOST: str = 'jaeger'
+    JAEGER_PORT: int = 6831
+    # Доля записываемых трейсов; запросы с уже принятым решением (traceparent) его наследуют
+    TRACE_SAMPLE_RATIO: float = 0.1
+    # Дополнительно сохранять все трейсы с ошибкой и медленнее TRACE_SLOW_THRESHOLD_MS
+    TRACE_TAIL_SAMPLING: bool = False
+    TRACE_SLOW_THRESHOLD_MS: float = 500
+    # Очередь и пачки экспорта span
+    TRACE_EXPORT_QUEUE_SIZE: int = 2048
+    TRACE_EXPORT_BATCH_SIZE: int = 512
+    TRACE_EXPORT_DELAY_MS: int = 5000
+    TRACE_EXPORT_TIMEOUT_MS: int = 30000
+    # Отладочный режим: число и время SQL запросов возвращаются в заголовках X-DB-* ответа
+    DEBUG: bool = False
+    # Как часто измерять задержку event loop и снимать состояние пула соединений для /metrics
+    METRICS_SAMPLE_INTERVAL: float = 1.0
+
+    # Ключи подписи JWT: каталог с файлами <kid>.pem и kid ключа для подписи новых токенов
+    # (по умолчанию самый новый). Открытые ключи публикуются в /auth/.well-known/jwks.json
+    JWT_KEYS_DIR: str = 'keys'
+    JWT_ACTIVE_KID: str | None = None
+    # Как часто проверять изменения файлов ключей; токен с неизвестным kid вызывает проверку сразу
+    JWT_KEYS_RELOAD_SECONDS: float = 30
+    JWKS_MAX_AGE: int = 5 * 60
+
+    # Пул процессов для хеширования паролей
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+
+    # Кеш claim groups_permissions: локальный LRU перед Redis.
+    # Инвалидация рассылается воркерам через pub/sub; если сообщение не дошло,
+    # локальная копия может отставать от нее не более чем на CLAIMS_LOCAL_CACHE_TTL
+    CLAIMS_CACHE_EXPIRE_IN_SECONDS: int = 60 * 60
+    CLAIMS_LOCAL_CACHE_SIZE: int = 10_000
+    CLAIMS_LOCAL_CACHE_TTL: int = 5
+
+    # Хранилище активных refresh сессий: postgres или redis (с фоновой записью в Postgres)
+    SESSION_STORAGE: Literal['postgres', 'redis'] = 'postgres'
+
+    # Как часто счетчик активных сессий в Redis сверяется с Postgres
+    SESSION_COUNTER_RECONCILE_SECONDS: int = 5 * 60
+
+    # Перенос изменений сессий из потока Redis в Postgres (для SESSION_STORAGE=redis).
+    # Поток читает один воркер, удерживающий аренду SESSION_WRITER_LEASE_SECONDS
+    SESSION_WRITER_BATCH_SIZE: int = 500
+    SESSION_WRITER_POLL_INTERVAL: float = 0.5
+    SESSION_WRITER_RETRY_INTERVAL: float = 5
+    SESSION_WRITER_LEASE_SECONDS: float = 30
+
+    # Фоновая запись истории входов и выходов
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL: float = 0.5
+    AUDIT_QUEUE_SIZE: int = 50_000
+
+    # Помесячные партиции истории входов
+    LOGIN_HISTORY_PARTITIONS_AHEAD: int = 3
+    LOGIN_HISTORY_PARTITION_CHECK_SECONDS: int = 24 * 60 * 60
+    LOGIN_HISTORY_RETENTION_MONTHS: int = 12
+    LOGIN_HISTORY_ARCHIVE_DIR: str = 'archive'
 
 
 settings = Settings()
@@ -34,7 +104,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Настройка конфигурации библиотеки Async FastAPI JWT Auth
 class JWTSettings(BaseModel):
-    authjwt_secret_key: str = 'secret'
+    authjwt_algorithm: str = 'RS256'
     # Хранить и получать JWT токены из заголовков
     authjwt_token_location: set = {'headers'}
     authjwt_header_name: str = 'Authorization'
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey, RSAPublicKey
+from jwt.algorithms import RSAAlgorithm
+
+from core.config import settings
+
+
+JWT_ALGORITHM = 'RS256'
+KEY_FILE_SUFFIX = '.pem'
+# токен с неизвестным kid перечитывает каталог ключей не чаще раза в секунду
+UNKNOWN_KID_RELOAD_INTERVAL = 1.0
+
+KeysFingerprint = tuple[tuple[str, int, int], ...]
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    private_key: RSAPrivateKey
+    public_key: RSAPublicKey
+
+    @property
+    def jwk(self) -> dict:
+        return {
+            **json.loads(RSAAlgorithm.to_jwk(self.public_key)),
+            'kid': self.kid,
+            'use': 'sig',
+            'alg': JWT_ALGORITHM,
+        }
+
+
+class KeyRing:
+    """
+    Набор ключей подписи JWT из каталога JWT_KEYS_DIR, по файлу `<kid>.pem` на ключ.
+
+    Новые токены подписываются активным ключом (JWT_ACTIVE_KID или самым новым kid),
+    проверяются любым ключом из набора. Для ротации добавляется новый ключ, а старый
+    удаляется после истечения срока жизни выпущенных им refresh токенов.
+    Набор, загруженный из каталога, перечитывается при изменении файлов ключей (см. get_keyring).
+    """
+
+    def __init__(
+            self,
+            keys: dict[str, SigningKey],
+            active_kid: str,
+            keys_dir: Path | None = None,
+            fingerprint: KeysFingerprint = ()
+    ) -> None:
+        if active_kid not in keys:
+            raise ValueError(f'Signing key {active_kid} not found')
+        self.keys = keys
+        self.active = keys[active_kid]
+        self.jwks = {'keys': [key.jwk for key in keys.values()]}
+        self.jwks_body = json.dumps(self.jwks).encode()
+        self.keys_dir = keys_dir
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, keys_dir: str | Path, active_kid: str | None = None) -> 'KeyRing':
+        keys_dir = Path(keys_dir)
+        fingerprint = keys_fingerprint(keys_dir)
+        keys = {}
+        for path in sorted(keys_dir.glob(f'*{KEY_FILE_SUFFIX}')):
+            private_key = serialization.load_pem_private_key(path.read_bytes(), password=None)
+            keys[path.stem] = SigningKey(path.stem, private_key, private_key.public_key())
+        if not keys:
+            raise RuntimeError(f'No JWT signing keys found in {keys_dir}')
+        return cls(keys, active_kid or max(keys), keys_dir, fingerprint)
+
+    def reloaded(self, active_kid: str | None = None) -> 'KeyRing':
+        """Возвращает новый набор, если файлы ключей изменились, иначе этот же."""
+        if self.keys_dir is None or keys_fingerprint(self.keys_dir) == self.fingerprint:
+            return self
+        try:
+            ring = KeyRing.load(self.keys_dir, active_kid)
+        except Exception as e:
+            # файл ключа мог быть записан не полностью: остаемся на прежнем наборе до следующей проверки
+            logging.error('Failed to reload JWT signing keys from %s: %s', self.keys_dir, e)
+            return self
+        logging.info('Reloaded JWT signing keys, active kid %s', ring.active.kid)
+        return ring
+
+    def verification_key(self, kid: str | None) -> RSAPublicKey | None:
+        key = self.keys.get(kid)
+        return key.public_key if key else None
+
+
+def generate_key(keys_dir: str | Path, kid: str | None = None) -> Path:
+    """Создает новый RSA ключ подписи. По умолчанию kid - время создания, поэтому новый ключ становится активным."""
+    keys_dir = Path(keys_dir)
+    keys_dir.mkdir(parents=True, exist_ok=True)
+    kid = kid or datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = keys_dir / f'{kid}{KEY_FILE_SUFFIX}'
+    path.write_bytes(private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ))
+    os.chmod(path, 0o600)
+    return path
+
+
+def has_keys(keys_dir: str | Path) -> bool:
+    return any(Path(keys_dir).glob(f'*{KEY_FILE_SUFFIX}'))
+
+
+def keys_fingerprint(keys_dir: Path) -> KeysFingerprint:
+    """Имена, время изменения и размеры файлов ключей: меняются при добавлении, удалении и замене ключа."""
+    fingerprint = []
+    for path in sorted(keys_dir.glob(f'*{KEY_FILE_SUFFIX}')):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        fingerprint.append((path.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+keyring: KeyRing | None = None
+_checked_at = 0.0
+_unknown_kid_checked_at = 0.0
+
+
+def get_keyring(unknown_kid: bool = False) -> KeyRing:
+    """
+    Текущий набор ключей. Каталог ключей проверяется не чаще раза в JWT_KEYS_RELOAD_SECONDS,
+    а после токена с неизвестным kid (unknown_kid) - не чаще раза в UNKNOWN_KID_RELOAD_INTERVAL:
+    так воркер подхватывает ключ, которым уже подписывают токены другие воркеры.
+    """
+    global keyring, _checked_at, _unknown_kid_checked_at
+    now = time.monotonic()
+    if keyring is None:
+        keyring = KeyRing.load(settings.JWT_KEYS_DIR, settings.JWT_ACTIVE_KID)
+        _checked_at = now
+    elif unknown_kid and now - _unknown_kid_checked_at >= UNKNOWN_KID_RELOAD_INTERVAL:
+        _unknown_kid_checked_at = now
+        keyring = keyring.reloaded(settings.JWT_ACTIVE_KID)
+    elif now - _checked_at >= settings.JWT_KEYS_RELOAD_SECONDS:
+        _checked_at = now
+        keyring = keyring.reloaded(settings.JWT_ACTIVE_KID)
+    return keyring
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+from typing import Callable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+REQUEST_LATENCY = Histogram(
+    'auth_http_request_duration_seconds',
+    'HTTP request latency',
+    ['method', 'route', 'status'],
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'auth_http_requests_in_flight',
+    'HTTP requests being handled',
+    multiprocess_mode='livesum',
+)
+
+CACHE_REQUESTS = Counter(
+    'auth_cache_requests_total',
+    'Cache lookups by cache and result',
+    ['cache', 'result'],
+)
+# дочерние метрики создаем заранее, чтобы не искать их по меткам на каждом запросе
+TOKEN_DENYLIST_HIT = CACHE_REQUESTS.labels('token_denylist', 'hit')
+TOKEN_DENYLIST_MISS = CACHE_REQUESTS.labels('token_denylist', 'miss')
+CLAIMS_LOCAL_HIT = CACHE_REQUESTS.labels('claims_local', 'hit')
+CLAIMS_LOCAL_MISS = CACHE_REQUESTS.labels('claims_local', 'miss')
+CLAIMS_REDIS_HIT = CACHE_REQUESTS.labels('claims_redis', 'hit')
+CLAIMS_REDIS_MISS = CACHE_REQUESTS.labels('claims_redis', 'miss')
+
+DB_POOL_SIZE = Gauge('auth_db_pool_size', 'Connections kept in the Postgres pool', multiprocess_mode='livesum')
+DB_POOL_CHECKED_OUT = Gauge(
+    'auth_db_pool_checked_out', 'Postgres connections in use', multiprocess_mode='livesum'
+)
+DB_POOL_OVERFLOW = Gauge(
+    'auth_db_pool_overflow', 'Postgres connections opened over the pool size', multiprocess_mode='livesum'
+)
+
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    'auth_password_hash_queue_depth',
+    'Password hashing tasks waiting for a free process',
+    multiprocess_mode='livesum',
+)
+PASSWORD_HASH_LATENCY = Histogram(
+    'auth_password_hash_duration_seconds',
+    'Password hashing latency including the wait in the queue',
+    ['operation', 'result'],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+PASSWORD_HASH_REJECTED = Counter(
+    'auth_password_hash_rejected_total',
+    'Password hashing tasks rejected with 429 because the queue was full',
+)
+
+EVENT_LOOP_LAG = Histogram(
+    'auth_event_loop_lag_seconds',
+    'Delay of a scheduled wake-up of the event loop',
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+)
+
+# число запросов к базе данных и время их выполнения в пределах одного HTTP запроса;
+# route - шаблон пути, чтобы число меток не зависело от идентификаторов в URL
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    'auth_db_statements_per_request',
+    'SQL statements executed while handling a request',
+    ['method', 'route'],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 50),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    'auth_db_time_per_request_seconds',
+    'Total time spent in SQL statements while handling a request',
+    ['method', 'route'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+DB_SLOWEST_STATEMENT = Histogram(
+    'auth_db_slowest_statement_seconds',
+    'Duration of the slowest SQL statement of a request',
+    ['method', 'route'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+)
+
+
+# MetricsMiddleware, monitor_event_loop и metrics_response одинаковы в auth_service и movie_service: каждый сервис собирается из своего
+# каталога src в отдельный образ, и общего пакета у них нет. Совпадение копий проверяет
+# auth_service/src/tests/unit/test_shared_code.py.
+class MetricsMiddleware:
+    """ASGI middleware: время ответа по шаблону пути и число обрабатываемых запросов."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # маршрут появляется в scope после сопоставления запроса с роутером
+            route = scope.get('route')
+            REQUEST_LATENCY.labels(
+                scope['method'], route.path if route else 'unmatched', status_code
+            ).observe(time.perf_counter() - started_at)
+
+
+async def monitor_event_loop(interval: float, sample: Callable[[], None] | None = None) -> None:
+    """Измеряет задержку пробуждения event loop и периодически снимает значения gauge метрик."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started_at = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - started_at - interval, 0))
+        if sample:
+            sample()
+
+
+def metrics_response() -> Response:
+    """
+    Метрики в формате Prometheus. Под gunicorn каталог PROMETHEUS_MULTIPROC_DIR задает
+    gunicorn.conf.py, и метрики собираются из файлов всех воркеров.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
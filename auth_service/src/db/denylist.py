@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Callable
+
+from .redis import RedisStorage
+
+
+DENYLIST_KEY_PREFIX = 'denylist:'
+DENYLIST_CHANNEL = 'denylist'
+
+
+def denylist_key(jti: str) -> str:
+    return f'{DENYLIST_KEY_PREFIX}{jti}'
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class TokenDenylist:
+    """
+    Локальная копия списка отозванных access токенов (jti -> exp).
+
+    При старте воркер подписывается на канал отзыва токенов и загружает текущий список из Redis,
+    дальше изменения приходят через pub/sub. Пока копия синхронизирована, проверка токена
+    выполняется без обращения к сети. Записи живут до истечения срока действия токена:
+    истекшие удаляются при каждом add по куче, упорядоченной по exp, поэтому размер списка
+    ограничен числом отзывов за время жизни access токена, даже если токен больше не проверяют.
+
+    Через ту же подписку воркер получает сообщения других каналов (см. subscribe),
+    например инвалидацию локального кеша claims.
+    """
+
+    def __init__(self, no_sql: RedisStorage, reconnect_delay: float = 1.0) -> None:
+        self.no_sql = no_sql
+        self.reconnect_delay = reconnect_delay
+        self.revoked: dict[str, float] = {}
+        self._expirations: list[tuple[float, str]] = []
+        self.synced = False
+        self._channels: dict[str, tuple[Callable[[str], None], Callable[[], None]]] = {}
+        self._task: asyncio.Task | None = None
+
+    def add(self, jti: str, exp: float) -> None:
+        self.revoked[jti] = exp
+        heapq.heappush(self._expirations, (exp, jti))
+        self.prune()
+
+    def contains(self, jti: str) -> bool:
+        exp = self.revoked.get(jti)
+        if exp is None:
+            return False
+        if exp < time.time():
+            del self.revoked[jti]
+            return False
+        return True
+
+    def prune(self) -> None:
+        now = time.time()
+        while self._expirations and self._expirations[0][0] < now:
+            exp, jti = heapq.heappop(self._expirations)
+            # запись могла быть уже удалена в contains или перезаписана с другим exp
+            if self.revoked.get(jti) == exp:
+                del self.revoked[jti]
+
+    async def revoke(self, jti: str, exp: int, expired_time: int) -> None:
+        """Записывает токен в Redis и оповещает остальные воркеры."""
+        await self.no_sql.set(denylist_key(jti), exp, expired_time)
+        await self.no_sql.publish(DENYLIST_CHANNEL, f'{jti}:{exp}')
+        self.add(jti, exp)
+
+    def subscribe(self, channel: str, on_message: Callable[[str], None], on_resync: Callable[[], None]) -> None:
+        """
+        Добавляет канал к подписке воркера; вызывается до start.
+        on_resync вызывается при каждой (пере)подписке: сообщения, отправленные без подписки, потеряны.
+        """
+        self._channels[channel] = (on_message, on_resync)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.synced = False
+
+    async def _load(self) -> None:
+        keys = [key async for key in self.no_sql.scan_keys(f'{DENYLIST_KEY_PREFIX}*')]
+        if not keys:
+            return
+        for key, exp in zip(keys, await self.no_sql.mget(keys)):
+            if exp is not None:
+                self.add(_decode(key).removeprefix(DENYLIST_KEY_PREFIX), float(exp))
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.no_sql.pubsub()
+            try:
+                # подписываемся до загрузки списка, чтобы не потерять отзывы, сделанные во время загрузки
+                await pubsub.subscribe(DENYLIST_CHANNEL, *self._channels)
+                for _, on_resync in self._channels.values():
+                    on_resync()
+                self.prune()
+                await self._load()
+                self.synced = True
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    channel = _decode(message['channel'])
+                    if channel in self._channels:
+                        self._channels[channel][0](_decode(message['data']))
+                        continue
+                    jti, exp = _decode(message['data']).rsplit(':', 1)
+                    self.add(jti, float(exp))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error('Token denylist subscription failed: %s', e)
+            finally:
+                # пока подписки нет, проверки уходят в Redis
+                self.synced = False
+                await pubsub.aclose()
+            await asyncio.sleep(self.reconnect_delay)
+
+
+token_denylist: TokenDenylist | None = None
+
+
+async def get_token_denylist() -> TokenDenylist:
+    return token_denylist
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from core.config import settings
+from db.postgres import engine
+from models.entity import UserLoginHistory
+
+
+LOGIN_HISTORY_TABLE = 'user_login_history'
+LOGIN_HISTORY_DEFAULT_PARTITION = f'{LOGIN_HISTORY_TABLE}_default'
+LOGIN_HISTORY_UNPARTITIONED_TABLE = f'{LOGIN_HISTORY_TABLE}_unpartitioned'
+LOGIN_HISTORY_COLUMNS = 'id, user_id, user_agent, login_at, logout_at'
+# произвольный ключ advisory lock, чтобы воркеры не создавали партиции одновременно
+PARTITIONS_LOCK_KEY = 7_301_001
+
+
+def add_months(month: date, months: int) -> date:
+	month_index = month.year * 12 + month.month - 1 + months
+	return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+	return f'{LOGIN_HISTORY_TABLE}_y{month.year:04d}m{month.month:02d}'
+
+
+def partition_month(name: str) -> date | None:
+	"""Возвращает месяц партиции по ее имени или None для партиций с другим именем."""
+	suffix = name.removeprefix(f'{LOGIN_HISTORY_TABLE}_')
+	if len(suffix) != 8 or suffix[0] != 'y' or suffix[5] != 'm':
+		return None
+	try:
+		return date(int(suffix[1:5]), int(suffix[6:8]), 1)
+	except ValueError:
+		return None
+
+
+async def is_partitioned(connection: AsyncConnection) -> bool:
+	result = await connection.execute(
+		text(
+			'SELECT 1 FROM pg_partitioned_table p '
+			'JOIN pg_class c ON c.oid = p.partrelid '
+			'WHERE c.relname = :table'
+		),
+		{'table': LOGIN_HISTORY_TABLE}
+	)
+	return result.scalar() is not None
+
+
+async def list_partitions(connection: AsyncConnection) -> list[str]:
+	result = await connection.execute(
+		text(
+			'SELECT child.relname FROM pg_inherits i '
+			'JOIN pg_class parent ON parent.oid = i.inhparent '
+			'JOIN pg_class child ON child.oid = i.inhrelid '
+			'WHERE parent.relname = :table ORDER BY child.relname'
+		),
+		{'table': LOGIN_HISTORY_TABLE}
+	)
+	return list(result.scalars())
+
+
+async def create_partitions(
+	connection: AsyncConnection,
+	months_ahead: int = settings.LOGIN_HISTORY_PARTITIONS_AHEAD,
+	since: date | None = None
+) -> list[str]:
+	"""
+	Создает партиции истории входов на текущий и следующие месяцы, а если задан since -
+	и на месяцы начиная с него. Строки этих месяцев, уже попавшие в DEFAULT, переносятся
+	в новые партиции. Возвращает имена созданных партиций.
+	"""
+	if not await is_partitioned(connection):
+		logging.warning(
+			'Table %s is not partitioned, skipping partition maintenance; '
+			'convert it with manager.py partition-login-history',
+			LOGIN_HISTORY_TABLE
+		)
+		return []
+
+	await connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': PARTITIONS_LOCK_KEY})
+	existing = set(await list_partitions(connection))
+	created = []
+
+	current_month = date.today().replace(day=1)
+	first_month = min(since.replace(day=1), current_month) if since else current_month
+	months = (current_month.year - first_month.year) * 12 + current_month.month - first_month.month
+	missing = [
+		month
+		for month in (add_months(current_month, offset) for offset in range(-months, months_ahead + 1))
+		if partition_name(month) not in existing
+	]
+
+	# после перерыва в обслуживании строки новых месяцев уже лежат в DEFAULT, и Postgres не создаст
+	# партицию поверх них: DEFAULT отсоединяется на время создания, а строки переносятся в новые партиции
+	rows_in_default = None
+	if missing and LOGIN_HISTORY_DEFAULT_PARTITION in existing:
+		rows_in_default = (
+			f'FROM {LOGIN_HISTORY_DEFAULT_PARTITION} '
+			f"WHERE login_at >= '{missing[0].isoformat()}' AND login_at < '{add_months(missing[-1], 1).isoformat()}'"
+		)
+		if (await connection.execute(text(f'SELECT EXISTS (SELECT 1 {rows_in_default})'))).scalar():
+			await connection.execute(text(
+				f'ALTER TABLE {LOGIN_HISTORY_TABLE} DETACH PARTITION {LOGIN_HISTORY_DEFAULT_PARTITION}'
+			))
+		else:
+			rows_in_default = None
+
+	for month in missing:
+		name = partition_name(month)
+		await connection.execute(text(
+			f'CREATE TABLE {name} PARTITION OF {LOGIN_HISTORY_TABLE} '
+			f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+		))
+		created.append(name)
+
+	if rows_in_default:
+		moved = (await connection.execute(text(
+			f'INSERT INTO {LOGIN_HISTORY_TABLE} ({LOGIN_HISTORY_COLUMNS}) '
+			f'SELECT {LOGIN_HISTORY_COLUMNS} {rows_in_default}'
+		))).rowcount
+		await connection.execute(text(f'DELETE {rows_in_default}'))
+		await connection.execute(text(
+			f'ALTER TABLE {LOGIN_HISTORY_TABLE} ATTACH PARTITION {LOGIN_HISTORY_DEFAULT_PARTITION} DEFAULT'
+		))
+		logging.info('Moved %s login history rows from %s to new partitions', moved, LOGIN_HISTORY_DEFAULT_PARTITION)
+
+	# строки вне созданных диапазонов не должны ронять вставку при входе
+	if LOGIN_HISTORY_DEFAULT_PARTITION not in existing:
+		await connection.execute(text(
+			f'CREATE TABLE {LOGIN_HISTORY_DEFAULT_PARTITION} PARTITION OF {LOGIN_HISTORY_TABLE} DEFAULT'
+		))
+		created.append(LOGIN_HISTORY_DEFAULT_PARTITION)
+	return created
+
+
+async def archive_partitions(
+	connection: AsyncConnection,
+	output_dir: Path,
+	retention_months: int = settings.LOGIN_HISTORY_RETENTION_MONTHS,
+	drop: bool = True
+) -> list[Path]:
+	"""
+	Отсоединяет партиции старше срока хранения, выгружает их в CSV и удаляет.
+	Из партиции DEFAULT выгружаются и удаляются только строки старше срока хранения:
+	сама она остается, чтобы принимать строки вне созданных диапазонов.
+	Возвращает пути к созданным файлам.
+	"""
+	await connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': PARTITIONS_LOCK_KEY})
+	oldest_kept = add_months(date.today().replace(day=1), -retention_months)
+	output_dir.mkdir(parents=True, exist_ok=True)
+	raw_connection = (await connection.get_raw_connection()).driver_connection
+
+	archived = []
+	for name in await list_partitions(connection):
+		month = partition_month(name)
+		if month is None or month >= oldest_kept:
+			continue
+
+		await connection.execute(text(f'ALTER TABLE {LOGIN_HISTORY_TABLE} DETACH PARTITION {name}'))
+		path = output_dir / f'{name}.csv'
+		await raw_connection.copy_from_table(name, output=str(path), format='csv', header=True)
+		if drop:
+			await connection.execute(text(f'DROP TABLE {name}'))
+		archived.append(path)
+
+	path = await archive_default_partition(connection, raw_connection, output_dir, oldest_kept, drop)
+	if path:
+		archived.append(path)
+	return archived
+
+
+async def archive_default_partition(
+	connection: AsyncConnection,
+	raw_connection,
+	output_dir: Path,
+	oldest_kept: date,
+	drop: bool
+) -> Path | None:
+	"""Выгружает строки партиции DEFAULT с login_at до oldest_kept и удаляет их из нее."""
+	if LOGIN_HISTORY_DEFAULT_PARTITION not in await list_partitions(connection):
+		return None
+	old_rows = f"FROM {LOGIN_HISTORY_DEFAULT_PARTITION} WHERE login_at < '{oldest_kept.isoformat()}'"
+	if not (await connection.execute(text(f'SELECT EXISTS (SELECT 1 {old_rows})'))).scalar():
+		return None
+
+	path = output_dir / f'{LOGIN_HISTORY_DEFAULT_PARTITION}_before_y{oldest_kept.year:04d}m{oldest_kept.month:02d}.csv'
+	await raw_connection.copy_from_query(f'SELECT * {old_rows}', output=str(path), format='csv', header=True)
+	if drop:
+		await connection.execute(text(f'DELETE {old_rows}'))
+	return path
+
+
+async def convert_to_partitioned(connection: AsyncConnection, keep_old: bool = False) -> int | None:
+	"""
+	Переводит существующую непартиционированную таблицу истории входов на партиции:
+	переименовывает ее, создает партиционированную таблицу с партициями на все месяцы данных,
+	копирует строки и удаляет старую таблицу (с keep_old - оставляет ее под именем
+	LOGIN_HISTORY_UNPARTITIONED_TABLE). Все выполняется в транзакции connection,
+	на время которой запись в историю блокируется. Возвращает число скопированных строк
+	или None, если таблица уже партиционирована или отсутствует.
+	"""
+	await connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': PARTITIONS_LOCK_KEY})
+	if await is_partitioned(connection):
+		return None
+	exists = (await connection.execute(text('SELECT to_regclass(:table)'), {'table': LOGIN_HISTORY_TABLE})).scalar()
+	if exists is None:
+		return None
+
+	await connection.execute(text(f'LOCK TABLE {LOGIN_HISTORY_TABLE} IN ACCESS EXCLUSIVE MODE'))
+	await connection.execute(text(f'ALTER TABLE {LOGIN_HISTORY_TABLE} RENAME TO {LOGIN_HISTORY_UNPARTITIONED_TABLE}'))
+	# имена индексов (в том числе первичного ключа) общие для схемы, новая таблица создаст такие же
+	indexes = await connection.execute(
+		text('SELECT indexname FROM pg_indexes WHERE tablename = :table'),
+		{'table': LOGIN_HISTORY_UNPARTITIONED_TABLE}
+	)
+	for index in list(indexes.scalars()):
+		await connection.execute(text(f'ALTER INDEX {index} RENAME TO {index}_unpartitioned'))
+
+	await connection.run_sync(UserLoginHistory.__table__.create)
+	since = (await connection.execute(text(f'SELECT min(login_at) FROM {LOGIN_HISTORY_UNPARTITIONED_TABLE}'))).scalar()
+	await create_partitions(connection, since=since.date() if since else None)
+	copied = (await connection.execute(text(
+		f'INSERT INTO {LOGIN_HISTORY_TABLE} ({LOGIN_HISTORY_COLUMNS}) '
+		f'SELECT {LOGIN_HISTORY_COLUMNS} FROM {LOGIN_HISTORY_UNPARTITIONED_TABLE}'
+	))).rowcount
+	if not keep_old:
+		await connection.execute(text(f'DROP TABLE {LOGIN_HISTORY_UNPARTITIONED_TABLE}'))
+	return copied
+
+
+async def ensure_partitions() -> None:
+	try:
+		async with engine.begin() as connection:
+			created = await create_partitions(connection)
+		if created:
+			logging.info('Created login history partitions: %s', ', '.join(created))
+	except Exception as e:
+		logging.error('Login history partition maintenance failed: %s', e)
+
+
+async def run_partition_maintenance(interval: float = settings.LOGIN_HISTORY_PARTITION_CHECK_SECONDS) -> None:
+	"""Периодически создает партиции на следующие месяцы, пока работает приложение."""
+	while True:
+		await ensure_partitions()
+		await asyncio.sleep(interval)
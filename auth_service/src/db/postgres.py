@@ -1,14 +1,29 @@
+import asyncio
+
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeMeta, declarative_base
 
+from core import metrics
 from core.config import settings
+from db.query_stats import instrument_engine
 
 dsn = (
 	f'{settings.POSTGRES_SCHEME}://{settings.POSTGRES_USER}:'
 	f'{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:'
 	f'{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}'
 )
-engine = create_async_engine(dsn, echo=True)
+engine = create_async_engine(
+	dsn,
+	echo=settings.POSTGRES_ECHO,
+	pool_size=settings.POSTGRES_POOL_SIZE,
+	max_overflow=settings.POSTGRES_MAX_OVERFLOW,
+	pool_timeout=settings.POSTGRES_POOL_TIMEOUT,
+	pool_recycle=settings.POSTGRES_POOL_RECYCLE,
+	pool_pre_ping=settings.POSTGRES_POOL_PRE_PING,
+	connect_args={'statement_cache_size': settings.POSTGRES_STATEMENT_CACHE_SIZE},
+)
+instrument_engine(engine)
 
 async_session = async_sessionmaker(
 	engine, class_=AsyncSession, expire_on_commit=False
@@ -20,3 +35,24 @@ Base: DeclarativeMeta = declarative_base()
 async def get_session() -> AsyncSession:
 	async with async_session() as session:
 		yield session
+
+
+async def warm_up_pool(connections: int = settings.POSTGRES_POOL_WARM_UP) -> None:
+	"""Заранее открывает соединения пула, чтобы первые запросы не ждали подключения к базе."""
+	async def _connect() -> None:
+		async with engine.connect() as connection:
+			await connection.execute(text('SELECT 1'))
+
+	connections = min(connections, settings.POSTGRES_POOL_SIZE)
+	await asyncio.gather(*(_connect() for _ in range(connections)))
+
+
+def sample_pool_metrics() -> None:
+	pool = engine.pool
+	metrics.DB_POOL_SIZE.set(pool.size())
+	metrics.DB_POOL_CHECKED_OUT.set(pool.checkedout())
+	metrics.DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+
+async def dispose_engine() -> None:
+	await engine.dispose()
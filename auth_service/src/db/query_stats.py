@@ -0,0 +1,45 @@
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+@dataclass
+class QueryStats:
+    """SQL запросы, выполненные в рамках одного HTTP запроса."""
+    count: int = 0
+    total_time: float = 0.0
+    slowest_time: float = 0.0
+    slowest_statement: str | None = None
+
+    def add(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.total_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+
+
+# устанавливается в middleware на время обработки запроса; вне запроса (фоновые задачи) - None
+current_query_stats: ContextVar[QueryStats | None] = ContextVar('current_query_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.add(statement, time.perf_counter() - context._query_started_at)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Подключает учет запросов к engine. Обработчики событий выполняются в greenlet
+    с контекстом вызывающей корутины, поэтому видят статистику текущего HTTP запроса.
+    """
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
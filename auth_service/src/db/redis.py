@@ -1,7 +1,19 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator
 
 from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+
+
+INCR_EXISTING_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+	return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return nil
+"""
 
 
 class INoSQLStorage(ABC):
@@ -13,6 +25,67 @@ class INoSQLStorage(ABC):
 	async def set(self, key: str, value: Any, expired_time: int) -> None:
 		pass
 
+	@abstractmethod
+	async def delete(self, *keys: str) -> None:
+		pass
+
+	@abstractmethod
+	async def incr_existing(self, key: str, amount: int) -> int | None:
+		pass
+
+
+class RotationResult(Enum):
+	ROTATED = 'rotated'
+	REUSED = 'reused'
+	NOT_FOUND = 'not_found'
+
+
+@dataclass
+class SessionRecord:
+	"""Открытая refresh сессия пользователя."""
+	user_id: str
+	user_agent: str
+	refresh_jti: str
+	expired_at: datetime
+
+
+@dataclass
+class DeviceState:
+	"""Состояние refresh сессий пользователя на одном устройстве."""
+	has_active: bool
+	has_expired: bool
+	has_valid: bool
+
+
+class ISessionStorage(ABC):
+	"""Хранилище активных refresh сессий."""
+
+	@abstractmethod
+	async def get_device_state(self, user_id: str, user_agent: str) -> DeviceState:
+		pass
+
+	@abstractmethod
+	async def open(self, record: SessionRecord, close_device: bool = False, close_all: bool = False) -> bool:
+		"""Закрывает сессии устройства или все сессии пользователя и открывает новую."""
+		pass
+
+	@abstractmethod
+	async def rotate(self, refresh_jti: str, record: SessionRecord) -> RotationResult:
+		"""Заменяет сессию refresh токена refresh_jti на новую."""
+		pass
+
+	@abstractmethod
+	async def close_device(self, user_id: str, user_agent: str) -> None:
+		pass
+
+	@abstractmethod
+	async def close_all(self, user_id: str) -> None:
+		pass
+
+	@abstractmethod
+	async def count(self, user_id: str) -> int:
+		pass
+
 
 class RedisStorage(INoSQLStorage):
 	def __init__(self, **kwargs) -> None:
@@ -26,3 +99,46 @@ class RedisStorage(INoSQLStorage):
 
 	async def set(self, key: str, value: Any, expired_time: int) -> None:
 		await self.connection.set(key, value, expired_time)
+
+	async def delete(self, *keys: str) -> None:
+		if keys:
+			await self.connection.delete(*keys)
+
+	async def incr_existing(self, key: str, amount: int) -> int | None:
+		"""Изменяет счетчик, только если он уже есть, сохраняя его TTL."""
+		return await self.connection.eval(INCR_EXISTING_SCRIPT, 1, key, amount)
+
+	async def eval(self, script: str, keys: list[str], args: list[Any]) -> Any:
+		return await self.connection.eval(script, len(keys), *keys, *args)
+
+	async def hgetall(self, key: str) -> dict[str, str]:
+		return await self.connection.hgetall(key)
+
+	async def hlen(self, key: str) -> int:
+		return await self.connection.hlen(key)
+
+	async def hset_many(self, key: str, mapping: dict[str, str], expired_time: int) -> None:
+		async with self.connection.pipeline(transaction=True) as pipe:
+			pipe.hset(key, mapping=mapping)
+			pipe.expire(key, expired_time)
+			await pipe.execute()
+
+	async def mget(self, keys: list[str]) -> list[str | None]:
+		return await self.connection.mget(keys)
+
+	async def scan_keys(self, match: str) -> AsyncIterator[str]:
+		async for key in self.connection.scan_iter(match=match, count=1000):
+			yield key
+
+	async def xrange(self, stream: str, count: int) -> list[tuple[str, dict[str, str]]]:
+		return await self.connection.xrange(stream, count=count)
+
+	async def xdel(self, stream: str, *ids: str) -> None:
+		if ids:
+			await self.connection.xdel(stream, *ids)
+
+	async def publish(self, channel: str, message: str) -> None:
+		await self.connection.publish(channel, message)
+
+	def pubsub(self) -> PubSub:
+		return self.connection.pubsub()
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import groupby
+from typing import Callable
+
+from redis.exceptions import RedisError
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.entity import RefreshSession
+from .redis import RedisStorage, SessionRecord
+
+
+# события изменения refresh сессий, которые RedisSessionStorage добавляет в поток
+# в том же Lua скрипте, что и изменение хеша сессий
+SESSION_EVENTS_STREAM = 'refresh_sessions:events'
+SESSION_WRITER_LEASE_KEY = 'refresh_sessions:writer'
+
+ACQUIRE_LEASE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass
+class SessionsClosed:
+    """Закрытие сессий пользователя: одной по jti, всех на устройстве или всех сразу."""
+    user_id: str
+    user_agent: str | None = None
+    refresh_jti: str | None = None
+    rotated_at: datetime | None = None
+
+
+SessionEvent = SessionRecord | SessionsClosed
+
+
+def encode_opened(record: SessionRecord) -> str:
+    return json.dumps({
+        'op': 'open',
+        'user_id': record.user_id,
+        'user_agent': record.user_agent,
+        'refresh_jti': record.refresh_jti,
+        'expired_at': record.expired_at.timestamp(),
+    })
+
+
+def encode_closed(
+        user_id: str,
+        user_agent: str | None = None,
+        refresh_jti: str | None = None,
+        rotated: bool = False
+) -> str:
+    return json.dumps({
+        'op': 'close',
+        'user_id': user_id,
+        'user_agent': user_agent,
+        'refresh_jti': refresh_jti,
+        'rotated_at': datetime.now().timestamp() if rotated else None,
+    })
+
+
+def decode_event(data: str) -> SessionEvent:
+    event = json.loads(data)
+    if event['op'] == 'open':
+        return SessionRecord(
+            user_id=event['user_id'],
+            user_agent=event['user_agent'],
+            refresh_jti=event['refresh_jti'],
+            expired_at=datetime.fromtimestamp(event['expired_at']),
+        )
+    if event['op'] == 'close':
+        rotated_at = event['rotated_at']
+        return SessionsClosed(
+            user_id=event['user_id'],
+            user_agent=event['user_agent'],
+            refresh_jti=event['refresh_jti'],
+            rotated_at=datetime.fromtimestamp(rotated_at) if rotated_at is not None else None,
+        )
+    raise ValueError(f'Unknown session event {event["op"]}')
+
+
+_refresh_sessions = RefreshSession.__table__
+
+CLOSE_ALL_STMT = update(_refresh_sessions).where(
+    _refresh_sessions.c.user_id == bindparam('b_user_id'),
+    _refresh_sessions.c.is_active.is_(True),
+).values(is_active=False)
+
+CLOSE_DEVICE_STMT = CLOSE_ALL_STMT.where(_refresh_sessions.c.user_agent == bindparam('b_user_agent'))
+
+CLOSE_SESSION_STMT = update(_refresh_sessions).where(
+    _refresh_sessions.c.user_id == bindparam('b_user_id'),
+    _refresh_sessions.c.refresh_jti == bindparam('b_refresh_jti'),
+    _refresh_sessions.c.is_active.is_(True),
+).values(is_active=False, rotated_at=bindparam('b_rotated_at'))
+
+
+async def write_opened_sessions(session: AsyncSession, events: list[SessionRecord]) -> None:
+    # повторная запись после сбоя до удаления событий из потока не создает дублей
+    await session.execute(pg_insert(_refresh_sessions).values([
+        {
+            'user_id': e.user_id,
+            'refresh_jti': e.refresh_jti,
+            'user_agent': e.user_agent,
+            'expired_at': e.expired_at,
+            'is_active': True,
+        }
+        for e in events
+    ]).on_conflict_do_nothing(index_elements=['refresh_jti']))
+
+
+async def write_closed_sessions(session: AsyncSession, events: list[SessionsClosed]) -> None:
+    """
+    Закрытия только снимают is_active, поэтому их порядок внутри серии не важен:
+    закрытия каждого вида выполняются одним executemany.
+    """
+    by_session = [e for e in events if e.refresh_jti is not None]
+    by_device = [e for e in events if e.refresh_jti is None and e.user_agent is not None]
+    by_user = [e for e in events if e.refresh_jti is None and e.user_agent is None]
+    if by_session:
+        await session.execute(CLOSE_SESSION_STMT, [
+            {'b_user_id': e.user_id, 'b_refresh_jti': e.refresh_jti, 'b_rotated_at': e.rotated_at}
+            for e in by_session
+        ])
+    if by_device:
+        await session.execute(CLOSE_DEVICE_STMT, [
+            {'b_user_id': e.user_id, 'b_user_agent': e.user_agent}
+            for e in by_device
+        ])
+    if by_user:
+        await session.execute(CLOSE_ALL_STMT, [{'b_user_id': e.user_id} for e in by_user])
+
+
+WRITERS = {
+    SessionRecord: write_opened_sessions,
+    SessionsClosed: write_closed_sessions,
+}
+
+
+class SessionOutboxWriter:
+    """
+    Переносит события refresh сессий из потока Redis в таблицу refresh_sessions.
+
+    События удаляются из потока только после коммита в Postgres, при ошибке пачка
+    повторяется через retry_interval секунд, поэтому закрытия сессий не теряются.
+    Поток читает один воркер, держащий аренду в Redis: так события применяются в порядке
+    их появления, и закрытие сессии не может обогнать ее открытие.
+    """
+
+    def __init__(
+            self,
+            no_sql: RedisStorage,
+            session_factory: Callable[[], AsyncSession],
+            batch_size: int,
+            poll_interval: float,
+            retry_interval: float,
+            lease_seconds: float,
+    ) -> None:
+        self.no_sql = no_sql
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.lease_ms = int(lease_seconds * 1000)
+        self.token = uuid.uuid4().hex
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает запись; непримененные события остаются в потоке до следующего запуска."""
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        try:
+            await self.no_sql.eval(RELEASE_LEASE_SCRIPT, [SESSION_WRITER_LEASE_KEY], [self.token])
+        except RedisError as e:
+            logging.error('Failed to release session writer lease: %s', e)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self.acquire_lease() and await self.flush() == self.batch_size:
+                    continue
+                await asyncio.sleep(self.poll_interval)
+            except (RedisError, SQLAlchemyError) as e:
+                logging.error('Failed to write refresh session events, retrying in %s s: %s', self.retry_interval, e)
+                await asyncio.sleep(self.retry_interval)
+
+    async def acquire_lease(self) -> bool:
+        return bool(await self.no_sql.eval(
+            ACQUIRE_LEASE_SCRIPT, [SESSION_WRITER_LEASE_KEY], [self.token, self.lease_ms]
+        ))
+
+    async def flush(self) -> int:
+        """Записывает одну пачку событий из начала потока и возвращает ее размер."""
+        entries = await self.no_sql.xrange(SESSION_EVENTS_STREAM, self.batch_size)
+        if not entries:
+            return 0
+        events = []
+        for entry_id, fields in entries:
+            try:
+                events.append(decode_event(fields['event']))
+            except (KeyError, TypeError, ValueError) as e:
+                logging.error('Skipping malformed refresh session event %s: %s', entry_id, e)
+
+        async with self.session_factory() as session:
+            # подряд идущие события одного типа пишем одним запросом, порядок серий сохраняется
+            for event_type, series in groupby(events, key=type):
+                await WRITERS[event_type](session, list(series))
+            await session.commit()
+        await self.no_sql.xdel(SESSION_EVENTS_STREAM, *[entry_id for entry_id, _ in entries])
+        return len(entries)
+
+    async def drain(self, timeout: float) -> None:
+        """Дожидается аренды и записывает все накопленные события, например перед восстановлением сессий."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not await self.acquire_lease():
+            if loop.time() >= deadline:
+                raise TimeoutError('Session writer lease is held by another process')
+            await asyncio.sleep(self.poll_interval)
+        try:
+            while await self.flush() == self.batch_size:
+                await self.acquire_lease()
+        finally:
+            await self.no_sql.eval(RELEASE_LEASE_SCRIPT, [SESSION_WRITER_LEASE_KEY], [self.token])
+
+
+session_writer: SessionOutboxWriter | None = None
@@ -0,0 +1,354 @@
+import json
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.entity import RefreshSession, User
+from .redis import DeviceState, ISessionStorage, RedisStorage, RotationResult, SessionRecord
+from .session_outbox import SESSION_EVENTS_STREAM, encode_closed, encode_opened
+from .storage import SessionCounter
+
+
+def to_refresh_session(record: SessionRecord) -> RefreshSession:
+    return RefreshSession(
+        user_id=record.user_id,
+        refresh_jti=record.refresh_jti,
+        user_agent=record.user_agent,
+        expired_at=record.expired_at,
+        is_active=True,
+    )
+
+
+class PostgresSessionStorage(ISessionStorage):
+    """Сессии в таблице refresh_sessions, число сессий пользователя - в счетчике Redis."""
+
+    def __init__(self, db: AsyncSession, session_counter: SessionCounter) -> None:
+        self.db = db
+        self.session_counter = session_counter
+
+    @staticmethod
+    def device_state_columns(user_agent: str, user_id_column=User.id) -> tuple:
+        """Выражения для состояния сессий устройства, чтобы получить его в одном запросе с пользователем."""
+        now = datetime.now().replace(microsecond=0)
+        on_device = (
+            RefreshSession.user_id == user_id_column,
+            RefreshSession.user_agent == user_agent,
+            RefreshSession.is_active.is_(True),
+        )
+        return (
+            exists().where(*on_device).label('has_active'),
+            exists().where(*on_device, RefreshSession.expired_at < now).label('has_expired'),
+            exists().where(*on_device, RefreshSession.expired_at >= now).label('has_valid'),
+        )
+
+    async def get_device_state(self, user_id: str, user_agent: str) -> DeviceState:
+        row = (await self.db.execute(
+            select(*self.device_state_columns(user_agent, user_id))
+        )).one()
+        return DeviceState(row.has_active, row.has_expired, row.has_valid)
+
+    async def open(self, record: SessionRecord, close_device: bool = False, close_all: bool = False) -> bool:
+        """Одной транзакцией закрывает устаревшие сессии и записывает новую."""
+        closed_sessions = 0
+        try:
+            if close_device:
+                result = await self.db.execute(
+                    update(RefreshSession).
+                    values(is_active=False).
+                    where(
+                        RefreshSession.user_id == record.user_id,
+                        RefreshSession.user_agent == record.user_agent,
+                        RefreshSession.is_active.is_(True),
+                    )
+                )
+                closed_sessions = result.rowcount
+            if close_all:
+                await self.db.execute(
+                    update(RefreshSession).where(RefreshSession.user_id == record.user_id).values(is_active=False),
+                )
+            self.db.add(to_refresh_session(record))
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            await self.db.rollback()
+            return False
+
+        if close_all:
+            await self.session_counter.set(record.user_id, 1)
+        else:
+            await self.session_counter.add(record.user_id, 1 - closed_sessions)
+        return True
+
+    async def rotate(self, refresh_jti: str, record: SessionRecord) -> RotationResult:
+        """
+        Одной транзакцией закрывает сессию предъявленного refresh токена и записывает новую.
+        Если токен уже был заменен ранее, считает это повторным использованием
+        украденного токена и закрывает все сессии пользователя.
+        """
+        try:
+            rotated = (await self.db.execute(
+                update(RefreshSession).
+                values(is_active=False, rotated_at=datetime.now()).
+                where(
+                    RefreshSession.refresh_jti == refresh_jti,
+                    RefreshSession.user_id == record.user_id,
+                    RefreshSession.user_agent == record.user_agent,
+                    RefreshSession.is_active.is_(True),
+                ).
+                returning(RefreshSession.id)
+            )).scalar()
+            if rotated:
+                self.db.add(to_refresh_session(record))
+                await self.db.commit()
+                return RotationResult.ROTATED
+
+            reused = (await self.db.execute(
+                select(RefreshSession.rotated_at.is_not(None)).
+                where(RefreshSession.refresh_jti == refresh_jti)
+            )).scalar()
+            if not reused:
+                await self.db.rollback()
+                return RotationResult.NOT_FOUND
+
+            await self.db.execute(
+                update(RefreshSession).
+                where(RefreshSession.user_id == record.user_id, RefreshSession.is_active.is_(True)).
+                values(is_active=False)
+            )
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            await self.db.rollback()
+            return RotationResult.NOT_FOUND
+
+        await self.session_counter.set(record.user_id, 0)
+        return RotationResult.REUSED
+
+    async def close_device(self, user_id: str, user_agent: str) -> None:
+        try:
+            result = await self.db.execute(
+                update(RefreshSession).
+                values(is_active=False).
+                where(
+                    RefreshSession.user_id == user_id,
+                    RefreshSession.user_agent == user_agent,
+                    RefreshSession.is_active.is_(True),
+                )
+            )
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            await self.db.rollback()
+            return
+
+        await self.session_counter.add(user_id, -result.rowcount)
+
+    async def close_all(self, user_id: str) -> None:
+        try:
+            await self.db.execute(
+                update(RefreshSession).where(RefreshSession.user_id == user_id).values(is_active=False),
+            )
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            await self.db.rollback()
+            return
+
+        await self.session_counter.set(user_id, 0)
+
+    async def count(self, user_id: str) -> int:
+        """Возвращает число открытых сессий пользователя из счетчика в Redis, при промахе - из Postgres."""
+        count = await self.session_counter.get(user_id)
+        if count is not None:
+            return count
+
+        try:
+            result = await self.db.execute(
+                select(func.count()).
+                select_from(RefreshSession).
+                where(
+                    RefreshSession.user_id == user_id,
+                    RefreshSession.is_active.is_(True),
+                )
+            )
+            count = result.scalar()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            return 0
+
+        await self.session_counter.set(user_id, count)
+        return count
+
+
+OPEN_SESSION_SCRIPT = """
+local closed = 0
+if ARGV[6] == '1' then
+    closed = redis.call('HLEN', KEYS[1])
+    redis.call('DEL', KEYS[1])
+elseif ARGV[5] == '1' then
+    local sessions = redis.call('HGETALL', KEYS[1])
+    for i = 1, #sessions, 2 do
+        if cjson.decode(sessions[i + 1])['user_agent'] == ARGV[4] then
+            redis.call('HDEL', KEYS[1], sessions[i])
+            closed = closed + 1
+        end
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if redis.call('TTL', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+if ARGV[7] ~= '' then
+    redis.call('XADD', KEYS[2], '*', 'event', ARGV[7])
+end
+redis.call('XADD', KEYS[2], '*', 'event', ARGV[8])
+return closed
+"""
+
+ROTATE_SESSION_SCRIPT = """
+local session = redis.call('HGET', KEYS[1], ARGV[1])
+if session and cjson.decode(session)['user_agent'] == ARGV[2] then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('HSET', KEYS[1], ARGV[3], ARGV[4])
+    if redis.call('TTL', KEYS[1]) < tonumber(ARGV[5]) then
+        redis.call('EXPIRE', KEYS[1], ARGV[5])
+    end
+    if tonumber(ARGV[6]) > 0 then
+        redis.call('SET', KEYS[2], '1', 'EX', ARGV[6])
+    end
+    redis.call('XADD', KEYS[3], '*', 'event', ARGV[7])
+    redis.call('XADD', KEYS[3], '*', 'event', ARGV[8])
+    return 1
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('DEL', KEYS[1])
+    redis.call('XADD', KEYS[3], '*', 'event', ARGV[9])
+    return 2
+end
+return 0
+"""
+
+CLOSE_DEVICE_SCRIPT = """
+local closed = 0
+local sessions = redis.call('HGETALL', KEYS[1])
+for i = 1, #sessions, 2 do
+    if cjson.decode(sessions[i + 1])['user_agent'] == ARGV[1] then
+        redis.call('HDEL', KEYS[1], sessions[i])
+        closed = closed + 1
+    end
+end
+redis.call('XADD', KEYS[2], '*', 'event', ARGV[2])
+return closed
+"""
+
+CLOSE_ALL_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('XADD', KEYS[2], '*', 'event', ARGV[1])
+"""
+
+
+class RedisSessionStorage(ISessionStorage):
+    """
+    Активные сессии в хеше Redis `refresh_sessions:{user_id}` (jti -> устройство и срок действия).
+
+    Запросы к Postgres не выполняются: каждое изменение тем же скриптом добавляется в поток
+    SESSION_EVENTS_STREAM, откуда SessionOutboxWriter переносит его в refresh_sessions.
+    Из таблицы сессии можно восстановить командой manager.py restore-refresh-sessions.
+    """
+
+    def __init__(self, no_sql: RedisStorage, expired_time: int) -> None:
+        self.no_sql = no_sql
+        self.expired_time = expired_time
+
+    @staticmethod
+    def key(user_id: str) -> str:
+        return f'refresh_sessions:{user_id}'
+
+    @staticmethod
+    def rotated_key(refresh_jti: str) -> str:
+        return f'refresh_rotated:{refresh_jti}'
+
+    @staticmethod
+    def dump(record: SessionRecord) -> str:
+        return json.dumps({'user_agent': record.user_agent, 'exp': record.expired_at.timestamp()})
+
+    async def get_device_state(self, user_id: str, user_agent: str) -> DeviceState:
+        now = time.time()
+        sessions = [json.loads(value) for value in (await self.no_sql.hgetall(self.key(user_id))).values()]
+        expires = [session['exp'] for session in sessions if session['user_agent'] == user_agent]
+        return DeviceState(
+            has_active=bool(expires),
+            has_expired=any(exp < now for exp in expires),
+            has_valid=any(exp >= now for exp in expires),
+        )
+
+    async def open(self, record: SessionRecord, close_device: bool = False, close_all: bool = False) -> bool:
+        if close_all:
+            close_event = encode_closed(record.user_id)
+        elif close_device:
+            close_event = encode_closed(record.user_id, user_agent=record.user_agent)
+        else:
+            close_event = ''
+        await self.no_sql.eval(
+            OPEN_SESSION_SCRIPT,
+            [self.key(record.user_id), SESSION_EVENTS_STREAM],
+            [
+                record.refresh_jti,
+                self.dump(record),
+                self.expired_time,
+                record.user_agent,
+                int(close_device),
+                int(close_all),
+                close_event,
+                encode_opened(record),
+            ]
+        )
+        return True
+
+    async def rotate(self, refresh_jti: str, record: SessionRecord) -> RotationResult:
+        result = await self.no_sql.eval(
+            ROTATE_SESSION_SCRIPT,
+            [self.key(record.user_id), self.rotated_key(refresh_jti), SESSION_EVENTS_STREAM],
+            [
+                refresh_jti,
+                record.user_agent,
+                record.refresh_jti,
+                self.dump(record),
+                self.expired_time,
+                # отметка о замене нужна, пока старый токен не истек
+                self.expired_time,
+                encode_closed(record.user_id, refresh_jti=refresh_jti, rotated=True),
+                encode_opened(record),
+                encode_closed(record.user_id),
+            ]
+        )
+        if result == 1:
+            return RotationResult.ROTATED
+        if result == 2:
+            return RotationResult.REUSED
+        return RotationResult.NOT_FOUND
+
+    async def close_device(self, user_id: str, user_agent: str) -> None:
+        await self.no_sql.eval(
+            CLOSE_DEVICE_SCRIPT,
+            [self.key(user_id), SESSION_EVENTS_STREAM],
+            [user_agent, encode_closed(user_id, user_agent=user_agent)]
+        )
+
+    async def close_all(self, user_id: str) -> None:
+        await self.no_sql.eval(CLOSE_ALL_SCRIPT, [self.key(user_id), SESSION_EVENTS_STREAM], [encode_closed(user_id)])
+
+    async def count(self, user_id: str) -> int:
+        return await self.no_sql.hlen(self.key(user_id))
+
+    async def restore(self, records: list[SessionRecord]) -> None:
+        """Записывает сессии, загруженные из Postgres, без событий для фоновой записи."""
+        by_user: dict[str, dict[str, str]] = {}
+        for record in records:
+            by_user.setdefault(record.user_id, {})[record.refresh_jti] = self.dump(record)
+        for user_id, sessions in by_user.items():
+            await self.no_sql.hset_many(self.key(user_id), sessions, self.expired_time)
@@ -1,32 +1,48 @@
+import json
 import logging
 from datetime import datetime
+from typing import Iterable
 
 from async_fastapi_jwt_auth import AuthJWT
 from datetime import timedelta
 from http import HTTPStatus
 from fastapi import HTTPException
 
+from .denylist import TokenDenylist, denylist_key
+from .lru import LRUCache
 from .redis import RedisStorage, INoSQLStorage
-from core.config import JWTSettings
+from core import metrics
+from core.config import JWTSettings, settings
 from async_fastapi_jwt_auth import AuthJWT
 
 
 nosql_storage: RedisStorage | None = None
 
+claims_local_cache = LRUCache(
+    maxsize=settings.CLAIMS_LOCAL_CACHE_SIZE,
+    ttl=settings.CLAIMS_LOCAL_CACHE_TTL
+)
+
 
 async def get_nosql_storage() -> RedisStorage:
     return nosql_storage
 
 
 class TokenHandler:
-    def __init__(self, no_sql: INoSQLStorage, expired_time: int) -> None:
+    def __init__(self, no_sql: INoSQLStorage, expired_time: int, denylist: TokenDenylist | None = None) -> None:
         self.no_sql = no_sql
         self.expired_time = expired_time
+        self.denylist = denylist
 
     # @AuthJWT.token_in_denylist_loader
     async def _check_if_token_in_denylist(self, decrypted_token) -> bool:
         jti = decrypted_token["jti"]
-        if await self.no_sql.get(jti):
+        # локальная копия списка актуальна, пока воркер подписан на изменения
+        if self.denylist and self.denylist.synced:
+            metrics.TOKEN_DENYLIST_HIT.inc()
+            return self.denylist.contains(jti)
+        metrics.TOKEN_DENYLIST_MISS.inc()
+        if await self.no_sql.get(denylist_key(jti)):
             return True
         return False
 
@@ -42,4 +58,142 @@ class TokenHandler:
         exp = decrypted_token['exp']
         # рассчитываем оставшееся время жизни токена (потом можно удалить, тк он просто не пройдет проверку)
         access_expires = exp - int(datetime.now().timestamp())
-        await self.no_sql.set(jti, 'invalid', access_expires)
+        if access_expires <= 0:
+            return
+        if self.denylist:
+            await self.denylist.revoke(jti, exp, access_expires)
+        else:
+            await self.no_sql.set(denylist_key(jti), exp, access_expires)
+
+
+CLAIMS_CHANNEL = 'claims_invalidation'
+
+PUT_CLAIMS_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+INVALIDATE_CLAIMS_SCRIPT = """
+for i = 1, #KEYS, 2 do
+    redis.call('DEL', KEYS[i])
+    redis.call('INCR', KEYS[i + 1])
+    redis.call('EXPIRE', KEYS[i + 1], ARGV[1])
+end
+"""
+
+
+class ClaimsHandler:
+    """
+    Кеш claim groups_permissions пользователей: локальный LRU перед Redis.
+
+    Инвалидация увеличивает поколение claims пользователя и рассылается воркерам через CLAIMS_CHANNEL.
+    Claims, собранные из базы, записываются, только если поколение не изменилось с начала загрузки,
+    поэтому загрузка, начатая до изменения прав, не перезапишет инвалидацию устаревшими данными.
+    """
+
+    def __init__(self, no_sql: RedisStorage, local_cache: LRUCache, expired_time: int) -> None:
+        self.no_sql = no_sql
+        self.local_cache = local_cache
+        self.expired_time = expired_time
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f'claims:{user_id}'
+
+    @staticmethod
+    def _generation_key(user_id: str) -> str:
+        return f'claims_generation:{user_id}'
+
+    async def get_claims(self, user_id: str) -> list[dict] | None:
+        """Возвращает закешированный claim пользователя или None, если его нет в кеше."""
+        claims = self.local_cache.get(user_id)
+        if claims is not None:
+            metrics.CLAIMS_LOCAL_HIT.inc()
+            return claims
+        metrics.CLAIMS_LOCAL_MISS.inc()
+
+        data = await self.no_sql.get(self._key(user_id))
+        if data is None:
+            metrics.CLAIMS_REDIS_MISS.inc()
+            return None
+        metrics.CLAIMS_REDIS_HIT.inc()
+
+        claims = json.loads(data)
+        self.local_cache.set(user_id, claims)
+        return claims
+
+    async def get_generation(self, user_id: str) -> str:
+        """Поколение claims пользователя; читается до загрузки claims из базы и передается в put_claims."""
+        return await self.no_sql.get(self._generation_key(user_id)) or '0'
+
+    async def put_claims(self, user_id: str, claims: list[dict], generation: str) -> bool:
+        """Записывает claims, если с чтения generation они не инвалидировались."""
+        # локальная копия пишется до Redis: инвалидация, пришедшая во время записи, ее удалит
+        self.local_cache.set(user_id, claims)
+        stored = await self.no_sql.eval(
+            PUT_CLAIMS_SCRIPT,
+            [self._key(user_id), self._generation_key(user_id)],
+            [generation, json.dumps(claims), self.expired_time]
+        )
+        if not stored:
+            self.local_cache.delete(user_id)
+        return bool(stored)
+
+    async def invalidate(self, user_ids: Iterable[str]) -> None:
+        """Удаляет claim пользователей, чьи группы или права были изменены, во всех воркерах."""
+        user_ids = [str(user_id) for user_id in user_ids]
+        if not user_ids:
+            return
+        self.drop_local(user_ids)
+        keys = []
+        for user_id in user_ids:
+            keys += [self._key(user_id), self._generation_key(user_id)]
+        await self.no_sql.eval(INVALIDATE_CLAIMS_SCRIPT, keys, [self.expired_time])
+        await self.no_sql.publish(CLAIMS_CHANNEL, ','.join(user_ids))
+
+    def drop_local(self, user_ids: Iterable[str]) -> None:
+        for user_id in user_ids:
+            self.local_cache.delete(user_id)
+
+    def on_invalidation_message(self, message: str) -> None:
+        self.drop_local(message.split(','))
+
+
+class SessionCounter:
+    """
+    Счетчик активных refresh сессий пользователя в Redis.
+    Ключ живет reconcile_interval секунд, после чего значение пересчитывается из Postgres.
+    """
+
+    def __init__(self, no_sql: INoSQLStorage, reconcile_interval: int) -> None:
+        self.no_sql = no_sql
+        self.reconcile_interval = reconcile_interval
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f'sessions_count:{user_id}'
+
+    async def get(self, user_id: str) -> int | None:
+        value = await self.no_sql.get(self._key(user_id))
+        return int(value) if value is not None else None
+
+    async def set(self, user_id: str, value: int) -> None:
+        await self.no_sql.set(self._key(user_id), value, self.reconcile_interval)
+
+    async def add(self, user_id: str, amount: int) -> None:
+        # если счетчика нет, он будет посчитан из Postgres при следующем чтении
+        if amount:
+            await self.no_sql.incr_existing(self._key(user_id), amount)
+
+
+def subscribe_claims_invalidation(denylist: TokenDenylist) -> None:
+    """Подписывает воркер на инвалидацию claims; пока подписки не было, локальные копии могли устареть."""
+    claims_handler = ClaimsHandler(nosql_storage, claims_local_cache, settings.CLAIMS_CACHE_EXPIRE_IN_SECONDS)
+    denylist.subscribe(CLAIMS_CHANNEL, claims_handler.on_invalidation_message, claims_local_cache.clear)
+
+
+async def get_claims_handler() -> ClaimsHandler:
+    return ClaimsHandler(nosql_storage, claims_local_cache, settings.CLAIMS_CACHE_EXPIRE_IN_SECONDS)
@@ -3,4 +3,6 @@
 alembic revision --autogenerate -m "Init database"
 alembic upgrade head
 
-gunicorn main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
+python manager.py ensure-jwt-key
+
+gunicorn main:app --config gunicorn.conf.py --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
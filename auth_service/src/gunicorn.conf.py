@@ -0,0 +1,20 @@
+import os
+import shutil
+
+
+# каталог задается до импорта приложения воркерами: prometheus_client выбирает
+# режим нескольких процессов при создании первой метрики
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+
+def on_starting(server) -> None:
+    """Удаляет файлы метрик прошлого запуска: иначе счетчики продолжат значения мертвых процессов."""
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def child_exit(server, worker) -> None:
+    """Перестает учитывать gauge livesum завершившегося воркера."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,47 +1,87 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 import uvicorn
 from async_fastapi_jwt_auth.exceptions import AuthJWTException
 from fastapi import FastAPI
 from fastapi import Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from starlette.middleware.sessions import SessionMiddleware
 from opentelemetry import trace
-from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
 
+from api import metrics as metrics_api, well_known
 from api.v1 import users, groups, permissions
+from core import metrics
 from core.config import settings
-from db import storage
+from core.keyring import get_keyring
+from core.tracer import configure_tracer
+from db import denylist, session_outbox, storage
+from db.denylist import TokenDenylist
+from db.partitions import ensure_partitions, run_partition_maintenance
+from db.postgres import async_session, warm_up_pool, dispose_engine, sample_pool_metrics
+from db.query_stats import QueryStats, current_query_stats
 from db.redis import RedisStorage
+from db.session_outbox import SessionOutboxWriter
+from services import audit, hasher
+from services.audit import AuditWriter
+from services.hasher import PasswordHasher
+
+
+METRICS_PATH = '/metrics'
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # ключи подписи загружаем при старте, чтобы отсутствие ключей не обнаружилось на первом входе
+    get_keyring()
     storage.nosql_storage = RedisStorage(
         host=settings.REDIS_HOST,
         port=settings.REDIS_PORT,
         db=0,
         decode_responses=True
     )
+    hasher.password_hasher = PasswordHasher(
+        max_workers=settings.PASSWORD_HASH_WORKERS,
+        max_queue_size=settings.PASSWORD_HASH_QUEUE_SIZE
+    )
+    denylist.token_denylist = TokenDenylist(storage.nosql_storage)
+    storage.subscribe_claims_invalidation(denylist.token_denylist)
+    await denylist.token_denylist.start()
+    await warm_up_pool()
+    audit.audit_writer = AuditWriter(
+        async_session,
+        batch_size=settings.AUDIT_BATCH_SIZE,
+        flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+        max_queue_size=settings.AUDIT_QUEUE_SIZE
+    )
+    await audit.audit_writer.start()
+    # события сессий остаются в потоке Redis, пока не записаны, поэтому писатель запускается
+    # и при SESSION_STORAGE=postgres: он дописывает то, что осталось после переключения хранилища
+    session_outbox.session_writer = SessionOutboxWriter(
+        storage.nosql_storage,
+        async_session,
+        batch_size=settings.SESSION_WRITER_BATCH_SIZE,
+        poll_interval=settings.SESSION_WRITER_POLL_INTERVAL,
+        retry_interval=settings.SESSION_WRITER_RETRY_INTERVAL,
+        lease_seconds=settings.SESSION_WRITER_LEASE_SECONDS
+    )
+    await session_outbox.session_writer.start()
+    await ensure_partitions()
+    partition_maintenance = asyncio.create_task(run_partition_maintenance())
+    loop_monitor = asyncio.create_task(
+        metrics.monitor_event_loop(settings.METRICS_SAMPLE_INTERVAL, sample_pool_metrics)
+    )
     yield
+    loop_monitor.cancel()
+    partition_maintenance.cancel()
+    await asyncio.gather(loop_monitor, partition_maintenance, return_exceptions=True)
+    await session_outbox.session_writer.stop()
+    await audit.audit_writer.stop()
+    await denylist.token_denylist.stop()
     await storage.nosql_storage.close()
-
-
-def configure_tracer() -> None:
-    trace.set_tracer_provider(TracerProvider())
-    trace.get_tracer_provider().add_span_processor(
-        BatchSpanProcessor(
-            JaegerExporter(
-                agent_host_name='jaeger',
-                agent_port=6831,
-            )
-        )
-    )
-    # Чтобы видеть трейсы в консоли
-    trace.get_tracer_provider().add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    hasher.password_hasher.shutdown()
+    await dispose_engine()
 
 
 if settings.ENABLE_TRACER:
@@ -59,18 +99,51 @@ app = FastAPI(
 )
 
 
-FastAPIInstrumentor.instrument_app(app)
-
-
 @app.middleware('http')
 async def before_request(request: Request, call_next):
-    response = await call_next(request)
+    query_stats = QueryStats()
+    token = current_query_stats.set(query_stats)
+    try:
+        response = await call_next(request)
+    finally:
+        current_query_stats.reset(token)
+    record_query_stats(request, response, query_stats)
     request_id = request.headers.get('X-Request-Id')
-    if not request_id:
+    # Prometheus не передает X-Request-Id при сборе метрик
+    if not request_id and request.url.path != METRICS_PATH:
         return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={'detail': 'X-Request-Id is required'})
     return response
 
 
+def record_query_stats(request: Request, response: Response, query_stats: QueryStats) -> None:
+    route = request.scope.get('route')
+    labels = (request.method, route.path if route else 'unmatched')
+    metrics.DB_STATEMENTS_PER_REQUEST.labels(*labels).observe(query_stats.count)
+    metrics.DB_TIME_PER_REQUEST.labels(*labels).observe(query_stats.total_time)
+    metrics.DB_SLOWEST_STATEMENT.labels(*labels).observe(query_stats.slowest_time)
+
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({
+            'db.statement_count': query_stats.count,
+            'db.total_time_ms': query_stats.total_time * 1000,
+            'db.slowest_time_ms': query_stats.slowest_time * 1000,
+        })
+        if query_stats.slowest_statement:
+            span.set_attribute('db.slowest_statement', query_stats.slowest_statement)
+
+    if settings.DEBUG:
+        response.headers['X-DB-Statements'] = str(query_stats.count)
+        response.headers['X-DB-Time-Ms'] = f'{query_stats.total_time * 1000:.2f}'
+        response.headers['X-DB-Slowest-Ms'] = f'{query_stats.slowest_time * 1000:.2f}'
+
+
+# подключаем после before_request, чтобы span запроса был активен в middleware
+FastAPIInstrumentor.instrument_app(app)
+
+
+app.include_router(metrics_api.router, prefix=METRICS_PATH)
+app.include_router(well_known.router, prefix='/auth/.well-known', tags=['jwks'])
 app.include_router(users.router, prefix='/auth/api/v1/users', tags=['users'])
 app.include_router(groups.router, prefix='/auth/api/v1/groups', tags=['groups'])
 app.include_router(permissions.router, prefix='/auth/api/v1/permissions', tags=['permissios'])
@@ -83,6 +156,7 @@ def authjwt_exception_handler(request: Request, exc: AuthJWTException):
 
 
 app.add_middleware(SessionMiddleware, secret_key="secret-string")
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 if __name__ == '__main__':
@@ -1,11 +1,33 @@
 import asyncio
+from pathlib import Path
 
 import typer
+from datetime import datetime
+
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.postgres import async_session
-from models.entity import User, Group, Permission
+from core.config import settings
+from core.keyring import generate_key, has_keys
+from db import partitions
+from db.postgres import async_session, engine
+from db.redis import RedisStorage, SessionRecord
+from db.session_outbox import SessionOutboxWriter
+from db.sessions import RedisSessionStorage
+from db.storage import ClaimsHandler, claims_local_cache
+from models.entity import User, Group, Permission, RefreshSession
+from services.user_import import (
+	ConflictPolicy,
+	ImportFormat,
+	UserImporter,
+	create_executor,
+	detect_format,
+	read_records,
+)
+from services.user_services import REFRESH_SESSION_EXPIRE_IN_SECONDS
+
+
+app = typer.Typer()
 
 
 SUPERUSER_GROUP_NAME = 'superuser'
@@ -82,9 +104,158 @@ async def create_superuser():
 		print('User was created successfully!')
 
 
+async def create_login_history_partitions(months_ahead: int) -> None:
+	async with engine.begin() as connection:
+		created = await partitions.create_partitions(connection, months_ahead)
+	await engine.dispose()
+	print(f'Created partitions: {", ".join(created) or "none"}')
+
+
+async def archive_login_history(output_dir: Path, retention_months: int) -> None:
+	async with engine.begin() as connection:
+		archived = await partitions.archive_partitions(connection, output_dir, retention_months)
+	await engine.dispose()
+	for path in archived:
+		print(f'Archived {path}')
+	print(f'Archived files: {len(archived)}')
+
+
+async def partition_login_history(keep_old: bool) -> None:
+	async with engine.begin() as connection:
+		copied = await partitions.convert_to_partitioned(connection, keep_old)
+	await engine.dispose()
+	if copied is None:
+		print(f'Table {partitions.LOGIN_HISTORY_TABLE} is already partitioned or does not exist')
+	else:
+		print(f'Copied {copied} rows into partitioned {partitions.LOGIN_HISTORY_TABLE}')
+
+
+async def restore_refresh_sessions(batch_size: int) -> None:
+	no_sql = RedisStorage(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0, decode_responses=True)
+	session_storage = RedisSessionStorage(no_sql, REFRESH_SESSION_EXPIRE_IN_SECONDS)
+	# сначала дописываем в Postgres накопленные закрытия, иначе закрытые сессии вернутся в Redis
+	await SessionOutboxWriter(
+		no_sql,
+		async_session,
+		batch_size=settings.SESSION_WRITER_BATCH_SIZE,
+		poll_interval=settings.SESSION_WRITER_POLL_INTERVAL,
+		retry_interval=settings.SESSION_WRITER_RETRY_INTERVAL,
+		lease_seconds=settings.SESSION_WRITER_LEASE_SECONDS
+	).drain(timeout=2 * settings.SESSION_WRITER_LEASE_SECONDS)
+	restored = 0
+	async with async_session() as session:
+		result = await session.stream(
+			select(RefreshSession).
+			where(RefreshSession.is_active.is_(True), RefreshSession.expired_at >= datetime.now()).
+			execution_options(yield_per=batch_size)
+		)
+		async for partition in result.scalars().partitions():
+			await session_storage.restore([
+				SessionRecord(str(row.user_id), row.user_agent, row.refresh_jti, row.expired_at)
+				for row in partition
+			])
+			restored += len(partition)
+	await no_sql.close()
+	await engine.dispose()
+	print(f'Restored refresh sessions: {restored}')
+
+
+async def import_users(
+	path: Path,
+	import_format: ImportFormat,
+	batch_size: int,
+	workers: int,
+	on_conflict: ConflictPolicy,
+	groups: list[str],
+) -> None:
+	no_sql = RedisStorage(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0, decode_responses=True)
+	# воркеры сервиса получат инвалидацию claims обновленных пользователей через CLAIMS_CHANNEL
+	claims = ClaimsHandler(no_sql, claims_local_cache, settings.CLAIMS_CACHE_EXPIRE_IN_SECONDS)
+	executor = create_executor(workers)
+	try:
+		importer = UserImporter(async_session, executor, workers, on_conflict, groups, claims)
+		stats = await importer.run(
+			read_records(path, import_format), batch_size, lambda current: print(current, flush=True)
+		)
+	finally:
+		executor.shutdown(cancel_futures=True)
+		await no_sql.close()
+		await engine.dispose()
+	print(f'Import finished: {stats}')
+
+
+@app.command('create-superuser')
 def main():
 	asyncio.run(create_superuser())
 
 
+@app.command('generate-jwt-key')
+def generate_jwt_key_command(
+	kid: str = typer.Option(None, help='Идентификатор ключа, по умолчанию время создания')
+):
+	"""Создает новый ключ подписи JWT. Самый новый ключ становится активным после перезапуска сервиса."""
+	print(f'Created {generate_key(settings.JWT_KEYS_DIR, kid)}')
+
+
+@app.command('ensure-jwt-key')
+def ensure_jwt_key_command():
+	"""Создает ключ подписи JWT, если в каталоге ключей еще нет ни одного."""
+	if has_keys(settings.JWT_KEYS_DIR):
+		print('JWT signing key already exists')
+		return
+	print(f'Created {generate_key(settings.JWT_KEYS_DIR)}')
+
+
+@app.command('create-partitions')
+def create_partitions_command(
+	months_ahead: int = typer.Option(settings.LOGIN_HISTORY_PARTITIONS_AHEAD, help='На сколько месяцев вперед создать партиции')
+):
+	"""Создает помесячные партиции истории входов."""
+	asyncio.run(create_login_history_partitions(months_ahead))
+
+
+@app.command('archive-login-history')
+def archive_login_history_command(
+	output_dir: Path = typer.Option(Path(settings.LOGIN_HISTORY_ARCHIVE_DIR), help='Каталог для CSV выгрузок'),
+	retention_months: int = typer.Option(settings.LOGIN_HISTORY_RETENTION_MONTHS, help='Сколько месяцев хранить в базе')
+):
+	"""Отсоединяет партиции истории входов старше срока хранения, выгружает их в CSV и удаляет."""
+	asyncio.run(archive_login_history(output_dir, retention_months))
+
+
+@app.command('partition-login-history')
+def partition_login_history_command(
+	keep_old: bool = typer.Option(False, help='Оставить прежнюю таблицу как user_login_history_unpartitioned')
+):
+	"""Переводит созданную до партиционирования таблицу истории входов на помесячные партиции."""
+	asyncio.run(partition_login_history(keep_old))
+
+
+@app.command('restore-refresh-sessions')
+def restore_refresh_sessions_command(
+	batch_size: int = typer.Option(1000, help='Сколько сессий читать из Postgres за раз')
+):
+	"""Загружает активные refresh сессии из Postgres в Redis для SESSION_STORAGE=redis."""
+	asyncio.run(restore_refresh_sessions(batch_size))
+
+
+@app.command('import-users')
+def import_users_command(
+	path: Path = typer.Argument(..., exists=True, dir_okay=False, help='CSV с заголовком или JSONL файл'),
+	import_format: ImportFormat = typer.Option(None, '--format', help='Формат файла, по умолчанию по расширению'),
+	batch_size: int = typer.Option(1000, help='Сколько пользователей записывать одним запросом'),
+	workers: int = typer.Option(settings.PASSWORD_HASH_WORKERS, help='Число процессов для хеширования паролей'),
+	on_conflict: ConflictPolicy = typer.Option(
+		ConflictPolicy.skip, help='skip - пропустить существующих, upsert - обновить по username'
+	),
+	group: list[str] = typer.Option([], help='Группа, в которую добавить всех пользователей; можно указать несколько раз'),
+):
+	"""
+	Импортирует пользователей из файла с полями username, password или password_hash,
+	email, first_name, last_name и groups.
+	"""
+	asyncio.run(import_users(path, import_format or detect_format(path), batch_size, workers, on_conflict, group))
+
+
 if __name__ == '__main__':
-	typer.run(main)
+	app()
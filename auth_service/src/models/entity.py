@@ -4,7 +4,7 @@ from datetime import datetime
 
 from sqlalchemy.orm import relationship, backref, Mapped
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import Column, DateTime, String, ForeignKey, Table, Boolean, UniqueConstraint
+from sqlalchemy import Column, DateTime, String, ForeignKey, Table, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import declarative_base
 from sqlalchemy import Column, DateTime, String
 from sqlalchemy.dialects.postgresql import UUID
@@ -51,7 +51,7 @@ class Group(Base):
 	permissions = relationship(
 		'Permission',
 		secondary=groups_permissions_table,
-		lazy='joined'
+		lazy='raise'
 	)
 
 	def __init__(self, group_name: str, permissions: list[Permission]):
@@ -78,7 +78,8 @@ class User(Base):
 	updated_at = Column(DateTime, nullable=True)
 	refresh_sessions = relationship('RefreshSession', cascade="all, delete")
 	user_login_history = relationship('UserLoginHistory', cascade="all, delete")
-	user_social_networks = relationship('UserSocialNetwork', lazy="selectin", cascade="all, delete")
+	# связи не загружаются по умолчанию: нужные загрузчики указываются в запросе (selectinload, joinedload)
+	user_social_networks = relationship('UserSocialNetwork', lazy='raise', cascade="all, delete")
 
 
 
@@ -86,7 +87,7 @@ class User(Base):
 	groups = relationship(
 		'Group',
 		secondary=groups_users_table,
-		lazy='joined'
+		lazy='raise'
 	)
 
 	def __init__(
@@ -97,10 +98,12 @@ class User(Base):
 		last_name: str = '',
 		email: str = '',
 		*args,
+		password_is_hashed: bool = False,
 		**kwargs,
 	) -> None:
 		self.username = username
-		self.password = generate_password_hash(password)
+		# хеш может быть посчитан заранее в пуле процессов (services.hasher)
+		self.password = password if password_is_hashed else generate_password_hash(password)
 		self.first_name = first_name
 		self.last_name = last_name
 		self.email = email
@@ -125,11 +128,15 @@ class RefreshSession(Base):
 	)
 
 	user_id = Column(UUID, ForeignKey('users.id'))
-	refresh_jti = Column(String, nullable=False)
+	refresh_jti = Column(String, nullable=False, unique=True)
 	user_agent = Column(String(255), nullable=False)
 	created_at = Column(DateTime, default=datetime.utcnow)
 	expired_at = Column(DateTime, nullable=False)
 	is_active = Column(Boolean, unique=False, nullable=False, default=True)
+	# время замены токена новым при обновлении пары; повторное предъявление такого токена - признак кражи
+	rotated_at = Column(DateTime, nullable=True, default=None)
+
+	__table_args__ = (Index('ix_refresh_sessions_user_id_is_active', 'user_id', 'is_active'),)
 
 	def __init__(
 		self,
@@ -153,19 +160,25 @@ class UserLoginHistory(Base):
 	"""Модель хранения истории входов и выходов из аккаунта пользователя."""
 	__tablename__ = 'user_login_history'
 
+	# таблица разбита на помесячные партиции по login_at (см. db/partitions.py),
+	# поэтому первичный ключ обязан включать ключ партиционирования
 	id = Column(
 		UUID(as_uuid=True),
 		primary_key=True,
 		default=uuid.uuid4,
-		unique=True,
 		nullable=False
 	)
 
 	user_id = Column(UUID, ForeignKey('users.id'))
 	user_agent = Column(String(255), nullable=False)
-	login_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+	login_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
 	logout_at = Column(DateTime, nullable=True, default=None)
 
+	__table_args__ = (
+		Index('ix_user_login_history_user_id_login_at', 'user_id', 'login_at'),
+		{'postgresql_partition_by': 'RANGE (login_at)'},
+	)
+
 	def __init__(
 		self,
 		user_id: UUID,
@@ -111,8 +111,8 @@ class UserResponseHistoryInDb(UserLoginHistoryInDb):
 
 
 class UserPaginatedHistoryInDb(BaseModel):
-    previous: None | int
-    next: None | int
+    next_cursor: None | str
+    has_more: bool
     items: list[UserResponseHistoryInDb]
 
 
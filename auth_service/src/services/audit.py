@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Callable
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import JWTSettings
+from models.entity import UserLoginHistory
+
+
+# незакрытый вход старше срока жизни refresh токена уже не может быть активным,
+# ограничение по login_at позволяет Postgres просматривать только свежие партиции истории
+ACTIVE_LOGIN_LOOKBACK: timedelta = JWTSettings().authjwt_refresh_token_expires
+
+
+def active_login_since() -> datetime:
+    return datetime.utcnow() - ACTIVE_LOGIN_LOOKBACK
+
+
+@dataclass
+class LoginEvent:
+    user_id: str
+    user_agent: str
+    login_at: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass
+class LogoutEvent:
+    user_id: str
+    user_agent: str
+    logout_at: datetime = field(default_factory=datetime.now)
+
+
+AuditEvent = LoginEvent | LogoutEvent
+
+_login_history = UserLoginHistory.__table__
+
+LOGOUT_STMT = update(_login_history).where(
+    _login_history.c.user_id == bindparam('b_user_id'),
+    _login_history.c.user_agent == bindparam('b_user_agent'),
+    _login_history.c.logout_at.is_(None),
+    _login_history.c.login_at >= bindparam('b_login_since'),
+).values(logout_at=bindparam('b_logout_at'))
+
+
+class AuditWriter:
+    """
+    Фоновая запись истории входов и выходов.
+
+    События складываются в очередь и записываются пачками: по достижении batch_size
+    или через flush_interval секунд после первого события пачки. Очередь своя у каждого воркера
+    gunicorn, поэтому порядок событий сохраняется только в пределах воркера: выход, принятый
+    другим воркером, может быть записан раньше входа и тогда не закроет его.
+    При переполнении очереди или ошибке записи события теряются, поэтому изменения refresh сессий
+    сюда не передаются: их надежно записывает db.session_outbox.SessionOutboxWriter.
+    """
+
+    def __init__(
+            self,
+            session_factory: Callable[[], AsyncSession],
+            batch_size: int,
+            flush_interval: float,
+            max_queue_size: int,
+    ) -> None:
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue[AuditEvent | None] = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._task: asyncio.Task | None = None
+
+    def log_login(self, user_id: str, user_agent: str) -> None:
+        self._put(LoginEvent(user_id, user_agent))
+
+    def log_logout(self, user_id: str, user_agent: str) -> None:
+        self._put(LogoutEvent(user_id, user_agent))
+
+    def _put(self, event: AuditEvent) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logging.error('Audit queue is full, dropping %s', event)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Дописывает накопленные события не дольше timeout секунд и останавливает фоновую задачу."""
+        if not self._task:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            # в полную очередь метка остановки попадет, когда задача запишет часть событий
+            await asyncio.wait_for(self.queue.put(None), timeout)
+            await asyncio.wait_for(self._task, max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            logging.error('Audit writer did not drain in %s s, %s events lost', timeout, self.queue.qsize())
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            event = await self.queue.get()
+            if event is None:
+                break
+            batch = [event]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            await self.flush(batch)
+
+    async def flush(self, batch: list[AuditEvent]) -> None:
+        try:
+            async with self.session_factory() as session:
+                # подряд идущие события одного типа пишем одним запросом
+                for event_type, events in groupby(batch, key=type):
+                    await self._writers[event_type](session, list(events))
+                await session.commit()
+        except Exception as e:
+            # задача записи не должна останавливаться: иначе все следующие события будут потеряны
+            logging.error('Failed to write %s audit events: %r', len(batch), e)
+
+    @staticmethod
+    async def _write_logins(session: AsyncSession, events: list[LoginEvent]) -> None:
+        await session.execute(insert(_login_history).values([
+            {'user_id': e.user_id, 'user_agent': e.user_agent, 'login_at': e.login_at}
+            for e in events
+        ]))
+
+    @staticmethod
+    async def _write_logouts(session: AsyncSession, events: list[LogoutEvent]) -> None:
+        login_since = active_login_since()
+        await session.execute(LOGOUT_STMT, [
+            {
+                'b_user_id': e.user_id,
+                'b_user_agent': e.user_agent,
+                'b_login_since': login_since,
+                'b_logout_at': e.logout_at,
+            }
+            for e in events
+        ])
+
+    _writers = {
+        LoginEvent: _write_logins,
+        LogoutEvent: _write_logouts,
+    }
+
+
+audit_writer: AuditWriter | None = None
+
+
+async def get_audit_writer() -> AuditWriter:
+    return audit_writer
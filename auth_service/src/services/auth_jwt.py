@@ -0,0 +1,59 @@
+from typing import Dict, Optional, Union
+
+import jwt
+from async_fastapi_jwt_auth import AuthJWT
+from async_fastapi_jwt_auth.exceptions import AccessTokenRequired, InvalidHeaderError, JWTDecodeError
+
+from core.keyring import JWT_ALGORITHM, get_keyring
+
+
+class KeyringAuthJWT(AuthJWT):
+	"""
+	AuthJWT, подписывающий токены активным ключом из KeyRing.
+
+	В заголовок токена добавляется kid, по нему при проверке выбирается открытый ключ,
+	поэтому токены, выпущенные до ротации ключа, остаются валидными.
+	"""
+
+	async def _create_token(self, *args, headers: Optional[Dict] = None, algorithm: Optional[str] = None, **kwargs) -> str:
+		headers = {**(headers or {}), 'kid': get_keyring().active.kid}
+		return await super()._create_token(*args, headers=headers, algorithm=JWT_ALGORITHM, **kwargs)
+
+	async def _get_secret_key(self, algorithm: str, process: str):
+		# открытый ключ для проверки выбирается по kid в _verified_token
+		return get_keyring().active.private_key
+
+	async def verify_access_token(self, encoded_token: str) -> Dict[str, Union[str, int, bool]]:
+		"""Проверяет подпись, срок действия и тип access токена и возвращает его claims."""
+		claims = await self._verified_token(encoded_token, self._decode_issuer)
+		if claims.get('type') != 'access':
+			raise AccessTokenRequired(status_code=422, message='Only access tokens are allowed')
+		return claims
+
+	async def _verified_token(
+		self, encoded_token: str, issuer: Optional[str] = None
+	) -> Dict[str, Union[str, int, bool]]:
+		try:
+			unverified_headers = await self.get_unverified_jwt_headers(encoded_token)
+		except Exception as err:
+			raise InvalidHeaderError(status_code=422, message=str(err))
+
+		kid = unverified_headers.get('kid')
+		public_key = get_keyring().verification_key(kid)
+		if public_key is None:
+			# ключ мог появиться после последней проверки каталога, например после ротации в другом воркере
+			public_key = get_keyring(unknown_kid=True).verification_key(kid)
+		if public_key is None:
+			raise JWTDecodeError(status_code=422, message='Unknown signing key')
+
+		try:
+			return jwt.decode(
+				encoded_token,
+				public_key,
+				issuer=issuer,
+				audience=self._decode_audience,
+				leeway=self._decode_leeway,
+				algorithms=[JWT_ALGORITHM],
+			)
+		except Exception as err:
+			raise JWTDecodeError(status_code=422, message=str(err))
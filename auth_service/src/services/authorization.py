@@ -1,35 +1,96 @@
-from fastapi import Depends
-from fastapi.security import HTTPBearer
-from async_fastapi_jwt_auth import AuthJWT
+from functools import lru_cache
+from typing import Any, Iterable
+
+from fastapi import Depends, Request
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+from services.auth_jwt import KeyringAuthJWT
 
 
 security = HTTPBearer()
 
+ALLOW_ALL_PERMISSIONS = frozenset(('*', '*.*'))
+
+
+class PermissionMatcher:
+	"""
+	Предварительно разобранный набор прав пользователя.
+
+	Поддерживает точные имена прав, шаблоны вида `films.*` (все права с этим префиксом)
+	и `*` / `*.*` (любое право). Проверка одного права выполняется за O(глубины имени).
+	"""
+
+	def __init__(self, permissions: Iterable[str]) -> None:
+		self.allow_all = False
+		self.exact: set[str] = set()
+		self.prefixes: set[str] = set()
+		for permission in permissions:
+			if permission in ALLOW_ALL_PERMISSIONS:
+				self.allow_all = True
+			elif permission.endswith('.*'):
+				self.prefixes.add(permission[:-2])
+			else:
+				self.exact.add(permission)
+
+	def matches(self, permission: str) -> bool:
+		if self.allow_all or permission in self.exact:
+			return True
+		if not self.prefixes:
+			return False
+
+		position = permission.find('.')
+		while position != -1:
+			if permission[:position] in self.prefixes:
+				return True
+			position = permission.find('.', position + 1)
+		return False
+
+	def matches_any(self, required_permissions: Iterable[str]) -> bool:
+		return any(self.matches(permission) for permission in required_permissions)
+
+
+@lru_cache(maxsize=1024)
+def _compile_permissions(permissions: frozenset[str]) -> PermissionMatcher:
+	return PermissionMatcher(permissions)
+
+
+def compile_permissions(permissions: Iterable[str]) -> PermissionMatcher:
+	"""Возвращает матчер для набора прав, переиспользуя уже разобранные наборы."""
+	return _compile_permissions(frozenset(permissions))
+
 
 class AuthorizationChecker:
 	def __init__(
 		self,
-		access_token: str = Depends(security),
-		authorize_service: AuthJWT = Depends(),
+		request: Request,
+		access_token: HTTPAuthorizationCredentials = Depends(security),
+		authorize_service: KeyringAuthJWT = Depends(),
 	):
+		self.request = request
 		self.access_token = access_token
 		self.authorize_service = authorize_service
 
+	async def get_claims(self) -> dict[str, Any]:
+		"""Проверяет подпись access токена один раз за запрос и сохраняет claims в request.state."""
+		claims = getattr(self.request.state, 'jwt_claims', None)
+		if claims is not None:
+			return claims
+
+		claims = await self.authorize_service.verify_access_token(self.access_token.credentials)
+		self.request.state.jwt_claims = claims
+		return claims
+
 	async def __call__(
 		self,
 		required_permissons: list[str]
 	):
-		await self.authorize_service.jwt_required(token=self.access_token)
-		user_permissions = (await self.authorize_service.get_raw_jwt())['permissions']
-
-		if '*.*' in user_permissions:
-			return True
-
-		for user_permission in user_permissions:
-			if user_permission in required_permissons:
-				return True
-
-		return False
+		claims = await self.get_claims()
+		matcher = compile_permissions(
+			permission
+			for group in claims.get('groups_permissions', ())
+			for permission in group['permissions']
+		)
+		return matcher.matches_any(required_permissons)
 
 
 class PermissionClaimsService:
@@ -39,13 +100,7 @@ class PermissionClaimsService:
 		permissions_names: list[str],
 		endpoint_permissions: list[str]
 	):
-		if '*.*' in permissions_names:
-			return True
-
-		for user_permission in permissions_names:
-			if user_permission in endpoint_permissions:
-				return True
-		return False
+		return compile_permissions(permissions_names).matches_any(endpoint_permissions)
 
 
 async def get_permission_claims_service() -> PermissionClaimsService:
@@ -2,10 +2,12 @@ from uuid import UUID
 
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, select
+from sqlalchemy.orm import selectinload
 
 from db.postgres import get_session
-from models.entity import Permission, Group
+from db.storage import ClaimsHandler, get_claims_handler
+from models.entity import Permission, Group, groups_users_table
 from schemas.entity import GroupDetailView, GroupShortView, PermissionShortView
 
 
@@ -19,26 +21,31 @@ class DatabaseSession:
         )).scalars().first()
         return group
 
+    async def get_group_user_ids(self, group_id: UUID) -> list[UUID]:
+        query_result = await self.session.execute(
+            select(groups_users_table.c.user_id).where(groups_users_table.c.group_id == group_id)
+        )
+        return list(query_result.scalars().all())
+
     async def delete_group(
             self,
             group_id: UUID
     ) -> UUID | None:
-        query_result = await self.session.execute(
-            select(Group).where(Group.id == group_id)
-        )
-        group = query_result.scalar()
+        # связи с правами и пользователями удаляются каскадом на стороне базы данных
+        deleted_id = (await self.session.execute(
+            delete(Group).where(Group.id == group_id).returning(Group.id)
+        )).scalar()
 
-        if not group:
+        if not deleted_id:
             return None
 
-        await self.session.delete(group)
         await self.session.commit()
 
-        return group.id
+        return deleted_id
 
     async def read_groups(self) -> list[Group]:
-        query_result = await self.session.execute(select(Group))
-        return list(query_result.unique().scalars().all())
+        query_result = await self.session.execute(select(Group).options(selectinload(Group.permissions)))
+        return list(query_result.scalars().all())
 
     async def update_group(
             self,
@@ -46,7 +53,7 @@ class DatabaseSession:
             data: dict
     ) -> Group | None:
         query_result = await self.session.execute(
-            select(Group).where(Group.id == group_id)
+            select(Group).where(Group.id == group_id).options(selectinload(Group.permissions))
         )
         group = query_result.scalar()
 
@@ -87,13 +94,13 @@ class DatabaseSession:
         self.session.add(group)
 
         await self.session.commit()
-        await self.session.refresh(group)
         return group
 
 
 class GroupService:
-    def __init__(self, session: DatabaseSession):
+    def __init__(self, session: DatabaseSession, claims_handler: ClaimsHandler):
         self.session = session
+        self.claims_handler = claims_handler
 
     async def check_group_exists(self, group_name: str) -> bool:
         group = await self.session.get_group_by_group_name(group_name)
@@ -140,6 +147,8 @@ class GroupService:
         if not group:
             return None
 
+        await self.claims_handler.invalidate(await self.session.get_group_user_ids(group_id))
+
         return GroupDetailView(
             id=group.id,
             group_name=group.group_name,
@@ -155,17 +164,21 @@ class GroupService:
             self,
             group_id: UUID
     ) -> UUID | None:
+        user_ids = await self.session.get_group_user_ids(group_id)
         group_id = await self.session.delete_group(group_id)
 
         if not group_id:
             return None
 
+        await self.claims_handler.invalidate(user_ids)
         return group_id
 
 
 async def get_group_service(
-        db: AsyncSession = Depends(get_session)
+        db: AsyncSession = Depends(get_session),
+        claims_handler: ClaimsHandler = Depends(get_claims_handler),
 ) -> GroupService:
     return GroupService(
-        DatabaseSession(db)
+        DatabaseSession(db),
+        claims_handler
     )
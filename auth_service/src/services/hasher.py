@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Any, Callable
+
+from fastapi import HTTPException
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from core import metrics
+
+
+@dataclass
+class HasherStats:
+    """Метрики пула хеширования паролей; задержка считается только по успешным задачам."""
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.completed if self.completed else 0.0
+
+
+class PasswordHasher:
+    """
+    Выполняет хеширование и проверку паролей в отдельном пуле процессов,
+    чтобы вычисление PBKDF2 не блокировало event loop.
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        self.in_flight = 0
+        self.stats = HasherStats()
+
+    @property
+    def queue_depth(self) -> int:
+        """Число задач, ожидающих свободный процесс."""
+        return max(self.in_flight - self.max_workers, 0)
+
+    def _set_in_flight(self, value: int) -> None:
+        self.in_flight = value
+        metrics.PASSWORD_HASH_QUEUE_DEPTH.set(self.queue_depth)
+
+    async def _run(self, operation: str, func: Callable, *args: Any) -> Any:
+        # ограничиваем очередь, чтобы при всплеске входов отвечать 429, а не копить задержку
+        if self.in_flight >= self.max_workers + self.max_queue_size:
+            self.stats.rejected += 1
+            metrics.PASSWORD_HASH_REJECTED.inc()
+            logging.warning('Password hasher queue is full: %s tasks in flight', self.in_flight)
+            raise HTTPException(
+                status_code=HTTPStatus.TOO_MANY_REQUESTS,
+                detail='Сервис перегружен, повторите попытку позже',
+                headers={'Retry-After': '1'}
+            )
+
+        self._set_in_flight(self.in_flight + 1)
+        started_at = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        except Exception:
+            self.stats.failed += 1
+            metrics.PASSWORD_HASH_LATENCY.labels(operation, 'error').observe(time.perf_counter() - started_at)
+            raise
+        finally:
+            self._set_in_flight(self.in_flight - 1)
+
+        latency = time.perf_counter() - started_at
+        self.stats.completed += 1
+        self.stats.total_latency += latency
+        self.stats.max_latency = max(self.stats.max_latency, latency)
+        metrics.PASSWORD_HASH_LATENCY.labels(operation, 'ok').observe(latency)
+        return result
+
+    async def hash_password(self, password: str) -> str:
+        return await self._run('hash', generate_password_hash, password)
+
+    async def check_password(self, password_hash: str, password: str) -> bool:
+        return await self._run('check', check_password_hash, password_hash, password)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+password_hasher: PasswordHasher | None = None
+
+
+async def get_password_hasher() -> PasswordHasher:
+    return password_hasher
@@ -5,7 +5,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 
 from db.postgres import get_session
-from models.entity import Permission
+from db.storage import ClaimsHandler, get_claims_handler
+from models.entity import Permission, groups_permissions_table, groups_users_table
 from schemas.entity import PermissionDetailView, PermissionShortView
 
 
@@ -50,6 +51,18 @@ class DatabaseSession:
 
 		return list(permission_duplicates)
 
+	async def get_permission_user_ids(self, permission_id: UUID) -> list[UUID]:
+		query_result = await self.session.execute(
+			select(groups_users_table.c.user_id).
+			join(
+				groups_permissions_table,
+				groups_permissions_table.c.group_id == groups_users_table.c.group_id
+			).
+			where(groups_permissions_table.c.permission_id == permission_id).
+			distinct()
+		)
+		return list(query_result.scalars().all())
+
 	async def update_permission(
 		self,
 		permission_id: UUID,
@@ -86,8 +99,9 @@ class DatabaseSession:
 
 
 class PermissionService:
-	def __init__(self, session: DatabaseSession):
+	def __init__(self, session: DatabaseSession, claims_handler: ClaimsHandler):
 		self.session = session
+		self.claims_handler = claims_handler
 
 	async def check_permission_exists(self, permission_name: str) -> bool:
 		permission = await self.session.get_permission_by_name(permission_name)
@@ -128,6 +142,8 @@ class PermissionService:
 		if not permission:
 			return None
 
+		await self.claims_handler.invalidate(await self.session.get_permission_user_ids(permission_id))
+
 		return PermissionDetailView(
 			id=permission.id,
 			permission_name=permission.permission_name
@@ -137,12 +153,21 @@ class PermissionService:
 		self,
 		permission_id: UUID
 	) -> UUID | None:
-		return await self.session.delete_permission(permission_id)
+		user_ids = await self.session.get_permission_user_ids(permission_id)
+		permission_id = await self.session.delete_permission(permission_id)
+
+		if not permission_id:
+			return None
+
+		await self.claims_handler.invalidate(user_ids)
+		return permission_id
 
 
 async def get_permission_service(
-	db: AsyncSession = Depends(get_session)
+	db: AsyncSession = Depends(get_session),
+	claims_handler: ClaimsHandler = Depends(get_claims_handler),
 ) -> PermissionService:
 	return PermissionService(
-		DatabaseSession(db)
+		DatabaseSession(db),
+		claims_handler
 	)
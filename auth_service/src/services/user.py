@@ -3,8 +3,10 @@ from uuid import UUID
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 
 from db.postgres import get_session
+from db.storage import ClaimsHandler, get_claims_handler
 from models.entity import User, Group
 from schemas.entity import UserInDB
 
@@ -20,7 +22,7 @@ class DatabaseSession:
 	) -> User | None:
 		user = (
 			await self.session.execute(
-				select(User).where(User.id == user_id)
+				select(User).where(User.id == user_id).options(selectinload(User.groups))
 			)
 		).scalar()
 
@@ -48,7 +50,7 @@ class DatabaseSession:
 	) -> User | None:
 		user = (
 			await self.session.execute(
-				select(User).where(User.id == user_id)
+				select(User).where(User.id == user_id).options(selectinload(User.groups))
 			)
 		).scalar()
 
@@ -71,8 +73,9 @@ class DatabaseSession:
 
 
 class UserPermissionsService:
-	def __init__(self, session: DatabaseSession):
+	def __init__(self, session: DatabaseSession, claims_handler: ClaimsHandler):
 		self.session = session
+		self.claims_handler = claims_handler
 
 	async def add_role_to_user(
 		self,
@@ -84,6 +87,8 @@ class UserPermissionsService:
 		if not user:
 			return None
 
+		await self.claims_handler.invalidate([user.id])
+
 		return UserInDB(
 			id=user.id,
 			first_name=user.first_name,
@@ -101,6 +106,8 @@ class UserPermissionsService:
 		if not user:
 			return None
 
+		await self.claims_handler.invalidate([user.id])
+
 		return UserInDB(
 			id=user.id,
 			first_name=user.first_name,
@@ -110,8 +117,10 @@ class UserPermissionsService:
 
 
 async def get_user_permissions_service(
-	db: AsyncSession = Depends(get_session)
+	db: AsyncSession = Depends(get_session),
+	claims_handler: ClaimsHandler = Depends(get_claims_handler),
 ) -> UserPermissionsService:
 	return UserPermissionsService(
-		DatabaseSession(db)
+		DatabaseSession(db),
+		claims_handler
 	)
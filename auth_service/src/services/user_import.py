@@ -0,0 +1,348 @@
+import asyncio
+import csv
+import json
+import logging
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from werkzeug.security import generate_password_hash
+
+from db.storage import ClaimsHandler
+from models.entity import Group, User, groups_users_table
+
+
+_users = User.__table__
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+# хеш werkzeug: метод с параметрами, соль и hex-дайджест, например scrypt:32768:8:1$<соль>$<дайджест>
+PASSWORD_HASH_RE = re.compile(r'(scrypt(:\d+:\d+:\d+)?|pbkdf2(:[\w-]+(:\d+)?)?)\$[^$]+\$[0-9a-f]+')
+
+
+class ConflictPolicy(str, Enum):
+    skip = 'skip'
+    upsert = 'upsert'
+
+
+class ImportFormat(str, Enum):
+    csv = 'csv'
+    jsonl = 'jsonl'
+
+
+@dataclass
+class ImportRow:
+    line: int
+    username: str
+    email: str | None
+    first_name: str
+    last_name: str
+    password: str | None
+    password_hash: str | None
+    groups: list[str] = field(default_factory=list)
+
+
+@dataclass
+class ImportStats:
+    processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    invalid: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started_at
+        return self.processed / elapsed if elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f'processed={self.processed} inserted={self.inserted} updated={self.updated} '
+            f'skipped={self.skipped} invalid={self.invalid} rate={self.rate:.0f}/s'
+        )
+
+
+def detect_format(path: Path) -> ImportFormat:
+    return ImportFormat.csv if path.suffix.lower() == '.csv' else ImportFormat.jsonl
+
+
+def read_records(path: Path, import_format: ImportFormat) -> Iterator[tuple[int, dict | None]]:
+    """Построчно читает файл, не загружая его в память целиком. None - строка не разобрана."""
+    with path.open(newline='', encoding='utf-8') as file:
+        if import_format is ImportFormat.csv:
+            # первая строка - заголовок
+            yield from enumerate(csv.DictReader(file), start=2)
+            return
+        for line, text in enumerate(file, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except json.JSONDecodeError as e:
+                logging.warning('Line %s: invalid JSON: %s', line, e)
+                yield line, None
+
+
+def parse_row(line: int, record: dict | None) -> ImportRow | None:
+    """
+    Проверяет запись файла. Пароль передается открытым текстом в password
+    или уже посчитанным хешем werkzeug в password_hash.
+    Группы в CSV перечисляются через точку с запятой.
+    Запись, которую база отвергнет, считается неверной здесь: иначе откатится вся пачка.
+    """
+    if not isinstance(record, dict):
+        if record is not None:
+            logging.warning('Line %s: a JSON object is expected', line)
+        return None
+    values = {name: record.get(name) for name in (*USER_FIELDS, 'password', 'password_hash')}
+    if any(value is not None and not isinstance(value, str) for value in values.values()):
+        logging.warning('Line %s: user fields must be strings', line)
+        return None
+    values['username'] = (values['username'] or '').strip()
+    values['email'] = (values['email'] or '').strip() or None
+    too_long = [
+        name for name in USER_FIELDS
+        if values[name] and len(values[name]) > _users.c[name].type.length
+    ]
+    if too_long:
+        logging.warning('Line %s: too long %s', line, ', '.join(too_long))
+        return None
+
+    username = values['username']
+    password = values['password'] or None
+    password_hash = values['password_hash'] or None
+    if not username or not (password or password_hash):
+        logging.warning('Line %s: username and password or password_hash are required', line)
+        return None
+    # пользователь с нераспознанным хешем не сможет войти, а проверка пароля при входе упадет
+    if password_hash and (
+            len(password_hash) > _users.c.password.type.length or not PASSWORD_HASH_RE.fullmatch(password_hash)
+    ):
+        logging.warning('Line %s: password_hash is not a werkzeug password hash', line)
+        return None
+
+    groups = record.get('groups') or []
+    if isinstance(groups, str):
+        groups = [name.strip() for name in groups.split(';') if name.strip()]
+    if not isinstance(groups, list) or not all(isinstance(name, str) for name in groups):
+        logging.warning('Line %s: groups must be a list of group names', line)
+        return None
+    return ImportRow(
+        line=line,
+        username=username,
+        email=values['email'],
+        first_name=values['first_name'] or '',
+        last_name=values['last_name'] or '',
+        password=password,
+        password_hash=password_hash,
+        groups=groups,
+    )
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    return [generate_password_hash(password) for password in passwords]
+
+
+def batched(rows: Iterable[ImportRow], size: int) -> Iterator[list[ImportRow]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def unique_in_batch(batch: list[ImportRow]) -> tuple[list[ImportRow], int]:
+    """Оставляет первую запись для каждого username и email: одна вставка не может изменить строку дважды."""
+    usernames, emails, rows = set(), set(), []
+    for row in batch:
+        if row.username in usernames or (row.email and row.email in emails):
+            continue
+        usernames.add(row.username)
+        if row.email:
+            emails.add(row.email)
+        rows.append(row)
+    return rows, len(batch) - len(rows)
+
+
+class UserImporter:
+    """
+    Импорт пользователей пачками.
+
+    Пароли хешируются в пуле процессов, пока предыдущая пачка записывается в базу.
+    Каждая пачка - один многострочный INSERT ... ON CONFLICT и одна транзакция,
+    поэтому прерванный импорт можно запустить повторно.
+    При upsert закешированные claims обновленных пользователей инвалидируются через claims.
+    """
+
+    def __init__(
+            self,
+            session_factory: async_sessionmaker[AsyncSession],
+            executor: ProcessPoolExecutor,
+            workers: int,
+            on_conflict: ConflictPolicy = ConflictPolicy.skip,
+            default_groups: list[str] | None = None,
+            claims: ClaimsHandler | None = None,
+    ) -> None:
+        self.session_factory = session_factory
+        self.executor = executor
+        self.workers = workers
+        self.on_conflict = on_conflict
+        self.default_groups = default_groups or []
+        self.claims = claims
+        self.group_ids: dict[str, str | None] = {}
+        self.stats = ImportStats()
+
+    async def run(
+            self,
+            records: Iterable[tuple[int, dict | None]],
+            batch_size: int,
+            report: Callable[[ImportStats], None],
+    ) -> ImportStats:
+        """Импортирует записи read_records; записи, не прошедшие parse_row, считаются в stats.invalid."""
+        async with self.session_factory() as session:
+            await self._load_groups(session, self.default_groups)
+            missing = [name for name in self.default_groups if not self.group_ids[name]]
+            if missing:
+                raise ValueError(f'Группы не найдены: {", ".join(missing)}')
+
+        batches = batched(self._parse(records), batch_size)
+        pending = self._hash(next(batches, None))
+        while pending is not None:
+            batch, hashes = await pending
+            # хешируем следующую пачку, пока пишем текущую
+            pending = self._hash(next(batches, None))
+            await self._write(batch, hashes)
+            report(self.stats)
+        return self.stats
+
+    def _parse(self, records: Iterable[tuple[int, dict | None]]) -> Iterator[ImportRow]:
+        for line, record in records:
+            row = parse_row(line, record)
+            if row is None:
+                self.stats.invalid += 1
+                continue
+            yield row
+
+    def _hash(self, batch: list[ImportRow] | None) -> asyncio.Future | None:
+        if batch is None:
+            return None
+        return asyncio.ensure_future(self._hash_batch(batch))
+
+    async def _hash_batch(self, batch: list[ImportRow]) -> tuple[list[ImportRow], list[str]]:
+        passwords = [row.password for row in batch if not row.password_hash]
+        chunk_size = max(len(passwords) // self.workers, 1)
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, hash_passwords, passwords[i:i + chunk_size])
+            for i in range(0, len(passwords), chunk_size)
+        ))
+        hashed = iter([password_hash for chunk in chunks for password_hash in chunk])
+        return batch, [row.password_hash or next(hashed) for row in batch]
+
+    async def _write(self, batch: list[ImportRow], hashes: list[str]) -> None:
+        self.stats.processed += len(batch)
+        password_by_line = {row.line: password_hash for row, password_hash in zip(batch, hashes)}
+        rows, duplicates = unique_in_batch(batch)
+        self.stats.skipped += duplicates
+
+        async with self.session_factory() as session:
+            if self.on_conflict is ConflictPolicy.upsert:
+                rows = await self._drop_foreign_emails(session, rows)
+            if not rows:
+                return
+            await self._load_groups(session, [name for row in rows for name in row.groups])
+
+            stmt = pg_insert(_users).values([
+                {
+                    'username': row.username,
+                    'email': row.email,
+                    'first_name': row.first_name,
+                    'last_name': row.last_name,
+                    'password': password_by_line[row.line],
+                }
+                for row in rows
+            ])
+            if self.on_conflict is ConflictPolicy.upsert:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[_users.c.username],
+                    set_={
+                        'email': stmt.excluded.email,
+                        'first_name': stmt.excluded.first_name,
+                        'last_name': stmt.excluded.last_name,
+                        'password': stmt.excluded.password,
+                        'updated_at': datetime.utcnow(),
+                    }
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing()
+            # xmax = 0 только у вставленных строк, у обновленных он заполнен
+            written = (await session.execute(stmt.returning(
+                _users.c.id, _users.c.username, literal_column('xmax = 0').label('inserted')
+            ))).all()
+
+            inserted = sum(1 for row in written if row.inserted)
+            self.stats.inserted += inserted
+            self.stats.updated += len(written) - inserted
+            self.stats.skipped += len(rows) - len(written)
+
+            await self._assign_groups(session, rows, {row.username: row.id for row in written})
+            await session.commit()
+
+        # группы и права обновленных пользователей могли измениться, у вставленных claims еще нет
+        if self.claims:
+            await self.claims.invalidate([row.id for row in written if not row.inserted])
+
+    async def _drop_foreign_emails(self, session: AsyncSession, rows: list[ImportRow]) -> list[ImportRow]:
+        """При обновлении по username пропускает записи, чей email уже занят другим пользователем."""
+        emails = [row.email for row in rows if row.email]
+        if not emails:
+            return rows
+        owners = dict((await session.execute(
+            select(User.email, User.username).where(User.email.in_(emails))
+        )).all())
+        kept = [row for row in rows if owners.get(row.email, row.username) == row.username]
+        self.stats.skipped += len(rows) - len(kept)
+        return kept
+
+    async def _load_groups(self, session: AsyncSession, names: Iterable[str]) -> None:
+        names = {name for name in names if name not in self.group_ids}
+        if not names:
+            return
+        found = dict((await session.execute(
+            select(Group.group_name, Group.id).where(Group.group_name.in_(names))
+        )).all())
+        for name in names:
+            self.group_ids[name] = found.get(name)
+            if name not in found:
+                logging.warning('Group %s not found, it will not be assigned', name)
+
+    async def _assign_groups(self, session: AsyncSession, rows: list[ImportRow], user_ids: dict) -> None:
+        links = {
+            (user_ids[row.username], self.group_ids[name])
+            for row in rows if row.username in user_ids
+            for name in [*self.default_groups, *row.groups] if self.group_ids.get(name)
+        }
+        if not links:
+            return
+        # при повторном импорте пользователь может уже состоять в группе
+        existing = set((await session.execute(
+            select(groups_users_table.c.user_id, groups_users_table.c.group_id).
+            where(groups_users_table.c.user_id.in_({user_id for user_id, _ in links}))
+        )).all())
+        links -= existing
+        if links:
+            await session.execute(groups_users_table.insert().values([
+                {'user_id': user_id, 'group_id': group_id} for user_id, group_id in links
+            ]))
+
+
+def create_executor(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
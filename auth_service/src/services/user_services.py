@@ -1,107 +1,161 @@
+import base64
+import binascii
 import json
 import logging
 import uuid
 import string
+from dataclasses import dataclass
 from secrets import choice as secrets_choice
 from datetime import datetime
 from functools import lru_cache
+from http import HTTPStatus
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException
 
-from sqlalchemy import select, update, UUID, func, and_, delete, UUID, or_
+from redis.exceptions import RedisError
+from sqlalchemy import select, update, UUID, and_, delete, UUID, or_, tuple_
 
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from werkzeug.security import generate_password_hash, check_password_hash
 
+from core.config import settings, JWTSettings
 from db.postgres import get_session
-from db.redis import RedisStorage
-from db.storage import get_nosql_storage, TokenHandler
-from models.entity import User, RefreshSession, UserLoginHistory, Permission, Group, UserSocialNetwork
+from db.redis import RedisStorage, ISessionStorage, DeviceState, RotationResult, SessionRecord
+from db.sessions import PostgresSessionStorage, RedisSessionStorage
+from db.denylist import TokenDenylist, get_token_denylist
+from db.storage import get_nosql_storage, get_claims_handler, TokenHandler, ClaimsHandler, SessionCounter
+from services.audit import AuditWriter, get_audit_writer
+from services.hasher import PasswordHasher, get_password_hasher
+from models.entity import (
+    User,
+    UserLoginHistory,
+    Permission,
+    Group,
+    UserSocialNetwork,
+    groups_users_table,
+    groups_permissions_table,
+)
 from schemas.entity import (
     RefreshToDb,
     UserLoginHistoryInDb,
-    UserLogoutHistoryInDb,
     RefreshDelDb,
     UserCreate,
     UserSocialNetworkInDb
 )
 
 CACHE_EXPIRE_IN_SECONDS = 5 * 60  # 5 min
+REFRESH_SESSION_EXPIRE_IN_SECONDS = int(JWTSettings().authjwt_refresh_token_expires.total_seconds())
 YANDEX_SOCIAL_NAME = 'yandex'
 
+# имена ограничений уникальности, которые Postgres создает для users.username и users.email
+SIGNUP_CONFLICT_DETAILS = {
+    'users_username_key': 'Некорректное имя пользователя или пароль',
+    'users_email_key': 'Пользователь с данным email уже зарегистрирован',
+}
+
+
+@dataclass
+class SigninState:
+    """Состояние пользователя и его сессий на момент входа."""
+    user: User
+    device_logged_in: bool
+    device_session_expired: bool
+
 
 class UserService:
     def __init__(
             self,
             token_handler: TokenHandler,
             db: AsyncSession,
+            password_hasher: PasswordHasher,
+            claims_handler: ClaimsHandler,
+            session_storage: ISessionStorage,
+            audit_writer: AuditWriter,
     ) -> None:
         self.token_handler = token_handler
         self.db = db
-
-    async def get_user_by_user_id(self, user_id) -> User:
-        user = (await self.db.execute(
-            select(User).where(User.id == user_id)
-        )).scalar()
-        return user
+        self.password_hasher = password_hasher
+        self.claims_handler = claims_handler
+        self.session_storage = session_storage
+        self.audit_writer = audit_writer
 
     async def get_user_groups_permissions(self, user_id: str) -> list[dict]:
-        user = (await self.db.execute(
-            select(User).where(User.id == user_id)
-        )).scalar()
-
-        groups_permissions = []
-        for group in user.groups:
-            groups_permissions.append(
-                {
-                    'group': group.group_name,
-                    'permissions': [
-                        permission.permission_name
-                        for permission in group.permissions
-                    ]
-                }
-            )
+        """Возвращает claim groups_permissions из кеша, при промахе собирает его из базы данных."""
+        groups_permissions = await self.claims_handler.get_claims(str(user_id))
+        if groups_permissions is None:
+            generation = await self.claims_handler.get_generation(str(user_id))
+            groups_permissions = await self._load_groups_permissions(user_id)
+            await self.claims_handler.put_claims(str(user_id), groups_permissions, generation)
         return groups_permissions
 
-    async def check_exist_user(self, user_dto):
-        result = await self.db.execute(select(User).where(User.username == user_dto.get('username')))
-        user = result.scalars().first()
-
-        return bool(user)
-
-    async def check_unique_email(self, user_dto):
-        result = await self.db.execute(select(User).where(User.email == user_dto.get('email')))
-        user = result.scalars().first()
-
-        return True if not user else False
+    async def _load_groups_permissions(self, user_id: str) -> list[dict]:
+        rows = (await self.db.execute(
+            select(Group.group_name, Permission.permission_name).
+            select_from(groups_users_table).
+            join(Group, Group.id == groups_users_table.c.group_id).
+            outerjoin(groups_permissions_table, groups_permissions_table.c.group_id == Group.id).
+            outerjoin(Permission, Permission.id == groups_permissions_table.c.permission_id).
+            where(groups_users_table.c.user_id == user_id)
+        )).all()
+
+        groups_permissions = {}
+        for group_name, permission_name in rows:
+            permissions = groups_permissions.setdefault(group_name, [])
+            if permission_name:
+                permissions.append(permission_name)
+        return [
+            {'group': group_name, 'permissions': permissions}
+            for group_name, permissions in groups_permissions.items()
+        ]
+
+    async def check_password(self, user: User, password: str) -> bool:
+        """Проверяет пароль пользователя в пуле процессов хеширования."""
+        return await self.password_hasher.check_password(user.password, password)
 
     async def create_user(self, user_dto):
-        user = User(**user_dto)
+        """
+        Создает пользователя одним INSERT. Уникальность username и email проверяет база данных,
+        поэтому одновременные регистрации с одинаковыми данными не проходят обе.
+        """
+        password_hash = await self.password_hasher.hash_password(user_dto.get('password'))
+        user = User(**{**user_dto, 'password': password_hash}, password_is_hashed=True)
+        # у нового пользователя нет групп и соцсетей, ответ собирается без повторного чтения из базы
+        user.groups = []
+        user.user_social_networks = []
         self.db.add(user)
-        await self.db.commit()
-        await self.db.refresh(user)
+        try:
+            await self.db.commit()
+        except IntegrityError as e:
+            await self.db.rollback()
+            detail = SIGNUP_CONFLICT_DETAILS.get(self._constraint_name(e))
+            if detail is None:
+                raise
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=detail)
 
         return user
 
+    @staticmethod
+    def _constraint_name(error: IntegrityError) -> str | None:
+        # asyncpg передает имя нарушенного ограничения в исходном исключении драйвера
+        return getattr(error.orig.__cause__, 'constraint_name', None)
+
     async def update_password(self, user_dto: dict) -> User | bool:
-        user = User(**user_dto)
         if (
                 not await self.check_repeated_password(
                     user_dto.get('password'), user_dto.get('repeated_old_password')
                 ) or
-                not await self._check_old_password(user_dto) or
-                user_dto.get('password') == user_dto.get('new_password')  # старый и новый пароль должны отличаться
+                user_dto.get('password') == user_dto.get('new_password') or  # старый и новый пароль должны отличаться
+                not await self._check_old_password(user_dto)
         ):
             return False
 
-        new_password = generate_password_hash(user_dto.get('new_password'))
+        new_password = await self.password_hasher.hash_password(user_dto.get('new_password'))
         await self.db.execute(
             update(User).where(User.username == user_dto.get('username')).values(password=new_password),
         )
         await self.db.commit()
 
-        return user
+        return User(**{**user_dto, 'password': new_password}, password_is_hashed=True)
 
     @staticmethod
     async def check_repeated_password(password: str, repeated_password: str) -> bool:
@@ -110,7 +164,9 @@ class UserService:
     async def _check_old_password(self, user_dto: dict) -> bool:
         result = await self.db.execute(select(User).where(User.username == user_dto.get('username')))
         user = result.scalars().first()
-        old_pass_verified = check_password_hash(user.password, user_dto.get('password'))
+        if not user:
+            return False
+        old_pass_verified = await self.password_hasher.check_password(user.password, user_dto.get('password'))
 
         return bool(old_pass_verified)
 
@@ -141,8 +197,57 @@ class UserService:
         except SQLAlchemyError as e:
             logging.error(e)
 
-    async def put_refresh_session_in_db(self, user_id: str, user_agent: str, decrypted_token: dict) -> None:
-        """Записывает созданный refresh токен в базу данных."""
+    async def get_signin_state(self, username: str, user_agent: str) -> SigninState | None:
+        """
+        Загружает пользователя и состояние его сессий на данном устройстве.
+        Для сессий в Postgres это один запрос к базе данных. Группы и права берутся из кеша claim.
+        """
+        # история входов пишется в фоне, поэтому о входе с устройства судим по открытой refresh сессии
+        in_postgres = isinstance(self.session_storage, PostgresSessionStorage)
+        device_state = PostgresSessionStorage.device_state_columns(user_agent) if in_postgres else ()
+        try:
+            row = (await self.db.execute(
+                select(User, *device_state).
+                where(User.username == username)
+            )).first()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            return None
+
+        if not row:
+            return None
+        if in_postgres:
+            state = DeviceState(row.has_active, row.has_expired, row.has_valid)
+        else:
+            state = await self.session_storage.get_device_state(str(row.User.id), user_agent)
+        return SigninState(
+            user=row.User,
+            device_logged_in=state.has_active,
+            device_session_expired=state.has_expired,
+        )
+
+    async def open_session(
+            self,
+            user_id: str,
+            user_agent: str,
+            decrypted_token: dict,
+            close_device_session: bool = False,
+            close_all_sessions: bool = False,
+    ) -> None:
+        """
+        Закрывает устаревшие сессии пользователя и записывает новый refresh токен.
+        История входа и выхода передается в фоновую запись.
+        """
+        record = self._build_session_record(user_id, user_agent, decrypted_token)
+        if not await self.session_storage.open(record, close_device_session, close_all_sessions):
+            return
+
+        if close_device_session:
+            await self.put_logout_history_in_db(user_id, user_agent)
+        await self.put_login_history_in_db(user_id, user_agent)
+
+    @staticmethod
+    def _build_session_record(user_id: str, user_agent: str, decrypted_token: dict) -> SessionRecord:
         session_dto = json.dumps({
             'user_id': user_id,
             'refresh_jti': decrypted_token['jti'],
@@ -151,189 +256,123 @@ class UserService:
             'is_active': True
         })
         data = RefreshToDb.model_validate_json(session_dto)
-        try:
-            row = RefreshSession(**data.model_dump())
-            self.db.add(row)
-            await self.db.commit()
-            await self.db.refresh(row)
-        except SQLAlchemyError as e:
-            logging.error(e)
-            await self.db.rollback()
+        return SessionRecord(
+            user_id=str(data.user_id),
+            user_agent=data.user_agent,
+            refresh_jti=data.refresh_jti,
+            expired_at=data.expired_at,
+        )
 
-    async def check_if_session_exist(self, user_id: str, user_agent: str) -> bool:
-        """Проверяет существование сессии."""
-        session_dto = json.dumps({
-            'user_id': user_id,
-            'user_agent': user_agent,
-        })
-        data = RefreshDelDb.model_validate_json(session_dto)
-        try:
-            stmt = select(RefreshSession). \
-                where(
-                User.id == data.user_id,
-                    RefreshSession.user_agent == data.user_agent,
-                    RefreshSession.is_active.is_(True),
-                )
-            result = await self.db.execute(stmt)
-            row = result.scalars().first()
-            return True if row else False
-        except SQLAlchemyError as e:
-            logging.error(e)
+    async def rotate_refresh_session(
+            self,
+            user_id: str,
+            user_agent: str,
+            refresh_jti: str,
+            new_decrypted_token: dict,
+    ) -> RotationResult:
+        """
+        Заменяет сессию предъявленного refresh токена на новую. Если токен уже был заменен ранее,
+        считает это повторным использованием украденного токена и закрывает все сессии пользователя.
+        """
+        result = await self.session_storage.rotate(
+            refresh_jti,
+            self._build_session_record(user_id, user_agent, new_decrypted_token)
+        )
+        if result is RotationResult.REUSED:
+            logging.warning('Refresh token reuse detected for user %s, all sessions revoked', user_id)
+        return result
 
     async def del_refresh_session_in_db(self, user_id: str, user_agent: str) -> None:
-        """Помечает refresh токен как удаленный в базе данных."""
+        """Закрывает сессию пользователя на данном устройстве."""
         session_dto = json.dumps({
             'user_id': user_id,
             'user_agent': user_agent,
         })
         data = RefreshDelDb.model_validate_json(session_dto)
-        try:
-            stmt = update(RefreshSession). \
-                values(is_active=False). \
-                where(
-                    User.id == data.user_id,
-                    RefreshSession.user_agent == data.user_agent,
-                    RefreshSession.is_active.is_(True),
-                )
-            await self.db.execute(stmt)
-            await self.db.commit()
-        except SQLAlchemyError as e:
-            logging.error(e)
-            await self.db.rollback()
+        await self.session_storage.close_device(str(data.user_id), data.user_agent)
 
     async def del_all_refresh_sessions_in_db(self, user: User) -> None:
-        try:
-            await self.db.execute(
-                update(RefreshSession).where(RefreshSession.user_id == user.id).values(is_active=False),
-            )
-            await self.db.commit()
-        except SQLAlchemyError as e:
-            logging.error(e)
+        await self.session_storage.close_all(str(user.id))
 
     async def put_login_history_in_db(self, user_id: str, user_agent: str) -> None:
-        """Записывает историю входа в аккаунт в базу данных."""
-        history_dto = json.dumps({
-            'user_id': user_id,
-            'user_agent': user_agent,
-        })
-        data = UserLoginHistoryInDb.model_validate_json(history_dto)
-        try:
-            row = UserLoginHistory(**data.model_dump())
-            self.db.add(row)
-            await self.db.commit()
-            await self.db.refresh(row)
-        except SQLAlchemyError as e:
-            logging.error(e)
-            await self.db.rollback()
-
-    async def check_unexpected_refresh_token_freshness(self, user_id: str, user_agent: str):
-        now = datetime.now()
-        formatted_datetime = now.replace(microsecond=0)
-        result = (await self.db.execute(
-            select(RefreshSession).where(
-                and_(
-                    RefreshSession.user_id == user_id,
-                    RefreshSession.user_agent == user_agent,
-                    RefreshSession.expired_at < formatted_datetime,
-                    RefreshSession.is_active.is_(True)
-                )
-            )
-        )).scalars().first()
-        return result
+        """Передает запись истории входа в аккаунт в фоновую запись."""
+        data = UserLoginHistoryInDb(user_id=user_id, user_agent=user_agent)
+        self.audit_writer.log_login(str(data.user_id), data.user_agent)
 
     async def check_if_user_login(self, user_id: str, user_agent: str) -> bool:
-        """Проверяет существования активной записи о входе пользователя с данного устройства."""
+        """
+        Проверяет наличие действующей сессии пользователя на данном устройстве.
+        Если хранилище сессий недоступно, считает, что сессии нет: вход все равно откроет новую.
+        """
         try:
-            stmt = select(UserLoginHistory). \
-                where(
-                    UserLoginHistory.user_id == user_id,
-                    UserLoginHistory.user_agent == user_agent,
-                    UserLoginHistory.logout_at.is_(None))
-
-            result = await self.db.execute(stmt)
-            active_login_history = result.scalars().first()
-
-            return True if active_login_history else False
-        except SQLAlchemyError as e:
+            return (await self.session_storage.get_device_state(user_id, user_agent)).has_valid
+        except (SQLAlchemyError, RedisError) as e:
             logging.error(e)
+            return False
 
     async def put_logout_history_in_db(self, user_id: str, user_agent: str) -> None:
-        """Записывает историю выхода из аккаунта в базу данных."""
-        history_dto = json.dumps({
-            'user_id': user_id,
-            'user_agent': user_agent,
-            'logout_at': datetime.now().isoformat()
-        })
-        data = UserLogoutHistoryInDb.model_validate_json(history_dto)
-        try:
-            stmt = update(UserLoginHistory). \
-                values(logout_at=data.logout_at). \
-                where(
-                    User.id == data.user_id,
-                    UserLoginHistory.user_agent == data.user_agent
-                )
-
-            await self.db.execute(stmt)
-            await self.db.commit()
-        except SQLAlchemyError as e:
-            logging.error(e)
-            await self.db.rollback()
+        """Передает запись истории выхода из аккаунта в фоновую запись."""
+        self.audit_writer.log_logout(user_id, user_agent)
 
     async def count_refresh_sessions(self, user_id: str) -> int:
         """Возвращает число открытых сессий пользователя."""
-        try:
-            result = await self.db.execute(select(RefreshSession).where(
-                RefreshSession.user_id == user_id,
-                RefreshSession.is_active.is_(True),
-                ))
-            sessions = result.scalars().all()
-            return len(sessions)
-        except SQLAlchemyError as e:
-            logging.error(e)
-
-    async def calc_previous_and_next_pages(self, page_number, page_size, count):
-        previous = page_number - 1 if page_number != 1 else None
-        next_page = page_number + 1 if count // (page_size * page_number) > 1 else None
-        return previous, next_page
+        return await self.session_storage.count(user_id)
 
     async def get_login_history(
             self,
             user_id: uuid,
             page_size: int,
-            page_number: int,
-    ) -> list[dict[str, UUID | datetime | str]]:
-
-        offset_min, offset_max = await self.calculate_offset(page_size, page_number)
+            cursor: str | None = None,
+    ) -> tuple[list[dict[str, UUID | datetime | str]], str | None]:
+        """
+        Возвращает страницу истории входов, начиная с самых новых записей, и курсор следующей страницы.
+        Страницы строятся по ключу (login_at, id), поэтому стоимость запроса не зависит от глубины страницы.
+        """
+        stmt = select(
+            UserLoginHistory.id,
+            UserLoginHistory.user_id,
+            UserLoginHistory.user_agent,
+            UserLoginHistory.login_at,
+        ).where(
+            UserLoginHistory.user_id == str(user_id)
+        ).order_by(
+            UserLoginHistory.login_at.desc(),
+            UserLoginHistory.id.desc()
+        ).limit(page_size + 1)
+
+        if cursor:
+            login_at, history_id = self._decode_history_cursor(cursor)
+            stmt = stmt.where(
+                tuple_(UserLoginHistory.login_at, UserLoginHistory.id) < tuple_(login_at, history_id)
+            )
 
-        result = await self.db.execute(
-            select(UserLoginHistory).
-            where(UserLoginHistory.user_id == str(user_id)).
-            order_by(UserLoginHistory.id).
-            offset(offset_min).
-            limit(offset_max - offset_min)
-        )
-        history = result.scalars().all()
+        rows = (await self.db.execute(stmt)).all()
+        # лишняя строка показывает, что есть следующая страница, без подсчета всех записей
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
 
         history_dto = [{
-            'user_id': item.user_id,
-            'user_agent': item.user_agent,
-            'login_at': item.login_at,
-        } for item in history]
+            'user_id': row.user_id,
+            'user_agent': row.user_agent,
+            'login_at': row.login_at,
+        } for row in rows]
+        next_cursor = self._encode_history_cursor(rows[-1].login_at, rows[-1].id) if has_more else None
 
-        return history_dto
+        return history_dto, next_cursor
 
-    async def get_login_history_count(self, user_id: uuid):
-        result = await self.db.execute(
-            select(func.count(UserLoginHistory.id)).
-            where(UserLoginHistory.user_id == str(user_id))
-        )
-        return result.scalar()
-
-    async def calculate_offset(self, page_size: int, page_number: int) -> tuple[int, int]:
-        offset_min = (page_number - 1) * page_size
-        offset_max = offset_min + page_size
+    @staticmethod
+    def _encode_history_cursor(login_at: datetime, history_id: uuid.UUID) -> str:
+        payload = json.dumps([login_at.isoformat(), str(history_id)]).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
 
-        return offset_min, offset_max
+    @staticmethod
+    def _decode_history_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            login_at, history_id = json.loads(payload)
+            return datetime.fromisoformat(login_at), uuid.UUID(history_id)
+        except (binascii.Error, ValueError, TypeError):
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='Invalid cursor')
 
     async def check_if_social_exist(self, social_name: str, social_id: str) -> User | None:
         """Проверяет существование аккаунта в базе данных на основе id пользователя в социальной сети."""
@@ -351,6 +390,17 @@ class UserService:
         except SQLAlchemyError as e:
             logging.error(e)
 
+    async def get_user_social_networks(self, user_id: UUID) -> list[UserSocialNetwork]:
+        """Возвращает привязанные к пользователю аккаунты социальных сетей."""
+        try:
+            result = await self.db.execute(
+                select(UserSocialNetwork).where(UserSocialNetwork.user_id == user_id)
+            )
+            return list(result.scalars().all())
+        except SQLAlchemyError as e:
+            logging.error(e)
+            return []
+
     @staticmethod
     def _generate_random_password() -> str:
         alphabet = string.ascii_letters + string.digits
@@ -373,7 +423,8 @@ class UserService:
             raise ValueError(f'Unknown social name {social_name}')
 
         data = UserCreate.model_validate_json(user_dto)
-        user = User(**data.model_dump())
+        password_hash = await self.password_hasher.hash_password(data.password)
+        user = User(**{**data.model_dump(), 'password': password_hash}, password_is_hashed=True)
         try:
             self.db.add(user)
             await self.db.commit()
@@ -427,7 +478,17 @@ class UserService:
 def get_user_service(
         no_sql: RedisStorage = Depends(get_nosql_storage),
         db: AsyncSession = Depends(get_session),
+        password_hasher: PasswordHasher = Depends(get_password_hasher),
+        claims_handler: ClaimsHandler = Depends(get_claims_handler),
+        token_denylist: TokenDenylist = Depends(get_token_denylist),
+        audit_writer: AuditWriter = Depends(get_audit_writer),
 ) -> UserService:
-    token_handler = TokenHandler(no_sql, CACHE_EXPIRE_IN_SECONDS)
+    token_handler = TokenHandler(no_sql, CACHE_EXPIRE_IN_SECONDS, token_denylist)
+    if settings.SESSION_STORAGE == 'redis':
+        session_storage = RedisSessionStorage(no_sql, REFRESH_SESSION_EXPIRE_IN_SECONDS)
+    else:
+        session_storage = PostgresSessionStorage(
+            db, SessionCounter(no_sql, settings.SESSION_COUNTER_RECONCILE_SECONDS)
+        )
 
-    return UserService(token_handler, db)
+    return UserService(token_handler, db, password_hasher, claims_handler, session_storage, audit_writer)
@@ -381,3 +381,29 @@ async def test_permission_delete_does_not_exists(
 	)
 
 	assert result['status'] == expected_response['status']
+
+
+@pytest.mark.parametrize(
+	'groups_permissions, expected_status',
+	[
+		([{'group': 'auditors', 'permissions': ['read_permissions']}], 200),
+		([{'group': 'auditors', 'permissions': []}, {'group': 'admins', 'permissions': ['*.*']}], 200),
+		([{'group': 'auditors', 'permissions': ['create_permission']}], 403),
+	]
+)
+async def test_groups_permissions_claim(
+	create_fake_tokens,
+	make_get_request,
+	groups_permissions,
+	expected_status
+):
+	"""Права проверяются по claim groups_permissions в формате, который выдает signin."""
+	tokens = await create_fake_tokens(
+		str(uuid.uuid4()), 'auditor', {'groups_permissions': groups_permissions}
+	)
+
+	result = await make_get_request(
+		'permissions/', {}, {'Authorization': f'Bearer {tokens["access_token"]}'}
+	)
+
+	assert result['status'] == expected_status
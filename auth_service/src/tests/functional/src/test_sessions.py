@@ -0,0 +1,144 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.redis import RedisStorage, RotationResult, SessionRecord
+from db.session_outbox import SESSION_EVENTS_STREAM, SessionOutboxWriter, SessionsClosed, decode_event
+from db.sessions import RedisSessionStorage
+from models.entity import RefreshSession, User
+from ..postgres_fixtures import async_session
+from ..settings import test_settings
+
+
+EXPIRED_TIME = 60
+USER_AGENT = 'pytest'
+
+
+@pytest_asyncio.fixture(scope='function')
+async def no_sql() -> RedisStorage:
+	storage = RedisStorage(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT, db=0, decode_responses=True)
+	await storage.delete(SESSION_EVENTS_STREAM)
+	yield storage
+	await storage.delete(SESSION_EVENTS_STREAM)
+	await storage.close()
+
+
+@pytest_asyncio.fixture(scope='function')
+async def user(init_session: AsyncSession) -> User:
+	user = User('session_user', 'password123', 'session_user', 'session_user', 'session_user')
+	init_session.add(user)
+	await init_session.commit()
+	await init_session.refresh(user)
+	return user
+
+
+@pytest_asyncio.fixture(scope='function')
+async def session_storage(no_sql: RedisStorage, user: User) -> RedisSessionStorage:
+	storage = RedisSessionStorage(no_sql, EXPIRED_TIME)
+	yield storage
+	await no_sql.delete(storage.key(str(user.id)))
+
+
+def make_record(user: User, user_agent: str = USER_AGENT) -> SessionRecord:
+	return SessionRecord(
+		user_id=str(user.id),
+		user_agent=user_agent,
+		refresh_jti=str(uuid.uuid4()),
+		expired_at=(datetime.now() + timedelta(seconds=EXPIRED_TIME)).replace(microsecond=0),
+	)
+
+
+def make_writer(no_sql: RedisStorage) -> SessionOutboxWriter:
+	return SessionOutboxWriter(
+		no_sql, async_session, batch_size=100, poll_interval=0.01, retry_interval=0.01, lease_seconds=5
+	)
+
+
+async def stream_events(no_sql: RedisStorage) -> list:
+	return [decode_event(fields['event']) for _, fields in await no_sql.xrange(SESSION_EVENTS_STREAM, 100)]
+
+
+async def db_sessions(init_session: AsyncSession, user: User) -> dict[str, RefreshSession]:
+	init_session.expire_all()
+	rows = (await init_session.execute(select(RefreshSession).where(RefreshSession.user_id == user.id))).scalars()
+	return {row.refresh_jti: row for row in rows}
+
+
+async def test_open_and_close_device(session_storage: RedisSessionStorage, no_sql: RedisStorage, user: User):
+	record = make_record(user)
+	other = make_record(user, 'other device')
+
+	await session_storage.open(record)
+	await session_storage.open(other)
+	state = await session_storage.get_device_state(str(user.id), USER_AGENT)
+	assert state.has_active and state.has_valid and not state.has_expired
+	assert await session_storage.count(str(user.id)) == 2
+
+	await session_storage.close_device(str(user.id), USER_AGENT)
+	assert not (await session_storage.get_device_state(str(user.id), USER_AGENT)).has_active
+	assert await session_storage.count(str(user.id)) == 1
+
+	assert await stream_events(no_sql) == [
+		record, other, SessionsClosed(str(user.id), user_agent=USER_AGENT)
+	], 'Каждое изменение сессий должно попадать в поток событий'
+
+
+async def test_rotate_and_reuse(session_storage: RedisSessionStorage, user: User):
+	record = make_record(user)
+	await session_storage.open(record)
+
+	rotated = make_record(user)
+	assert await session_storage.rotate(record.refresh_jti, rotated) is RotationResult.ROTATED
+	assert await session_storage.count(str(user.id)) == 1
+
+	assert (
+		await session_storage.rotate(record.refresh_jti, make_record(user)) is RotationResult.REUSED
+	), 'Повторное предъявление замененного токена должно считаться кражей'
+	assert await session_storage.count(str(user.id)) == 0
+
+	assert await session_storage.rotate(str(uuid.uuid4()), make_record(user)) is RotationResult.NOT_FOUND
+
+
+async def test_writer_applies_events_in_order(
+	session_storage: RedisSessionStorage,
+	no_sql: RedisStorage,
+	init_session: AsyncSession,
+	user: User
+):
+	record = make_record(user)
+	other = make_record(user, 'other device')
+	await session_storage.open(record)
+	await session_storage.open(other)
+	rotated = make_record(user)
+	await session_storage.rotate(record.refresh_jti, rotated)
+	await session_storage.close_device(str(user.id), 'other device')
+
+	await make_writer(no_sql).drain(timeout=1)
+
+	rows = await db_sessions(init_session, user)
+	assert not rows[record.refresh_jti].is_active and rows[record.refresh_jti].rotated_at is not None
+	assert rows[rotated.refresh_jti].is_active
+	assert not rows[other.refresh_jti].is_active
+	assert await stream_events(no_sql) == [], 'Записанные события должны удаляться из потока'
+
+
+async def test_close_all_written_to_postgres(
+	session_storage: RedisSessionStorage,
+	no_sql: RedisStorage,
+	init_session: AsyncSession,
+	user: User
+):
+	"""Закрытие всех сессий доходит до Postgres, и restore-refresh-sessions их не вернет."""
+	writer = make_writer(no_sql)
+	await session_storage.open(make_record(user))
+	await session_storage.open(make_record(user, 'other device'))
+	await writer.drain(timeout=1)
+
+	await session_storage.close_all(str(user.id))
+	await writer.drain(timeout=1)
+
+	rows = await db_sessions(init_session, user)
+	assert len(rows) == 2 and not any(row.is_active for row in rows.values())
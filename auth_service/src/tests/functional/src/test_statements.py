@@ -0,0 +1,142 @@
+import uuid
+
+import httpx
+import pytest_asyncio
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import main
+from db.query_stats import QueryStats
+from models.entity import User, Group, Permission, UserLoginHistory
+
+
+USER_AGENT = 'statements-test-agent'
+SUPERUSER_CLAIMS = {'groups_permissions': [{'group': 'superuser', 'permissions': ['*.*']}]}
+
+
+class StatementCounter:
+	"""
+	Выполняет HTTP запросы к приложению в процессе теста и возвращает число SQL запросов,
+	посчитанное middleware сервиса: учитываются зависимости, middleware и обработчики маршрутов.
+	"""
+
+	def __init__(self, client: httpx.AsyncClient) -> None:
+		self.client = client
+		self.counts: list[int] = []
+
+	def record(self, request: Request, response: Response, query_stats: QueryStats) -> None:
+		self.counts.append(query_stats.count)
+
+	async def request(self, method: str, url: str, **kwargs) -> tuple[httpx.Response, int]:
+		self.counts.clear()
+		response = await self.client.request(method, url, **kwargs)
+		count, = self.counts
+		return response, count
+
+
+@pytest_asyncio.fixture(scope='function')
+async def api(monkeypatch) -> StatementCounter:
+	record_query_stats = main.record_query_stats
+	transport = httpx.ASGITransport(app=main.app)
+	headers = {'X-Request-Id': str(uuid.uuid4()), 'User-Agent': USER_AGENT}
+	async with main.lifespan(main.app), httpx.AsyncClient(
+		transport=transport, base_url='http://auth', headers=headers
+	) as client:
+		counter = StatementCounter(client)
+
+		def record(request: Request, response: Response, query_stats: QueryStats) -> None:
+			counter.record(request, response, query_stats)
+			record_query_stats(request, response, query_stats)
+
+		monkeypatch.setattr(main, 'record_query_stats', record)
+		yield counter
+
+
+async def create_user(session: AsyncSession) -> User:
+	user = User('user', 'password', 'first', 'last', 'user@mail.ru')
+	session.add(user)
+	await session.commit()
+	return user
+
+
+async def create_groups(session: AsyncSession, count: int) -> list[Group]:
+	groups = [
+		Group(f'group_{i}', [Permission(f'permission_{i}_{j}') for j in range(3)])
+		for i in range(count)
+	]
+	session.add_all(groups)
+	await session.commit()
+	return groups
+
+
+async def superuser_headers(create_fake_tokens) -> dict:
+	tokens = await create_fake_tokens(str(uuid.uuid4()), 'superuser', SUPERUSER_CLAIMS)
+	return {'Authorization': f'Bearer {tokens["access_token"]}'}
+
+
+async def test_signin_statements(init_session, api):
+	await create_user(init_session)
+
+	response, statements = await api.request(
+		'POST', '/auth/api/v1/users/signin', json={'username': 'user', 'password': 'password'}
+	)
+
+	assert response.status_code == 200
+	# состояние входа, права пользователя и число сессий при промахе кешей, запись новой сессии
+	assert statements <= 4
+
+
+async def test_get_history_statements(init_session, api):
+	user = await create_user(init_session)
+	init_session.add_all([UserLoginHistory(user_id=user.id, user_agent=USER_AGENT) for _ in range(5)])
+	await init_session.commit()
+
+	response, statements = await api.request(
+		'GET', f'/auth/api/v1/users/{user.id}/get_history', params={'page_size': 2}
+	)
+
+	assert response.status_code == 200
+	assert len(response.json()['items']) == 2
+	# страница по ключу одним запросом, без подсчета общего числа записей
+	assert statements == 1
+
+
+async def test_read_groups_statements(init_session, api, create_fake_tokens):
+	await create_groups(init_session, 5)
+
+	response, statements = await api.request(
+		'GET', '/auth/api/v1/groups/', headers=await superuser_headers(create_fake_tokens)
+	)
+
+	assert response.status_code == 200
+	assert len(response.json()) == 5
+	# права проверяются по claims токена; группы и права всех групп одним дополнительным запросом
+	assert statements == 2
+
+
+async def test_add_group_to_user_statements(init_session, api, create_fake_tokens):
+	user = await create_user(init_session)
+	group, = await create_groups(init_session, 1)
+
+	response, statements = await api.request(
+		'POST',
+		f'/auth/api/v1/users/{user.id}/group',
+		json={'group_id': str(group.id)},
+		headers=await superuser_headers(create_fake_tokens)
+	)
+
+	assert response.status_code == 200
+	# пользователь, его группы, добавляемая группа и запись связи
+	assert statements == 4
+
+
+async def test_delete_group_statements(init_session, api, create_fake_tokens):
+	group, = await create_groups(init_session, 1)
+
+	response, statements = await api.request(
+		'DELETE', f'/auth/api/v1/groups/{group.id}', headers=await superuser_headers(create_fake_tokens)
+	)
+
+	assert response.status_code == 200
+	# пользователи группы для инвалидации claims и удаление группы
+	assert statements == 2
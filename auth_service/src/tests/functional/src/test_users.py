@@ -1,3 +1,4 @@
+import asyncio
 from http import HTTPStatus
 
 import pytest
@@ -7,6 +8,16 @@ from http import HTTPStatus
 from models.entity import User, RefreshSession, UserLoginHistory
 
 
+async def get_history_when_written(make_get_request, user_id, params: dict, items_count: int, attempts: int = 30):
+    """История входов пишется в фоне, поэтому ждем, пока в ней появится нужное число записей."""
+    for _ in range(attempts):
+        result = await make_get_request(f'users/{user_id}/get_history', {'page_size': 100})
+        if len(result.get('body').get('items')) >= items_count:
+            break
+        await asyncio.sleep(0.1)
+    return await make_get_request(f'users/{user_id}/get_history', params)
+
+
 @pytest.mark.parametrize(
     'user_data, expected_response, status_code',
     [
@@ -77,6 +88,20 @@ async def test_registrations_user(
                 },
                 HTTPStatus.BAD_REQUEST,
         ),
+        (
+                {
+                    "username": "string2",
+                    "password": "stringst",
+                    "repeated_password": "stringst1",  # пароли не совпадают
+                    "first_name": "string",
+                    "last_name": "string",
+                    "email": "string2"
+                },
+                {
+                    "detail": "Некорректное имя пользователя или пароль",
+                },
+                HTTPStatus.BAD_REQUEST,
+        ),
     ]
 )
 async def test_negative_registrations_user(
@@ -216,7 +241,7 @@ async def test_get_one_history_user(
 
     user_id = created_user.get('body').get('id')
 
-    result = await make_get_request(f'users/{user_id}/get_history', {})
+    result = await get_history_when_written(make_get_request, user_id, {}, 1)
 
     assert len(result.get('body').get('items')) == 1
     assert set(result.get('body').get('items')[0].keys()) == {'login_at', 'user_agent', 'user_id'}
@@ -246,6 +271,39 @@ async def test_get_history_user(
     assert len(result.get('body').get('items')) == 1
 
 
+async def test_get_history_user_cursor(
+    make_post_request,
+    make_get_request,
+    create_fake_login,
+):
+    fake_data = await create_fake_login()
+    await make_post_request(
+        'users/logout',
+        headers={
+            'Authorization': f'Bearer {fake_data["access_token"]}',
+            'User-Agent': fake_data['user_agent'],
+        }
+    )
+    signin_data = {
+        "username": fake_data.get('user').username,
+        "password": '123456789',
+    }
+    await make_post_request('users/signin', signin_data)
+    user_id = fake_data.get("user").id
+
+    first_page = await get_history_when_written(make_get_request, user_id, {'page_size': 1}, 2)
+    assert first_page.get('body').get('has_more') is True
+
+    second_page = await make_get_request(
+        f'users/{user_id}/get_history',
+        {'page_size': 1, 'cursor': first_page.get('body').get('next_cursor')}
+    )
+    assert len(second_page.get('body').get('items')) == 1
+    assert second_page.get('body').get('has_more') is False
+    assert second_page.get('body').get('next_cursor') is None
+    assert second_page.get('body').get('items')[0]['login_at'] < first_page.get('body').get('items')[0]['login_at']
+
+
 @pytest.mark.parametrize(
     'user_data, expected_response, status_code',
     [
@@ -522,3 +580,28 @@ async def test_negative_refresh_tokens(
 
     assert result.get('body').keys() == expected_response.keys()
     assert result.get('status') == status_code
+
+
+async def test_refresh_token_reuse_revokes_sessions(
+        create_fake_login,
+        make_post_request,
+):
+    fake_data = await create_fake_login()
+    headers = {
+        'Authorization': f'Bearer {fake_data["refresh_token"]}',
+        'User-Agent': fake_data['user_agent'],
+    }
+    first = await make_post_request('users/refresh_tokens', headers=headers)
+    assert first.get('status') == HTTPStatus.OK
+
+    reused = await make_post_request('users/refresh_tokens', headers=headers)
+    assert reused.get('status') == HTTPStatus.UNAUTHORIZED
+
+    rotated = await make_post_request(
+        'users/refresh_tokens',
+        headers={
+            'Authorization': f'Bearer {first["body"]["refresh_token"]}',
+            'User-Agent': fake_data['user_agent'],
+        }
+    )
+    assert rotated.get('status') == HTTPStatus.UNAUTHORIZED
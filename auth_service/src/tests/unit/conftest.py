@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from core import keyring
+from core.keyring import KeyRing, generate_key
+
+
+@pytest.fixture(scope='session')
+def keys_dir(tmp_path_factory) -> Path:
+	path = tmp_path_factory.mktemp('jwt_keys')
+	generate_key(path, 'test-key')
+	return path
+
+
+@pytest.fixture(autouse=True)
+def test_keyring(keys_dir: Path, monkeypatch) -> KeyRing:
+	"""Токены в тестах подписываются временным ключом, а не ключами из JWT_KEYS_DIR."""
+	ring = KeyRing.load(keys_dir)
+	monkeypatch.setattr(keyring, 'keyring', ring)
+	return ring
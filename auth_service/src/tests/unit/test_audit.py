@@ -0,0 +1,76 @@
+import asyncio
+
+from services.audit import AuditWriter, LoginEvent
+
+
+class FakeSession:
+	def __init__(self, database: 'FakeDatabase') -> None:
+		self.database = database
+
+	async def __aenter__(self) -> 'FakeSession':
+		await self.database.writable.wait()
+		return self
+
+	async def __aexit__(self, *args) -> None:
+		pass
+
+	async def execute(self, statement, params=None) -> None:
+		if self.database.errors:
+			raise self.database.errors.pop(0)
+
+	async def commit(self) -> None:
+		self.database.commits += 1
+
+
+class FakeDatabase:
+	def __init__(self, errors: list[Exception] = ()) -> None:
+		self.errors = list(errors)
+		self.commits = 0
+		# пока не установлен, запись пачки ждет: так очередь можно заполнить
+		self.writable = asyncio.Event()
+		self.writable.set()
+
+	def session_factory(self) -> FakeSession:
+		return FakeSession(self)
+
+
+async def test_unexpected_error_does_not_stop_writer():
+	"""Ошибка вне SQLAlchemy (например, OSError драйвера) теряет одну пачку, но не останавливает запись."""
+	database = FakeDatabase(errors=[OSError('connection reset')])
+	writer = AuditWriter(database.session_factory, batch_size=1, flush_interval=0.01, max_queue_size=10)
+	await writer.start()
+
+	writer.log_login('user', 'agent')
+	writer.log_login('user', 'agent')
+	await writer.stop()
+
+	assert database.commits == 1
+	assert writer._task.done() and writer._task.exception() is None
+
+
+async def test_stop_with_full_queue_does_not_hang():
+	database = FakeDatabase()
+	database.writable.clear()
+	writer = AuditWriter(database.session_factory, batch_size=1, flush_interval=0.01, max_queue_size=1)
+	await writer.start()
+	writer.log_login('user', 'agent')
+	await asyncio.sleep(0.01)
+	writer.log_login('user', 'agent')
+	assert writer.queue.full()
+
+	await asyncio.wait_for(writer.stop(timeout=0.05), 1)
+
+	assert writer._task.cancelled()
+	assert database.commits == 0
+
+
+async def test_stop_writes_queued_events():
+	database = FakeDatabase()
+	writer = AuditWriter(database.session_factory, batch_size=10, flush_interval=60, max_queue_size=10)
+	await writer.start()
+	for _ in range(3):
+		writer._put(LoginEvent('user', 'agent'))
+
+	await writer.stop()
+
+	assert database.commits == 1
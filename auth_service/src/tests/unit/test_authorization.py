@@ -0,0 +1,107 @@
+from http import HTTPStatus
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from async_fastapi_jwt_auth.exceptions import AuthJWTException
+
+from core.config import JWTSettings
+from services.auth_jwt import KeyringAuthJWT
+from services.authorization import AuthorizationChecker, PermissionMatcher, compile_permissions
+
+
+@KeyringAuthJWT.load_config
+def get_config():
+	return JWTSettings()
+
+
+@pytest.mark.parametrize(
+	'permissions, required, expected',
+	[
+		(['read_permissions'], 'read_permissions', True),
+		(['read_permissions'], 'create_permission', False),
+		(['films.*'], 'films.read', True),
+		(['films.*'], 'films.comments.delete', True),
+		(['films.*'], 'films', False),
+		(['films.*'], 'filmsx.read', False),
+		(['films.comments.*'], 'films.read', False),
+		(['*'], 'anything', True),
+		(['*.*'], 'films.read', True),
+		([], 'films.read', False),
+	]
+)
+def test_permission_matcher(permissions, required, expected):
+	assert PermissionMatcher(permissions).matches(required) is expected
+
+
+def test_matches_any():
+	matcher = PermissionMatcher(['films.read', 'genres.*'])
+
+	assert matcher.matches_any(['films.delete', 'genres.update'])
+	assert not matcher.matches_any(['films.delete', 'persons.read'])
+	assert not matcher.matches_any([])
+
+
+def test_compile_permissions_reuses_matcher():
+	assert compile_permissions(['b', 'a']) is compile_permissions(('a', 'b', 'a'))
+
+
+def make_app() -> FastAPI:
+	app = FastAPI()
+
+	@app.exception_handler(AuthJWTException)
+	def authjwt_exception_handler(request: Request, exc: AuthJWTException):
+		return JSONResponse(status_code=exc.status_code, content={'detail': exc.message})
+
+	@app.get('/films')
+	async def read_films(check_authorized: AuthorizationChecker = Depends(AuthorizationChecker)):
+		if not await check_authorized(['films.read']):
+			raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail='Not enough rights')
+		# повторная проверка в том же запросе берет claims из request.state
+		return {'delete': await check_authorized(['films.delete'])}
+
+	return app
+
+
+async def request_films(token: str) -> httpx.Response:
+	async with httpx.AsyncClient(transport=httpx.ASGITransport(app=make_app()), base_url='http://test') as client:
+		return await client.get('/films', headers={'Authorization': f'Bearer {token}'})
+
+
+@pytest.mark.parametrize(
+	'groups_permissions, expected_status, expected_body',
+	[
+		(
+			[{'group': 'viewers', 'permissions': ['films.read']}],
+			HTTPStatus.OK, {'delete': False}
+		),
+		(
+			[{'group': 'viewers', 'permissions': []}, {'group': 'editors', 'permissions': ['films.*']}],
+			HTTPStatus.OK, {'delete': True}
+		),
+		(
+			[{'group': 'viewers', 'permissions': ['genres.read']}],
+			HTTPStatus.FORBIDDEN, {'detail': 'Not enough rights'}
+		),
+		([], HTTPStatus.FORBIDDEN, {'detail': 'Not enough rights'}),
+	]
+)
+async def test_groups_permissions_claim(groups_permissions, expected_status, expected_body):
+	"""Права берутся из claim groups_permissions в том виде, в котором его выдает signin."""
+	token = await KeyringAuthJWT().create_access_token(
+		subject='user', user_claims={'user_id': 'id', 'groups_permissions': groups_permissions}
+	)
+
+	response = await request_films(token)
+
+	assert response.status_code == expected_status
+	assert response.json() == expected_body
+
+
+async def test_refresh_token_is_rejected():
+	token = await KeyringAuthJWT().create_refresh_token(subject='user', user_claims={'groups_permissions': []})
+
+	response = await request_films(token)
+
+	assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
@@ -0,0 +1,122 @@
+import asyncio
+
+from db.denylist import DENYLIST_CHANNEL, TokenDenylist
+from db.lru import LRUCache
+from db.storage import CLAIMS_CHANNEL, INVALIDATE_CLAIMS_SCRIPT, PUT_CLAIMS_SCRIPT, ClaimsHandler
+
+
+CLAIMS = [{'group': 'admins', 'permissions': ['*.*']}]
+
+
+class FakeRedis:
+	"""Redis в памяти: скрипты ClaimsHandler выполняются их эквивалентом на Python."""
+
+	def __init__(self) -> None:
+		self.data: dict[str, str] = {}
+		self.published: list[tuple[str, str]] = []
+		self.messages: asyncio.Queue = asyncio.Queue()
+
+	async def get(self, key: str) -> str | None:
+		return self.data.get(key)
+
+	async def eval(self, script: str, keys: list[str], args: list) -> int | None:
+		if script == PUT_CLAIMS_SCRIPT:
+			if self.data.get(keys[1], '0') != args[0]:
+				return 0
+			self.data[keys[0]] = args[1]
+			return 1
+		if script == INVALIDATE_CLAIMS_SCRIPT:
+			for key, generation_key in zip(keys[::2], keys[1::2]):
+				self.data.pop(key, None)
+				self.data[generation_key] = str(int(self.data.get(generation_key, '0')) + 1)
+			return None
+		raise AssertionError('unexpected script')
+
+	async def publish(self, channel: str, message: str) -> None:
+		self.published.append((channel, message))
+		await self.messages.put({'type': 'message', 'channel': channel, 'data': message})
+
+	async def scan_keys(self, match: str):
+		for key in []:
+			yield key
+
+	def pubsub(self) -> 'FakePubSub':
+		return FakePubSub(self.messages)
+
+
+class FakePubSub:
+	def __init__(self, messages: asyncio.Queue) -> None:
+		self.messages = messages
+		self.channels: tuple[str, ...] = ()
+
+	async def subscribe(self, *channels: str) -> None:
+		self.channels = channels
+
+	async def listen(self):
+		while True:
+			yield await self.messages.get()
+
+	async def aclose(self) -> None:
+		pass
+
+
+def make_handler(no_sql: FakeRedis) -> ClaimsHandler:
+	return ClaimsHandler(no_sql, LRUCache(maxsize=10, ttl=60), 3600)
+
+
+async def test_put_and_get_claims():
+	no_sql = FakeRedis()
+	handler = make_handler(no_sql)
+
+	assert await handler.put_claims('user', CLAIMS, await handler.get_generation('user'))
+	assert await make_handler(no_sql).get_claims('user') == CLAIMS, 'Claims должны читаться из Redis'
+
+
+async def test_stale_put_does_not_overwrite_invalidation():
+	"""Claims, загруженные до изменения прав, не записываются после инвалидации."""
+	no_sql = FakeRedis()
+	handler = make_handler(no_sql)
+
+	generation = await handler.get_generation('user')
+	await make_handler(no_sql).invalidate(['user'])
+
+	assert not await handler.put_claims('user', CLAIMS, generation)
+	assert await handler.get_claims('user') is None, 'Устаревшие claims не должны оставаться ни в Redis, ни локально'
+
+	assert await handler.put_claims('user', CLAIMS, await handler.get_generation('user'))
+
+
+async def test_invalidation_reaches_other_workers():
+	no_sql = FakeRedis()
+	worker, other_worker = make_handler(no_sql), make_handler(no_sql)
+	await worker.put_claims('user', CLAIMS, '0')
+	assert await other_worker.get_claims('user') == CLAIMS
+
+	await worker.invalidate(['user', 'another'])
+
+	assert no_sql.published == [(CLAIMS_CHANNEL, 'user,another')]
+	other_worker.on_invalidation_message(no_sql.published[0][1])
+	assert other_worker.local_cache.get('user') is None, 'Локальная копия другого воркера должна удаляться'
+
+
+async def test_denylist_subscription_dispatches_channels():
+	"""Подписка списка отзыва передает сообщения канала claims и сбрасывает кеш при переподписке."""
+	no_sql = FakeRedis()
+	handler = make_handler(no_sql)
+	handler.local_cache.set('stale', CLAIMS)
+	handler.local_cache.set('user', CLAIMS)
+	denylist = TokenDenylist(no_sql)
+	resyncs = []
+	denylist.subscribe(CLAIMS_CHANNEL, handler.on_invalidation_message, lambda: resyncs.append(True))
+
+	await denylist.start()
+	await no_sql.publish(CLAIMS_CHANNEL, 'user')
+	await no_sql.publish(DENYLIST_CHANNEL, 'jti:9999999999')
+	for _ in range(10):
+		await asyncio.sleep(0)
+	await denylist.stop()
+
+	assert resyncs == [True]
+	assert handler.local_cache.get('user') is None
+	assert handler.local_cache.get('stale') == CLAIMS
+	assert denylist.revoked == {'jti': 9999999999.0}, 'Сообщения списка отзыва должны обрабатываться как раньше'
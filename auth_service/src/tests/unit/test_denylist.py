@@ -0,0 +1,28 @@
+import time
+
+from db.denylist import TokenDenylist
+
+
+def test_expired_jti_is_evicted_without_lookup():
+	"""Токен, отозванный при logout, больше не проверяется: запись удаляется по истечении exp."""
+	denylist = TokenDenylist(no_sql=None)
+	denylist.add('logged_out', time.time() + 0.01)
+	time.sleep(0.02)
+
+	denylist.add('fresh', time.time() + 60)
+
+	assert denylist.revoked == {'fresh': denylist.revoked['fresh']}
+	assert len(denylist._expirations) == 1
+
+
+def test_readded_jti_keeps_later_exp():
+	denylist = TokenDenylist(no_sql=None)
+	denylist.add('jti', time.time() + 0.01)
+	later = time.time() + 60
+	denylist.add('jti', later)
+	time.sleep(0.02)
+
+	denylist.prune()
+
+	assert denylist.revoked == {'jti': later}
+	assert denylist.contains('jti')
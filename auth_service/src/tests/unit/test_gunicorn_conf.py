@@ -0,0 +1,32 @@
+import runpy
+from pathlib import Path
+from types import SimpleNamespace
+
+from prometheus_client import multiprocess
+
+
+CONFIG = Path(__file__).resolve().parents[2] / 'gunicorn.conf.py'
+
+
+def test_multiproc_dir_is_cleared_on_start(tmp_path: Path, monkeypatch):
+	metrics_dir = tmp_path / 'metrics'
+	metrics_dir.mkdir()
+	(metrics_dir / 'counter_1.db').write_bytes(b'stale')
+	monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(metrics_dir))
+	config = runpy.run_path(str(CONFIG))
+
+	config['on_starting'](server=None)
+
+	assert metrics_dir.is_dir()
+	assert list(metrics_dir.iterdir()) == []
+
+
+def test_exited_worker_is_marked_dead(tmp_path: Path, monkeypatch):
+	monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+	dead = []
+	monkeypatch.setattr(multiprocess, 'mark_process_dead', dead.append)
+	config = runpy.run_path(str(CONFIG))
+
+	config['child_exit'](server=None, worker=SimpleNamespace(pid=42))
+
+	assert dead == [42]
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from prometheus_client import REGISTRY
+
+from services import hasher
+from services.hasher import PasswordHasher
+
+
+@pytest.fixture
+def release() -> threading.Event:
+	event = threading.Event()
+	yield event
+	event.set()
+
+
+@pytest.fixture
+def password_hasher(monkeypatch, release: threading.Event) -> PasswordHasher:
+	"""Один процесс и одно место в очереди; хеширование ждет release, чтобы заполнить очередь."""
+	def blocking_hash(password: str) -> str:
+		release.wait(5)
+		if password == 'fail':
+			raise ValueError('hash failed')
+		return f'hash:{password}'
+
+	monkeypatch.setattr(hasher, 'generate_password_hash', blocking_hash)
+	password_hasher = PasswordHasher(max_workers=1, max_queue_size=1)
+	password_hasher.executor.shutdown()
+	# потоки вместо процессов: подмененную функцию не нужно передавать в другой процесс
+	password_hasher.executor = ThreadPoolExecutor(max_workers=1)
+	yield password_hasher
+	password_hasher.shutdown()
+
+
+def sample(name: str, labels: dict | None = None) -> float:
+	return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+async def wait_in_flight(password_hasher: PasswordHasher, count: int) -> None:
+	for _ in range(100):
+		if password_hasher.in_flight == count:
+			return
+		await asyncio.sleep(0.01)
+	raise AssertionError(f'{password_hasher.in_flight} tasks in flight, expected {count}')
+
+
+async def test_full_queue_rejects_with_429(password_hasher: PasswordHasher, release: threading.Event):
+	rejected_before = sample('auth_password_hash_rejected_total')
+	tasks = [asyncio.create_task(password_hasher.hash_password(str(i))) for i in range(2)]
+	await wait_in_flight(password_hasher, 2)
+	assert sample('auth_password_hash_queue_depth') == 1, 'Вторая задача должна ждать в очереди'
+
+	with pytest.raises(HTTPException) as exc_info:
+		await password_hasher.hash_password('overflow')
+	assert exc_info.value.status_code == HTTPStatus.TOO_MANY_REQUESTS
+	assert exc_info.value.headers == {'Retry-After': '1'}
+
+	release.set()
+	assert await asyncio.gather(*tasks) == ['hash:0', 'hash:1']
+	assert sample('auth_password_hash_queue_depth') == 0
+	assert sample('auth_password_hash_rejected_total') == rejected_before + 1
+	assert (password_hasher.stats.completed, password_hasher.stats.rejected) == (2, 1)
+
+
+async def test_failed_hash_is_not_completed(password_hasher: PasswordHasher, release: threading.Event):
+	errors_before = sample('auth_password_hash_duration_seconds_count', {'operation': 'hash', 'result': 'error'})
+	release.set()
+
+	with pytest.raises(ValueError):
+		await password_hasher.hash_password('fail')
+	assert await password_hasher.hash_password('ok') == 'hash:ok'
+
+	assert (password_hasher.stats.completed, password_hasher.stats.failed) == (1, 1)
+	assert password_hasher.in_flight == 0
+	assert sample(
+		'auth_password_hash_duration_seconds_count', {'operation': 'hash', 'result': 'error'}
+	) == errors_before + 1
+
+
+async def test_full_queue_response(password_hasher: PasswordHasher, release: threading.Event):
+	"""Клиент получает 429 с Retry-After, пока очередь хеширования заполнена."""
+	app = FastAPI()
+
+	@app.post('/signup')
+	async def signup(password_hasher: PasswordHasher = Depends(hasher.get_password_hasher)) -> dict:
+		return {'hash': await password_hasher.hash_password('secret')}
+
+	app.dependency_overrides[hasher.get_password_hasher] = lambda: password_hasher
+	tasks = [asyncio.create_task(password_hasher.hash_password(str(i))) for i in range(2)]
+	await wait_in_flight(password_hasher, 2)
+
+	async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+		response = await client.post('/signup')
+
+	assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+	assert response.headers['Retry-After'] == '1'
+	release.set()
+	await asyncio.gather(*tasks)
@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import jwt
+import pytest
+from async_fastapi_jwt_auth.exceptions import JWTDecodeError
+
+from core import keyring
+from core.keyring import JWT_ALGORITHM, KeyRing, generate_key, get_keyring
+from services.auth_jwt import KeyringAuthJWT
+
+
+@pytest.fixture
+def rotating_keyring(tmp_path: Path, monkeypatch) -> KeyRing:
+	"""Набор из временного каталога, только что проверенный: периодическая проверка еще не наступила."""
+	generate_key(tmp_path, '20240101000000')
+	ring = KeyRing.load(tmp_path)
+	monkeypatch.setattr(keyring, 'keyring', ring)
+	monkeypatch.setattr(keyring, '_checked_at', time.monotonic())
+	monkeypatch.setattr(keyring, '_unknown_kid_checked_at', 0.0)
+	return ring
+
+
+def sign(ring: KeyRing, kid: str) -> str:
+	return jwt.encode(
+		{'sub': 'user', 'type': 'access', 'exp': datetime.utcnow() + timedelta(minutes=1)},
+		ring.keys[kid].private_key,
+		algorithm=JWT_ALGORITHM,
+		headers={'kid': kid},
+	)
+
+
+def test_unchanged_keys_are_not_reloaded(rotating_keyring: KeyRing):
+	assert rotating_keyring.reloaded() is rotating_keyring
+
+
+def test_new_key_becomes_active(rotating_keyring: KeyRing):
+	generate_key(rotating_keyring.keys_dir, '20250101000000')
+
+	ring = rotating_keyring.reloaded()
+
+	assert ring.active.kid == '20250101000000'
+	assert set(ring.keys) == {'20240101000000', '20250101000000'}
+	assert {key['kid'] for key in ring.jwks['keys']} == set(ring.keys)
+
+
+def test_broken_key_file_keeps_current_keys(rotating_keyring: KeyRing):
+	(rotating_keyring.keys_dir / '20250101000000.pem').write_text('not a key')
+
+	assert rotating_keyring.reloaded() is rotating_keyring
+
+
+def test_periodic_check_waits_for_interval(rotating_keyring: KeyRing):
+	generate_key(rotating_keyring.keys_dir, '20250101000000')
+
+	assert get_keyring() is rotating_keyring, 'До истечения JWT_KEYS_RELOAD_SECONDS каталог не перечитывается'
+	assert get_keyring(unknown_kid=True).active.kid == '20250101000000'
+
+
+async def test_token_with_unknown_kid_reloads_keys(rotating_keyring: KeyRing):
+	"""Токен, подписанный ключом, который другой воркер уже загрузил, проверяется после перечитывания каталога."""
+	generate_key(rotating_keyring.keys_dir, '20250101000000')
+	token = sign(KeyRing.load(rotating_keyring.keys_dir), '20250101000000')
+
+	claims = await KeyringAuthJWT().verify_access_token(token)
+
+	assert claims['sub'] == 'user'
+	assert keyring.keyring.active.kid == '20250101000000'
+
+
+async def test_token_with_missing_kid_is_rejected(rotating_keyring: KeyRing, tmp_path_factory):
+	other_dir = tmp_path_factory.mktemp('other_keys')
+	generate_key(other_dir, 'unknown')
+
+	with pytest.raises(JWTDecodeError):
+		await KeyringAuthJWT().verify_access_token(sign(KeyRing.load(other_dir), 'unknown'))
@@ -0,0 +1,131 @@
+from datetime import date
+from pathlib import Path
+
+from db.partitions import (
+	LOGIN_HISTORY_DEFAULT_PARTITION,
+	add_months,
+	archive_partitions,
+	create_partitions,
+	partition_name,
+)
+
+
+class FakeResult:
+	def __init__(self, value=None, rows=()) -> None:
+		self.value = value
+		self.rows = list(rows)
+		self.rowcount = 0
+
+	def scalar(self):
+		return self.value
+
+	def scalars(self):
+		return iter(self.rows)
+
+
+class FakeRawConnection:
+	def __init__(self) -> None:
+		self.copied: list[str] = []
+
+	async def copy_from_table(self, table: str, output: str, **kwargs) -> None:
+		self.copied.append(table)
+		Path(output).write_text('')
+
+	async def copy_from_query(self, query: str, output: str, **kwargs) -> None:
+		self.copied.append(query)
+		Path(output).write_text('')
+
+
+class FakeConnection:
+	"""Записывает выполненный SQL и отвечает на запросы к каталогу Postgres."""
+
+	def __init__(self, existing: list[str], default_has_rows: bool = False) -> None:
+		self.existing = existing
+		self.default_has_rows = default_has_rows
+		self.statements: list[str] = []
+		self.raw = FakeRawConnection()
+		self.driver_connection = self.raw
+
+	async def execute(self, statement, params=None) -> FakeResult:
+		sql = str(statement)
+		self.statements.append(sql)
+		if 'pg_partitioned_table' in sql:
+			return FakeResult(1)
+		if 'pg_inherits' in sql:
+			return FakeResult(rows=self.existing)
+		if sql.startswith('SELECT EXISTS'):
+			return FakeResult(self.default_has_rows)
+		return FakeResult()
+
+	async def get_raw_connection(self) -> 'FakeConnection':
+		return self
+
+
+async def test_create_partitions_covers_months_since():
+	current_month = date.today().replace(day=1)
+	since = add_months(current_month, -2)
+	connection = FakeConnection(existing=[partition_name(current_month)])
+
+	created = await create_partitions(connection, months_ahead=1, since=since.replace(day=15))
+
+	assert created == [
+		partition_name(add_months(current_month, -2)),
+		partition_name(add_months(current_month, -1)),
+		partition_name(add_months(current_month, 1)),
+		LOGIN_HISTORY_DEFAULT_PARTITION,
+	]
+
+
+async def test_create_partitions_moves_rows_out_of_default_partition():
+	"""После перерыва в обслуживании строки новых месяцев уже в DEFAULT: без переноса CREATE TABLE упадет."""
+	current_month = date.today().replace(day=1)
+	connection = FakeConnection(existing=[LOGIN_HISTORY_DEFAULT_PARTITION], default_has_rows=True)
+
+	created = await create_partitions(connection, months_ahead=1)
+
+	assert created == [partition_name(current_month), partition_name(add_months(current_month, 1))]
+	statements = [sql.split(' (')[0] for sql in connection.statements if not sql.startswith('SELECT')]
+	assert statements == [
+		f'ALTER TABLE user_login_history DETACH PARTITION {LOGIN_HISTORY_DEFAULT_PARTITION}',
+		f'CREATE TABLE {partition_name(current_month)} PARTITION OF user_login_history FOR VALUES FROM',
+		f'CREATE TABLE {partition_name(add_months(current_month, 1))} PARTITION OF user_login_history FOR VALUES FROM',
+		'INSERT INTO user_login_history',
+		f"DELETE FROM {LOGIN_HISTORY_DEFAULT_PARTITION} WHERE login_at >= '{current_month.isoformat()}' "
+		f"AND login_at < '{add_months(current_month, 2).isoformat()}'",
+		f'ALTER TABLE user_login_history ATTACH PARTITION {LOGIN_HISTORY_DEFAULT_PARTITION} DEFAULT',
+	]
+
+
+async def test_create_partitions_keeps_empty_default_partition_attached():
+	connection = FakeConnection(existing=[LOGIN_HISTORY_DEFAULT_PARTITION])
+
+	await create_partitions(connection, months_ahead=1)
+
+	assert not any('DETACH' in sql or 'INSERT' in sql for sql in connection.statements)
+
+
+async def test_archive_includes_old_rows_of_default_partition(tmp_path: Path):
+	oldest_kept = add_months(date.today().replace(day=1), -12)
+	old_month = add_months(oldest_kept, -1)
+	connection = FakeConnection(
+		existing=[partition_name(old_month), LOGIN_HISTORY_DEFAULT_PARTITION],
+		default_has_rows=True
+	)
+
+	archived = await archive_partitions(connection, tmp_path, retention_months=12)
+
+	assert [path.name for path in archived] == [
+		f'{partition_name(old_month)}.csv',
+		f'{LOGIN_HISTORY_DEFAULT_PARTITION}_before_y{oldest_kept.year:04d}m{oldest_kept.month:02d}.csv',
+	]
+	assert any(
+		sql.startswith(f'DELETE FROM {LOGIN_HISTORY_DEFAULT_PARTITION} WHERE login_at <') for sql in connection.statements
+	), 'Из партиции DEFAULT должны удаляться только выгруженные старые строки'
+	assert f'DROP TABLE {LOGIN_HISTORY_DEFAULT_PARTITION}' not in connection.statements
+
+
+async def test_archive_skips_empty_default_partition(tmp_path: Path):
+	connection = FakeConnection(existing=[LOGIN_HISTORY_DEFAULT_PARTITION])
+
+	assert await archive_partitions(connection, tmp_path, retention_months=12) == []
+	assert not any(sql.startswith('DELETE') for sql in connection.statements)
@@ -0,0 +1,121 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from db.redis import SessionRecord
+from db.session_outbox import (
+	CLOSE_DEVICE_STMT,
+	CLOSE_SESSION_STMT,
+	SESSION_EVENTS_STREAM,
+	SessionOutboxWriter,
+	SessionsClosed,
+	decode_event,
+	encode_closed,
+	encode_opened,
+)
+
+
+RECORD = SessionRecord('user', 'pytest', 'jti-1', datetime(2030, 1, 1, 12, 0, 0))
+
+
+class FakeNoSQL:
+	"""Поток событий в памяти; аренда всегда достается писателю."""
+
+	def __init__(self, events: list[str]) -> None:
+		self.entries = [(f'{i}-0', {'event': event}) for i, event in enumerate(events, 1)]
+
+	async def xrange(self, stream: str, count: int) -> list[tuple[str, dict[str, str]]]:
+		assert stream == SESSION_EVENTS_STREAM
+		return self.entries[:count]
+
+	async def xdel(self, stream: str, *ids: str) -> None:
+		self.entries = [entry for entry in self.entries if entry[0] not in ids]
+
+	async def eval(self, script: str, keys: list[str], args: list) -> int:
+		return 1
+
+
+class FakeSession:
+	def __init__(self, fail: bool) -> None:
+		self.fail = fail
+		self.executed = []
+		self.committed = False
+
+	async def __aenter__(self) -> 'FakeSession':
+		return self
+
+	async def __aexit__(self, *exc) -> None:
+		pass
+
+	async def execute(self, statement, params=None) -> None:
+		if self.fail:
+			raise OperationalError('UPDATE', {}, Exception('connection lost'))
+		self.executed.append((statement, params))
+
+	async def commit(self) -> None:
+		self.committed = True
+
+
+def make_writer(no_sql: FakeNoSQL, sessions: list[FakeSession], batch_size: int = 100) -> SessionOutboxWriter:
+	return SessionOutboxWriter(
+		no_sql, lambda: sessions.pop(0), batch_size, poll_interval=0, retry_interval=0, lease_seconds=1
+	)
+
+
+def test_events_round_trip():
+	assert decode_event(encode_opened(RECORD)) == RECORD
+	assert decode_event(encode_closed('user', user_agent='pytest')) == SessionsClosed('user', 'pytest')
+	closed = decode_event(encode_closed('user', refresh_jti='jti-1', rotated=True))
+	assert closed.refresh_jti == 'jti-1' and closed.rotated_at is not None
+
+
+async def test_failed_write_keeps_events():
+	"""Пачка, которую не удалось записать, остается в потоке и записывается повторно."""
+	no_sql = FakeNoSQL([encode_opened(RECORD), encode_closed('user')])
+	retry = FakeSession(fail=False)
+	writer = make_writer(no_sql, [FakeSession(fail=True), retry])
+
+	with pytest.raises(OperationalError):
+		await writer.flush()
+	assert len(no_sql.entries) == 2, 'События не должны теряться при ошибке Postgres'
+
+	assert await writer.flush() == 2
+	assert retry.committed and len(retry.executed) == 2
+	assert no_sql.entries == []
+
+
+async def test_closes_are_batched():
+	"""Подряд идущие закрытия выполняются одним executemany на каждый вид закрытия."""
+	no_sql = FakeNoSQL([
+		encode_opened(RECORD),
+		encode_closed('user', refresh_jti='jti-1', rotated=True),
+		encode_closed('user', user_agent='pytest'),
+		encode_closed('other', refresh_jti='jti-2', rotated=True),
+		encode_closed('other', user_agent='pytest'),
+	])
+	session = FakeSession(fail=False)
+
+	await make_writer(no_sql, [session]).flush()
+
+	statements = [statement for statement, _ in session.executed]
+	assert len(statements) == 3, 'Открытие и два вида закрытий - три запроса'
+	assert statements[1] is CLOSE_SESSION_STMT and len(session.executed[1][1]) == 2
+	assert statements[2] is CLOSE_DEVICE_STMT and len(session.executed[2][1]) == 2
+
+
+async def test_flush_reads_one_batch():
+	no_sql = FakeNoSQL([encode_closed('user')] * 3)
+	writer = make_writer(no_sql, [FakeSession(fail=False), FakeSession(fail=False)], batch_size=2)
+
+	assert await writer.flush() == 2
+	assert await writer.flush() == 1
+	assert no_sql.entries == []
+
+
+async def test_malformed_event_is_skipped():
+	no_sql = FakeNoSQL(['not json', encode_closed('user')])
+	session = FakeSession(fail=False)
+
+	assert await make_writer(no_sql, [session]).flush() == 2
+	assert len(session.executed) == 1 and no_sql.entries == []
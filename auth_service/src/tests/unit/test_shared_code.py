@@ -0,0 +1,34 @@
+import ast
+from pathlib import Path
+
+import pytest
+
+
+AUTH_SRC = Path(__file__).resolve().parents[2]
+MOVIE_SRC = AUTH_SRC.parents[1] / 'movie_service' / 'src'
+# определения, скопированные в оба сервиса: у сервисов отдельные образы и нет общего пакета
+SHARED_DEFINITIONS = {
+	'core/tracer.py': ['TailSamplingSpanProcessor'],
+	'core/metrics.py': ['MetricsMiddleware', 'monitor_event_loop', 'metrics_response'],
+	'db/lru.py': ['LRUCache'],
+	'gunicorn.conf.py': ['on_starting', 'child_exit'],
+}
+
+pytestmark = pytest.mark.skipif(not MOVIE_SRC.exists(), reason='Исходники movie_service доступны только в репозитории')
+
+
+def definitions(path: Path) -> dict[str, str]:
+	tree = ast.parse(path.read_text())
+	return {
+		node.name: ast.dump(node)
+		for node in tree.body
+		if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef))
+	}
+
+
+@pytest.mark.parametrize('module', SHARED_DEFINITIONS)
+def test_copies_match(module: str):
+	auth, movie = definitions(AUTH_SRC / module), definitions(MOVIE_SRC / module)
+
+	for name in SHARED_DEFINITIONS[module]:
+		assert auth[name] == movie[name], f'{name} в {module} изменен только в одном сервисе'
@@ -0,0 +1,133 @@
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.id_generator import RandomIdGenerator
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON
+from opentelemetry.trace import NonRecordingSpan, SpanContext, Status, StatusCode, TraceFlags
+
+from core.tracer import TailSamplingSpanProcessor
+
+
+SLOW_THRESHOLD_MS = 100
+# младшие 64 бита trace_id сравниваются с границей доли: 0.5 * 2**64
+IN_SAMPLE_TRACE_ID = 1
+OUT_OF_SAMPLE_TRACE_ID = 2 ** 64 - 1
+
+
+class RecordingProcessor(SpanProcessor):
+	def __init__(self) -> None:
+		self.exported: list[ReadableSpan] = []
+
+	def on_end(self, span: ReadableSpan) -> None:
+		self.exported.append(span)
+
+
+class FixedIdGenerator(RandomIdGenerator):
+	def __init__(self, trace_id: int) -> None:
+		self.trace_id = trace_id
+
+	def generate_trace_id(self) -> int:
+		return self.trace_id
+
+
+class Traces:
+	"""Как configure_tracer с TRACE_TAIL_SAMPLING: записываются все span, экспорт решает TailSamplingSpanProcessor."""
+
+	def __init__(self, sample_ratio: float, trace_id: int, max_traces: int = 10_000) -> None:
+		self.recorder = RecordingProcessor()
+		self.processor = TailSamplingSpanProcessor(self.recorder, sample_ratio, SLOW_THRESHOLD_MS, max_traces)
+		provider = TracerProvider(sampler=ALWAYS_ON, id_generator=FixedIdGenerator(trace_id))
+		provider.add_span_processor(self.processor)
+		self.tracer = provider.get_tracer(__name__)
+
+	def finish(self, name: str, duration_ms: float = 1, context=None, error: bool = False) -> None:
+		span = self.tracer.start_span(name, context=context, start_time=0)
+		if error:
+			span.set_status(Status(StatusCode.ERROR))
+		span.end(end_time=int(duration_ms * 1_000_000))
+
+	def trace(self, duration_ms: float = 1, error: bool = False) -> None:
+		root = self.tracer.start_span('root', start_time=0)
+		self.finish('child', context=trace.set_span_in_context(root))
+		if error:
+			root.set_status(Status(StatusCode.ERROR))
+		root.end(end_time=int(duration_ms * 1_000_000))
+
+	@property
+	def exported(self) -> list[str]:
+		return [span.name for span in self.recorder.exported]
+
+
+@pytest.mark.parametrize('trace_id', [IN_SAMPLE_TRACE_ID, OUT_OF_SAMPLE_TRACE_ID])
+def test_error_trace_is_kept(trace_id: int):
+	traces = Traces(sample_ratio=0, trace_id=trace_id)
+
+	traces.trace(error=True)
+
+	assert traces.exported == ['child', 'root']
+
+
+def test_slow_trace_is_kept():
+	traces = Traces(sample_ratio=0, trace_id=IN_SAMPLE_TRACE_ID)
+
+	traces.trace(duration_ms=SLOW_THRESHOLD_MS)
+
+	assert traces.exported == ['child', 'root']
+
+
+def test_error_in_child_alone_does_not_keep_trace():
+	"""Решение принимается по корневому span: ошибка, обработанная выше по стеку, трейс не сохраняет."""
+	traces = Traces(sample_ratio=0, trace_id=IN_SAMPLE_TRACE_ID)
+	root = traces.tracer.start_span('root', start_time=0)
+
+	traces.finish('child', context=trace.set_span_in_context(root), error=True)
+	root.end(end_time=1_000_000)
+
+	assert traces.exported == []
+
+
+@pytest.mark.parametrize(
+	'trace_id, exported',
+	[
+		(IN_SAMPLE_TRACE_ID, ['child', 'root']),
+		(OUT_OF_SAMPLE_TRACE_ID, []),
+	]
+)
+def test_fast_trace_is_kept_by_ratio(trace_id: int, exported: list[str]):
+	traces = Traces(sample_ratio=0.5, trace_id=trace_id)
+
+	traces.trace()
+
+	assert traces.exported == exported
+
+
+def test_children_wait_for_root():
+	traces = Traces(sample_ratio=1, trace_id=IN_SAMPLE_TRACE_ID)
+	root = traces.tracer.start_span('root', start_time=0)
+
+	traces.finish('child', context=trace.set_span_in_context(root))
+
+	assert traces.exported == []
+	root.end(end_time=1_000_000)
+	assert traces.exported == ['child', 'root']
+
+
+def test_span_with_remote_parent_is_root():
+	"""Входящий запрос из другого сервиса: корневой span этого сервиса решает сразу."""
+	traces = Traces(sample_ratio=0, trace_id=IN_SAMPLE_TRACE_ID)
+	remote_parent = SpanContext(
+		trace_id=IN_SAMPLE_TRACE_ID, span_id=1, is_remote=True, trace_flags=TraceFlags(TraceFlags.SAMPLED)
+	)
+
+	traces.finish('request', context=trace.set_span_in_context(NonRecordingSpan(remote_parent)), error=True)
+
+	assert traces.exported == ['request']
+
+
+def test_unfinished_traces_are_evicted():
+	traces = Traces(sample_ratio=1, trace_id=IN_SAMPLE_TRACE_ID, max_traces=1)
+	for trace_id in (10, 11):
+		parent = SpanContext(trace_id=trace_id, span_id=1, is_remote=False)
+		traces.finish('orphan', context=trace.set_span_in_context(NonRecordingSpan(parent)))
+
+	assert list(traces.processor._traces) == [11], 'Дочерние span самого старого трейса вытесняются'
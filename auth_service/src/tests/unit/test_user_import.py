@@ -0,0 +1,252 @@
+import json
+import logging
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from services.user_import import ConflictPolicy, ImportFormat, ImportStats, UserImporter, parse_row, read_records
+
+
+WrittenRow = namedtuple('WrittenRow', ['id', 'username', 'inserted'])
+EXISTING_HASH = generate_password_hash('old', 'pbkdf2:sha256:1000')
+NEW_HASH = generate_password_hash('new', 'pbkdf2:sha256:1000')
+
+
+class FakeResult:
+	def __init__(self, rows=()) -> None:
+		self.rows = list(rows)
+
+	def all(self) -> list:
+		return self.rows
+
+
+class FakeDatabase:
+	"""Таблицы users, groups и groups_users; выполняет запросы UserImporter по их скомпилированному SQL."""
+
+	def __init__(self, groups: list[str]) -> None:
+		self.users: dict[str, dict] = {}
+		self.groups = {name: uuid.uuid4() for name in groups}
+		self.links: set[tuple] = set()
+		self.commits = 0
+
+	def add_user(self, username: str, email: str | None = None) -> uuid.UUID:
+		self.users[username] = {'id': uuid.uuid4(), 'username': username, 'email': email, 'password': EXISTING_HASH}
+		return self.users[username]['id']
+
+	def execute(self, statement) -> FakeResult:
+		compiled = statement.compile(dialect=postgresql.dialect())
+		sql, params = str(compiled), compiled.params
+		if sql.startswith('INSERT INTO users'):
+			return FakeResult(self._upsert(rows(params, 'username'), 'DO UPDATE' in sql))
+		if sql.startswith('INSERT INTO groups_users'):
+			self.links |= {(row['user_id'], row['group_id']) for row in rows(params, 'user_id')}
+			return FakeResult()
+		if 'FROM groups_users' in sql:
+			return FakeResult(self.links)
+		if 'FROM groups' in sql:
+			return FakeResult(self.groups.items())
+		if 'FROM users' in sql:
+			return FakeResult((user['email'], user['username']) for user in self.users.values() if user['email'])
+		raise AssertionError(f'Unexpected statement: {sql}')
+
+	def _upsert(self, new_rows: list[dict], update: bool) -> list[WrittenRow]:
+		written = []
+		for row in new_rows:
+			user = self.users.get(row['username'])
+			if user is None:
+				self.users[row['username']] = user = {**row, 'id': uuid.uuid4()}
+				written.append(WrittenRow(user['id'], row['username'], True))
+			elif update:
+				user.update(row)
+				written.append(WrittenRow(user['id'], row['username'], False))
+		return written
+
+	def user_groups(self, username: str) -> set[str]:
+		group_names = {group_id: name for name, group_id in self.groups.items()}
+		return {group_names[group_id] for user_id, group_id in self.links if user_id == self.users[username]['id']}
+
+
+class FakeSession:
+	def __init__(self, database: FakeDatabase) -> None:
+		self.database = database
+
+	async def __aenter__(self) -> 'FakeSession':
+		return self
+
+	async def __aexit__(self, *args) -> None:
+		pass
+
+	async def execute(self, statement) -> FakeResult:
+		return self.database.execute(statement)
+
+	async def commit(self) -> None:
+		self.database.commits += 1
+
+
+class FakeClaims:
+	def __init__(self) -> None:
+		self.invalidated: list = []
+
+	async def invalidate(self, user_ids) -> None:
+		self.invalidated += user_ids
+
+
+def rows(params: dict, first_column: str) -> list[dict]:
+	"""Строки многострочного INSERT из параметров вида username_m0, email_m0, username_m1..."""
+	count = sum(1 for name in params if name.startswith(f'{first_column}_m'))
+	return [
+		{name.rsplit('_m', 1)[0]: value for name, value in params.items() if name.endswith(f'_m{i}')}
+		for i in range(count)
+	]
+
+
+@pytest.fixture
+def database() -> FakeDatabase:
+	return FakeDatabase(groups=['subscribers', 'editors'])
+
+
+@pytest.fixture
+def executor() -> ThreadPoolExecutor:
+	# потоки вместо процессов: хеширование в тестах не нужно передавать в другой процесс
+	with ThreadPoolExecutor(max_workers=1) as executor:
+		yield executor
+
+
+async def run_import(
+	database: FakeDatabase,
+	executor: ThreadPoolExecutor,
+	records: list[dict],
+	on_conflict: ConflictPolicy,
+	default_groups: list[str] | None = None,
+	claims: FakeClaims | None = None,
+) -> ImportStats:
+	importer = make_importer(database, executor, on_conflict, default_groups, claims)
+	return await importer.run(enumerate(records, start=1), batch_size=2, report=lambda stats: None)
+
+
+def make_importer(
+	database: FakeDatabase,
+	executor: ThreadPoolExecutor,
+	on_conflict: ConflictPolicy,
+	default_groups: list[str] | None = None,
+	claims: FakeClaims | None = None,
+) -> UserImporter:
+	return UserImporter(lambda: FakeSession(database), executor, 1, on_conflict, default_groups, claims)
+
+
+async def test_skip_keeps_existing_users(database: FakeDatabase, executor: ThreadPoolExecutor):
+	database.add_user('luke')
+	claims = FakeClaims()
+
+	stats = await run_import(database, executor, [
+		{'username': 'luke', 'password_hash': NEW_HASH},
+		{'username': 'leia', 'password': 'secret'},
+	], ConflictPolicy.skip, claims=claims)
+
+	assert (stats.inserted, stats.updated, stats.skipped) == (1, 0, 1)
+	assert database.users['luke']['password'] == EXISTING_HASH
+	assert check_password_hash(database.users['leia']['password'], 'secret')
+	assert claims.invalidated == []
+
+
+async def test_upsert_updates_users_and_invalidates_their_claims(database: FakeDatabase, executor: ThreadPoolExecutor):
+	luke_id = database.add_user('luke')
+	claims = FakeClaims()
+
+	stats = await run_import(database, executor, [
+		{'username': 'luke', 'password_hash': NEW_HASH, 'first_name': 'Luke'},
+		{'username': 'leia', 'password_hash': NEW_HASH},
+	], ConflictPolicy.upsert, claims=claims)
+
+	assert (stats.inserted, stats.updated, stats.skipped) == (1, 1, 0)
+	assert database.users['luke']['password'] == NEW_HASH
+	assert database.users['luke']['first_name'] == 'Luke'
+	assert claims.invalidated == [luke_id], 'Claims инвалидируются только у обновленных пользователей'
+
+
+async def test_upsert_skips_email_of_another_user(database: FakeDatabase, executor: ThreadPoolExecutor):
+	database.add_user('luke', email='luke@example.com')
+	database.add_user('leia')
+
+	stats = await run_import(database, executor, [
+		{'username': 'leia', 'password_hash': NEW_HASH, 'email': 'luke@example.com'},
+	], ConflictPolicy.upsert)
+
+	assert (stats.updated, stats.skipped) == (0, 1)
+	assert database.users['leia']['password'] == EXISTING_HASH
+
+
+@pytest.mark.parametrize('on_conflict', list(ConflictPolicy))
+async def test_groups_are_assigned(database: FakeDatabase, executor: ThreadPoolExecutor, on_conflict: ConflictPolicy):
+	stats = await run_import(database, executor, [
+		{'username': 'luke', 'password_hash': NEW_HASH, 'groups': 'editors; unknown'},
+		{'username': 'leia', 'password_hash': NEW_HASH},
+	], on_conflict, default_groups=['subscribers'])
+
+	assert stats.inserted == 2
+	assert database.user_groups('luke') == {'subscribers', 'editors'}
+	assert database.user_groups('leia') == {'subscribers'}
+
+
+async def test_reimport_does_not_duplicate_group_links(database: FakeDatabase, executor: ThreadPoolExecutor):
+	records = [{'username': 'luke', 'password_hash': NEW_HASH, 'groups': ['editors']}]
+	await run_import(database, executor, records, ConflictPolicy.upsert)
+
+	await run_import(database, executor, records, ConflictPolicy.upsert)
+
+	assert len(database.links) == 1
+
+
+async def test_missing_default_group_stops_import(database: FakeDatabase, executor: ThreadPoolExecutor):
+	with pytest.raises(ValueError):
+		await run_import(database, executor, [], ConflictPolicy.skip, default_groups=['unknown'])
+
+
+async def test_invalid_rows_are_counted(database: FakeDatabase, executor: ThreadPoolExecutor, tmp_path):
+	"""Каждая неверная строка пропускается и считается, а импорт остальных продолжается."""
+	lines = [json.dumps(record) for record in [
+		{'username': 'luke'},
+		{'username': 'leia', 'password_hash': 'plain-text-password'},
+		{'username': 'x' * 256, 'password_hash': NEW_HASH},
+		{'username': 'obi-wan', 'password_hash': NEW_HASH, 'email': f'{"x" * 50}@example.com'},
+		{'username': 'yoda', 'password_hash': NEW_HASH, 'first_name': 'y' * 51},
+		{'username': 42, 'password_hash': NEW_HASH},
+		{'username': 'chewie', 'password_hash': NEW_HASH, 'groups': ['editors', 1]},
+		['han', NEW_HASH],
+	]]
+	lines += ['{"username": "lando", ', json.dumps({'username': 'han', 'password_hash': NEW_HASH}), '']
+	path = tmp_path / 'users.jsonl'
+	path.write_text('\n'.join(lines))
+
+	importer = make_importer(database, executor, ConflictPolicy.skip)
+	stats = await importer.run(read_records(path, ImportFormat.jsonl), batch_size=2, report=lambda stats: None)
+
+	assert (stats.invalid, stats.inserted) == (9, 1)
+	assert list(database.users) == ['han']
+
+
+@pytest.mark.parametrize(
+	'password_hash',
+	[
+		generate_password_hash('secret'),
+		generate_password_hash('secret', 'scrypt:16384:8:1'),
+		generate_password_hash('secret', 'pbkdf2'),
+		generate_password_hash('secret', 'pbkdf2:sha512:1000'),
+	]
+)
+def test_werkzeug_hash_is_accepted(password_hash: str):
+	assert parse_row(1, {'username': 'luke', 'password_hash': password_hash}).password_hash == password_hash
+
+
+@pytest.mark.parametrize(
+	'password_hash',
+	['secret', '$2b$12$R9h/cIPz0gi.URNNX3kh2OPST9/PgBkqquzi.Ss7KIUgO2t0jWMUW', 'md5$salt$ff', 'pbkdf2$salt$not-hex']
+)
+def test_unknown_hash_format_is_rejected(password_hash: str, caplog):
+	with caplog.at_level(logging.WARNING):
+		assert parse_row(7, {'username': 'luke', 'password_hash': password_hash}) is None
+	assert 'Line 7' in caplog.text
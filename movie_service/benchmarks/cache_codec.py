@@ -0,0 +1,84 @@
+"""
+Сравнение форматов значений кеша для страницы фильмов.
+
+legacy - прежний формат: JSON-массив строк, в каждой JSON одного фильма.
+Остальные строки - кодеки db.codec; недоступные необязательные библиотеки пропускаются.
+
+Скрипт лежит вне src, чтобы не попадать в образ сервиса. Запуск из movie_service:
+    python benchmarks/cache_codec.py --films 50 --repeat 200
+"""
+import argparse
+import json
+import random
+import sys
+import timeit
+import uuid
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'src'))
+
+from db.codec import SERIALIZERS, Codec
+from models.film import Film
+
+
+def make_films(count: int) -> list[Film]:
+    rnd = random.Random(0)
+
+    def people(size: int) -> list[dict]:
+        return [{'id': uuid.UUID(int=rnd.getrandbits(128)), 'name': f'Person {rnd.randint(0, 10 ** 6)}'}
+                for _ in range(size)]
+
+    return [
+        Film(
+            id=uuid.UUID(int=rnd.getrandbits(128)),
+            title=f'Film title {i}',
+            imdb_rating=round(rnd.uniform(0, 10), 1),
+            description=' '.join(rnd.choice(('star', 'wars', 'space', 'hero', 'empire', 'dark', 'light'))
+                                 for _ in range(60)),
+            genres=[{'id': uuid.UUID(int=rnd.getrandbits(128)), 'name': 'Action'} for _ in range(3)],
+            actors=people(8),
+            writers=people(2),
+            directors=people(1),
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_dumps(films: list[Film]) -> bytes:
+    return json.dumps([film.model_dump_json() for film in films]).encode()
+
+
+def legacy_loads(data: bytes) -> list[Film]:
+    return [Film.model_validate_json(obj) for obj in json.loads(data)]
+
+
+def measure(name: str, dumps, loads, films: list[Film], repeat: int) -> None:
+    data = dumps(films)
+    assert loads(data) == films
+    encode = min(timeit.repeat(lambda: dumps(films), number=repeat, repeat=3)) / repeat
+    decode = min(timeit.repeat(lambda: loads(data), number=repeat, repeat=3)) / repeat
+    print(f'{name:<16}{len(data):>10}{encode * 1e6:>14.1f}{decode * 1e6:>14.1f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=50, help='фильмов на странице')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    films = make_films(args.films)
+    print(f'{"codec":<16}{"bytes":>10}{"encode, us":>14}{"decode, us":>14}')
+    measure('legacy', legacy_dumps, legacy_loads, films, args.repeat)
+    for name, serializer in SERIALIZERS.items():
+        for threshold in (0, 1):
+            try:
+                codec = Codec(list[Film], serializer(), compress_threshold=threshold)
+            except ImportError as e:
+                print(f'{name:<16}skipped: {e}')
+                break
+            label = f'{name}+zstd' if threshold else name
+            measure(label, codec.dumps, codec.loads, films, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
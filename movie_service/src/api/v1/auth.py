@@ -1,25 +1,30 @@
 import http
 
 import jwt
-import time
 
 from fastapi import HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from core.config import settings
+from services import jwks
+from services.token_cache import VerifiedTokenCache
 
 
-def decode_token(token: str) -> dict | None:
+async def decode_token(token: str) -> dict | None:
     try:
-        decoded_token = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm, ])
-        return decode_token if decoded_token['exp'] >= time.time() else None
+        key = await jwks.jwks_client.get_key(jwt.get_unverified_header(token).get('kid'))
+        if key is None:
+            return None
+        # срок действия проверяет jwt.decode
+        return jwt.decode(token, key, algorithms=[settings.jwt_algorithm, ])
     except Exception:
         return None
 
 
 class JWTBearer(HTTPBearer):
-    def __init__(self, auto_error: bool = True):
+    def __init__(self, auto_error: bool = True, cache_size: int = settings.token_cache_size):
         super().__init__(auto_error=auto_error)
+        self.token_cache = VerifiedTokenCache(cache_size)
 
     async def __call__(self, request: Request):
         credentials: HTTPAuthorizationCredentials = await super().__call__(request)
@@ -27,14 +32,18 @@ class JWTBearer(HTTPBearer):
             raise HTTPException(status_code=http.HTTPStatus.FORBIDDEN, detail='Invalid authorization code.')
         if not credentials.scheme == 'Bearer':
             raise HTTPException(status_code=http.HTTPStatus.UNAUTHORIZED, detail='Only Bearer token might be accepted')
-        decoded_token = self.parse_token(credentials.credentials)
+        decoded_token = await self.parse_token(credentials.credentials)
         if not decoded_token:
             raise HTTPException(status_code=http.HTTPStatus.FORBIDDEN, detail='Invalid or expired token.')
         return decoded_token
 
-    @staticmethod
-    def parse_token(jwt_token: str):
-        return decode_token(jwt_token)
+    async def parse_token(self, jwt_token: str):
+        decoded_token = self.token_cache.get(jwt_token)
+        if decoded_token is None:
+            decoded_token = await decode_token(jwt_token)
+            if decoded_token:
+                self.token_cache.set(jwt_token, decoded_token)
+        return decoded_token
 
 
 security = JWTBearer()
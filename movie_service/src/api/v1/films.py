@@ -5,7 +5,7 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, Query, Path
 
 from services.film import FilmService, get_film_service
-from models.film import Film, FilmShort
+from models.film import FILM_BATCH_MAX_SIZE, Film, FilmBatch, FilmShort
 
 from .auth import security
 
@@ -42,6 +42,24 @@ async def search_film(
     ]
 
 
+@router.post(
+    '/batch',
+    response_model=list[Film | None],
+    summary='Полная информация по списку кинопроизведений',
+    description=(
+        f'Получение кинопроизведений по списку идентификаторов (не больше {FILM_BATCH_MAX_SIZE}) '
+        'за один запрос'
+    ),
+    response_description='Кинопроизведения в порядке переданных идентификаторов, null - для ненайденных',
+)
+async def films_batch(
+    user: Annotated[dict, Depends(security)],
+    batch: FilmBatch,
+    film_service: FilmService = Depends(get_film_service)
+) -> list[Film | None]:
+    return await film_service.get_films_by_id_list(batch.ids)
+
+
 @router.get(
     '/{film_id}',
     response_model=Film,
@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 
 from core.logger import LOGGING
 from pydantic_settings import BaseSettings
@@ -16,8 +17,51 @@ class Settings(BaseSettings):
     es_genres_index: str = 'genres'
     es_persons_index: str = 'persons'
 
-    jwt_secret_key: str = 'secret'
-    jwt_algorithm: str = 'HS256'
+    # токены проверяются открытыми ключами сервиса авторизации
+    jwt_algorithm: str = 'RS256'
+    jwks_url: str = 'http://auth_service_fastapi:8000/auth/.well-known/jwks.json'
+    jwks_refresh_interval: float = 10
+    # сколько проверенных токенов держать в памяти процесса
+    token_cache_size: int = 10_000
+
+    # локальный уровень кеша: сколько разобранных документов держать в воркере и сколько секунд
+    local_cache_size: int = 10_000
+    local_cache_ttl: float = 30
+    cache_invalidation_channel: str = 'cache_invalidation'
+    # формат значений в Redis: json, orjson или msgpack; значения от cache_compress_threshold байт сжимаются zstd.
+    # Порог можно менять без сброса кеша; после смены формата старые значения не разбираются
+    # и удаляются при чтении как промахи
+    cache_codec: Literal['json', 'orjson', 'msgpack'] = 'json'
+    cache_compress_threshold: int = 0
+    # сколько секунд после истечения срока запись еще отдается, пока она обновляется в фоне
+    cache_stale_ttl: int = 60
+    # блокировка в Redis, чтобы промах по ключу загружал из Elasticsearch один воркер, а не каждый
+    cache_lock_enabled: bool = False
+    cache_lock_ttl: float = 5
+    cache_lock_wait: float = 2
+    cache_lock_poll_interval: float = 0.05
+
+    # отладочный режим: трейсы дублируются в консоль
+    debug: bool = False
+
+    enable_tracer: bool = True
+    jaeger_host: str = 'jaeger'
+    jaeger_port: int = 6831
+    # доля записываемых трейсов; запросы с уже принятым решением (traceparent) его наследуют
+    trace_sample_ratio: float = 0.1
+    # дополнительно сохранять все трейсы с ошибкой и медленнее trace_slow_threshold_ms
+    trace_tail_sampling: bool = False
+    trace_slow_threshold_ms: float = 500
+    # очередь и пачки экспорта span
+    trace_export_queue_size: int = 2048
+    trace_export_batch_size: int = 512
+    trace_export_delay_ms: int = 5000
+    trace_export_timeout_ms: int = 30000
+
+    # соединений с Elasticsearch на один узел в каждом воркере
+    es_pool_maxsize: int = 10
+    # как часто измерять задержку event loop для /metrics
+    metrics_sample_interval: float = 1.0
 
 
 settings = Settings()
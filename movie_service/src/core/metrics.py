@@ -0,0 +1,164 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+REQUEST_LATENCY = Histogram(
+    'movie_http_request_duration_seconds',
+    'HTTP request latency',
+    ['method', 'route', 'status'],
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'movie_http_requests_in_flight',
+    'HTTP requests being handled',
+    multiprocess_mode='livesum',
+)
+
+CACHE_REQUESTS = Counter(
+    'movie_cache_requests_total',
+    'Cache lookups by cache and result',
+    ['cache', 'result'],
+)
+# дочерние метрики создаем заранее, чтобы не искать их по меткам на каждом запросе
+FILM_CACHE_HIT = CACHE_REQUESTS.labels('film', 'hit')
+FILM_CACHE_MISS = CACHE_REQUESTS.labels('film', 'miss')
+PERSON_CACHE_HIT = CACHE_REQUESTS.labels('person', 'hit')
+PERSON_CACHE_MISS = CACHE_REQUESTS.labels('person', 'miss')
+GENRE_CACHE_HIT = CACHE_REQUESTS.labels('genre', 'hit')
+GENRE_CACHE_MISS = CACHE_REQUESTS.labels('genre', 'miss')
+TOKEN_CACHE_HIT = CACHE_REQUESTS.labels('verified_token', 'hit')
+TOKEN_CACHE_MISS = CACHE_REQUESTS.labels('verified_token', 'miss')
+
+CACHE_TIER_REQUESTS = Counter(
+    'movie_cache_tier_requests_total',
+    'Lookups in the local and Redis tiers of the two-tier cache',
+    ['tier', 'result'],
+)
+LOCAL_TIER_HIT = CACHE_TIER_REQUESTS.labels('local', 'hit')
+LOCAL_TIER_MISS = CACHE_TIER_REQUESTS.labels('local', 'miss')
+REDIS_TIER_HIT = CACHE_TIER_REQUESTS.labels('redis', 'hit')
+REDIS_TIER_MISS = CACHE_TIER_REQUESTS.labels('redis', 'miss')
+
+CACHE_FILLS = Counter(
+    'movie_cache_fills_total',
+    'Cache misses and stale entries by how the value was loaded',
+    ['outcome'],
+)
+# запрос сам сходил в хранилище
+CACHE_FILL_FETCHED = CACHE_FILLS.labels('fetched')
+# дождался загрузки, начатой другим запросом этого воркера
+CACHE_FILL_COALESCED = CACHE_FILLS.labels('coalesced')
+# дождался, пока значение в кеш запишет другой воркер
+CACHE_FILL_WAITED = CACHE_FILLS.labels('waited')
+# устаревшее значение отдано, а свежее загружается в фоне
+CACHE_FILL_STALE = CACHE_FILLS.labels('stale')
+
+CACHE_DECODE_ERRORS = Counter(
+    'movie_cache_decode_errors_total',
+    'Cached values that could not be decoded and were dropped as misses',
+)
+
+ES_POOL_SIZE = Gauge(
+    'movie_es_pool_size', 'Elasticsearch connections allowed per worker', multiprocess_mode='livesum'
+)
+ES_REQUESTS_IN_FLIGHT = Gauge(
+    'movie_es_requests_in_flight', 'Elasticsearch requests holding a connection', multiprocess_mode='livesum'
+)
+ES_REQUEST_LATENCY = Histogram(
+    'movie_es_request_duration_seconds',
+    'Elasticsearch request latency',
+    ['operation'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+
+EVENT_LOOP_LAG = Histogram(
+    'movie_event_loop_lag_seconds',
+    'Delay of a scheduled wake-up of the event loop',
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+)
+
+
+@contextmanager
+def track_es_request(operation: str) -> Iterator[None]:
+    ES_REQUESTS_IN_FLIGHT.inc()
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        ES_REQUESTS_IN_FLIGHT.dec()
+        ES_REQUEST_LATENCY.labels(operation).observe(time.perf_counter() - started_at)
+
+
+# MetricsMiddleware, monitor_event_loop и metrics_response одинаковы в auth_service и movie_service: каждый сервис собирается из своего
+# каталога src в отдельный образ, и общего пакета у них нет. Совпадение копий проверяет
+# auth_service/src/tests/unit/test_shared_code.py.
+class MetricsMiddleware:
+    """ASGI middleware: время ответа по шаблону пути и число обрабатываемых запросов."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # маршрут появляется в scope после сопоставления запроса с роутером
+            route = scope.get('route')
+            REQUEST_LATENCY.labels(
+                scope['method'], route.path if route else 'unmatched', status_code
+            ).observe(time.perf_counter() - started_at)
+
+
+async def monitor_event_loop(interval: float, sample: Callable[[], None] | None = None) -> None:
+    """Измеряет задержку пробуждения event loop и периодически снимает значения gauge метрик."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started_at = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - started_at - interval, 0))
+        if sample:
+            sample()
+
+
+def metrics_response() -> Response:
+    """
+    Метрики в формате Prometheus. Под gunicorn каталог PROMETHEUS_MULTIPROC_DIR задает
+    gunicorn.conf.py, и метрики собираются из файлов всех воркеров.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+from opentelemetry import trace
+from opentelemetry.exporter.jaeger.thrift import JaegerExporter
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+from core.config import settings
+
+
+# TailSamplingSpanProcessor одинаков в auth_service и movie_service: каждый сервис собирается из своего
+# каталога src в отдельный образ, и общего пакета у них нет. Совпадение копий проверяет
+# auth_service/src/tests/unit/test_shared_code.py.
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Решает, экспортировать ли трейс, после завершения его корневого span в этом сервисе.
+
+    Сохраняются трейсы с ошибкой, медленные трейсы и доля sample_ratio остальных.
+    До завершения корневого span его дочерние span держатся в памяти, не более max_traces трейсов.
+    """
+
+    def __init__(
+            self,
+            processor: SpanProcessor,
+            sample_ratio: float,
+            slow_threshold_ms: float,
+            max_traces: int = 10_000,
+    ) -> None:
+        self.processor = processor
+        self.ratio_bound = TraceIdRatioBased.get_bound_for_rate(sample_ratio)
+        self.slow_threshold_ns = slow_threshold_ms * 1_000_000
+        self.max_traces = max_traces
+        self._traces: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        with self._lock:
+            self._traces.setdefault(trace_id, []).append(span)
+            if span.parent is not None and not span.parent.is_remote:
+                # трейсы, чей корневой span так и не завершился, вытесняются первыми
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+                return
+            spans = self._traces.pop(trace_id)
+
+        if self._keep(span):
+            for finished in spans:
+                self.processor.on_end(finished)
+
+    def _keep(self, root: ReadableSpan) -> bool:
+        if root.status.status_code is StatusCode.ERROR:
+            return True
+        if root.end_time - root.start_time >= self.slow_threshold_ns:
+            return True
+        return root.context.trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self.ratio_bound
+
+    def shutdown(self) -> None:
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.processor.force_flush(timeout_millis)
+
+
+def _batch_processor(exporter) -> BatchSpanProcessor:
+    return BatchSpanProcessor(
+        exporter,
+        max_queue_size=settings.trace_export_queue_size,
+        schedule_delay_millis=settings.trace_export_delay_ms,
+        max_export_batch_size=settings.trace_export_batch_size,
+        export_timeout_millis=settings.trace_export_timeout_ms,
+    )
+
+
+def configure_tracer() -> None:
+    """
+    Трейсы уходят в Jaeger из фонового потока BatchSpanProcessor; при переполнении очереди span отбрасываются.
+    Решение о записи трейса принимает первый сервис в цепочке (ParentBased), остальные его наследуют.
+    С trace_tail_sampling записываются все span, а решение об экспорте принимается после ответа.
+    """
+    if settings.trace_tail_sampling:
+        sampler = ALWAYS_ON
+    else:
+        sampler = ParentBased(TraceIdRatioBased(settings.trace_sample_ratio))
+    provider = TracerProvider(
+        sampler=sampler,
+        resource=Resource.create({SERVICE_NAME: settings.project_name}),
+    )
+
+    jaeger = _batch_processor(JaegerExporter(agent_host_name=settings.jaeger_host, agent_port=settings.jaeger_port))
+    if settings.trace_tail_sampling:
+        jaeger = TailSamplingSpanProcessor(jaeger, settings.trace_sample_ratio, settings.trace_slow_threshold_ms)
+    provider.add_span_processor(jaeger)
+
+    # в консоль трейсы выводим только при локальной разработке
+    if settings.debug:
+        provider.add_span_processor(_batch_processor(ConsoleSpanExporter()))
+
+    trace.set_tracer_provider(provider)
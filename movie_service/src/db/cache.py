@@ -1,8 +1,14 @@
-from db.redis import RedisCache
+from db.redis import ICache, RedisLock
 
 
-cache: RedisCache | None = None
+cache: ICache | None = None
+# блокировка загрузки ключей между воркерами, None - выключена
+cache_lock: RedisLock | None = None
 
 
-async def get_cache() -> RedisCache:
+async def get_cache() -> ICache:
     return cache
+
+
+async def get_cache_lock() -> RedisLock | None:
+    return cache_lock
@@ -0,0 +1,128 @@
+from typing import Any, Generic, TypeVar
+from abc import ABC, abstractmethod
+
+from pydantic import TypeAdapter
+
+
+T = TypeVar('T')
+
+# кадр zstd начинается с этих байт, JSON и msgpack-документ (объект или массив) - никогда
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+class CodecError(ValueError):
+    """Значение записано в другом формате или повреждено."""
+
+
+class ISerializer(ABC):
+    """Формат байтов значения в кеше."""
+
+    @abstractmethod
+    def dumps(self, adapter: TypeAdapter, value: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, adapter: TypeAdapter, data: str | bytes) -> Any:
+        pass
+
+
+class JsonSerializer(ISerializer):
+    """JSON средствами pydantic-core: сериализация и валидация за один проход без промежуточных dict."""
+
+    def dumps(self, adapter: TypeAdapter, value: Any) -> bytes:
+        return adapter.dump_json(value)
+
+    def loads(self, adapter: TypeAdapter, data: str | bytes) -> Any:
+        return adapter.validate_json(data)
+
+
+class OrjsonSerializer(ISerializer):
+    def __init__(self) -> None:
+        import orjson
+        self.orjson = orjson
+
+    def dumps(self, adapter: TypeAdapter, value: Any) -> bytes:
+        return self.orjson.dumps(adapter.dump_python(value, mode='json'))
+
+    def loads(self, adapter: TypeAdapter, data: str | bytes) -> Any:
+        return adapter.validate_python(self.orjson.loads(data))
+
+
+class MsgpackSerializer(ISerializer):
+    def __init__(self) -> None:
+        import msgpack
+        self.msgpack = msgpack
+
+    def dumps(self, adapter: TypeAdapter, value: Any) -> bytes:
+        return self.msgpack.packb(adapter.dump_python(value, mode='json'))
+
+    def loads(self, adapter: TypeAdapter, data: str | bytes) -> Any:
+        return adapter.validate_python(self.msgpack.unpackb(data))
+
+
+SERIALIZERS: dict[str, type[ISerializer]] = {
+    'json': JsonSerializer,
+    'orjson': OrjsonSerializer,
+    'msgpack': MsgpackSerializer,
+}
+
+
+class Codec(Generic[T]):
+    """
+    Превращает значение типа T в байты для кеша и обратно.
+
+    Список моделей сериализуется одним документом через TypeAdapter(list[Model]).
+    Значения не меньше compress_threshold байт сжимаются zstd (0 - не сжимать).
+    Сжатое значение распознается по заголовку кадра, поэтому порог можно менять,
+    не сбрасывая кеш. Значения, записанные другим сериализатором или прежним форматом,
+    loads не разбирает и выбрасывает CodecError; кеш считает их промахом и удаляет.
+    """
+
+    def __init__(
+        self,
+        type_: type[T],
+        serializer: ISerializer,
+        compress_threshold: int = 0,
+        compress_level: int = 3
+    ) -> None:
+        self.adapter = TypeAdapter(type_)
+        self.serializer = serializer
+        self.compress_threshold = compress_threshold
+        self.compressor = None
+        self.decompressor = None
+        if compress_threshold:
+            import zstandard
+            self.compressor = zstandard.ZstdCompressor(level=compress_level)
+            self.decompressor = zstandard.ZstdDecompressor()
+
+    def dumps(self, value: T) -> bytes:
+        data = self.serializer.dumps(self.adapter, value)
+        if self.compressor and len(data) >= self.compress_threshold:
+            data = self.compressor.compress(data)
+        return data
+
+    def loads(self, data: str | bytes) -> T:
+        if isinstance(data, bytes) and data.startswith(ZSTD_MAGIC):
+            data = self._decompress(data)
+        try:
+            return self.serializer.loads(self.adapter, data)
+        except ValueError as e:
+            # ошибки валидации pydantic, разбора JSON и msgpack - подклассы ValueError
+            raise CodecError(str(e)) from e
+
+    def _decompress(self, data: bytes) -> bytes:
+        import zstandard
+        if self.decompressor is None:
+            self.decompressor = zstandard.ZstdDecompressor()
+        try:
+            return self.decompressor.decompress(data)
+        except zstandard.ZstdError as e:
+            raise CodecError(str(e)) from e
+
+
+def create_codec(type_: type[T], serializer: str = 'json', compress_threshold: int = 0) -> Codec[T]:
+    """
+    Кодек для типа значений. orjson, msgpack и zstandard - необязательные зависимости:
+    они импортируются, только если выбраны в настройках.
+    """
+    return Codec(type_, SERIALIZERS[serializer](), compress_threshold)
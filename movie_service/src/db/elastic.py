@@ -2,12 +2,18 @@ from typing import Any
 from abc import ABC, abstractmethod
 from elasticsearch import AsyncElasticsearch, NotFoundError
 
+from core.metrics import track_es_request
+
 
 class IStorage(ABC):
     @abstractmethod
     async def get_by_id(self, index: str, id: str) -> dict | None:
         pass
 
+    @abstractmethod
+    async def get_many(self, index: str, ids: list[str]) -> list[dict | None]:
+        pass
+
     @abstractmethod
     async def search(self, index: str, body: Any) -> list[dict] | None:
         pass
@@ -23,16 +29,27 @@ class ElasticStorage(IStorage):
 
     async def get_by_id(self, index: str, id: str) -> dict | None:
         try:
-            doc = await self.connection.get(index=index, id=id)
+            with track_es_request('get'):
+                doc = await self.connection.get(index=index, id=id)
         except NotFoundError:
             return None
         return doc['_source']
 
+    async def get_many(self, index: str, ids: list[str]) -> list[dict | None]:
+        """Документы в порядке ids, None - для ненайденных."""
+        try:
+            with track_es_request('mget'):
+                docs = await self.connection.mget(index=index, body={'ids': ids})
+        except NotFoundError:
+            return [None] * len(ids)
+        return [doc['_source'] if doc.get('found') else None for doc in docs['docs']]
+
     async def search(self, index: str, body: Any) -> list[dict] | None:
         try:
-            docs = await self.connection.search(
-                index=index, body=body
-            )
+            with track_es_request('search'):
+                docs = await self.connection.search(
+                    index=index, body=body
+                )
         except NotFoundError:
             return None
         return [doc['_source'] for doc in docs['hits']['hits']]
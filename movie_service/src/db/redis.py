@@ -1,6 +1,31 @@
-from typing import Any
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Callable, TypeVar
 from abc import ABC, abstractmethod
+
 from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+
+from core import metrics
+from db.lru import LRUCache
+
+
+T = TypeVar('T')
+
+
+def parse_cached(key: str, data: str | bytes, parse: Callable[[str | bytes], T]) -> T | None:
+    """
+    Разбирает значение из кеша. None - значение записано в другом формате или повреждено:
+    ошибки кодеков и валидации pydantic - подклассы ValueError.
+    """
+    try:
+        return parse(data)
+    except ValueError as e:
+        metrics.CACHE_DECODE_ERRORS.inc()
+        logging.warning('Dropping undecodable cache value %s: %s', key, e)
+        return None
 
 
 class ICache(ABC):
@@ -12,10 +37,58 @@ class ICache(ABC):
     async def set(self, key: str, value: Any, expired_time: int) -> None:
         pass
 
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        pass
+
     @abstractmethod
     async def close(self):
         pass
 
+    async def get_parsed(
+        self,
+        key: str,
+        parse: Callable[[str | bytes], T],
+        on_stale: Callable[[], None] | None = None
+    ) -> T | None:
+        """
+        Возвращает значение по ключу, разобранное функцией parse.
+        on_stale вызывается, если значение уже устарело и его нужно обновить.
+        Значение, которое parse не разобрал (ValueError), удаляется и считается промахом.
+        """
+        data = await self.get(key)
+        if not data:
+            return None
+        value = parse_cached(key, data, parse)
+        if value is None:
+            await self.delete(key)
+        return value
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return [await self.get(key) for key in keys]
+
+    async def get_parsed_many(
+        self,
+        keys: list[str],
+        parse: Callable[[str | bytes], T],
+        on_stale: Callable[[str], None] | None = None
+    ) -> list[T | None]:
+        """Значения ключей в том же порядке; on_stale получает ключ каждого устаревшего значения."""
+        values = []
+        undecodable = []
+        for key, data in zip(keys, await self.get_many(keys)):
+            value = parse_cached(key, data, parse) if data else None
+            if data and value is None:
+                undecodable.append(key)
+            values.append(value)
+        if undecodable:
+            await self.delete(*undecodable)
+        return values
+
+    async def set_many(self, items: dict[str, Any], expired_time: int) -> None:
+        for key, value in items.items():
+            await self.set(key, value, expired_time)
+
 
 class RedisCache(ICache):
     def __init__(self, **kwargs) -> None:
@@ -27,8 +100,254 @@ class RedisCache(ICache):
     async def set(self, key: str, value: Any, expired_time: int) -> None:
         await self.connection.set(key, value, expired_time)
 
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.connection.delete(*keys)
+
+    async def get_with_ttl(self, key: str) -> tuple[str | None, float | None]:
+        """Значение и оставшееся время жизни ключа в секундах за один запрос (None - без срока)."""
+        async with self.connection.pipeline(transaction=False) as pipe:
+            data, pttl = await pipe.get(key).pttl(key).execute()
+        return data, pttl / 1000 if pttl >= 0 else None
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return await self.connection.mget(keys)
+
+    async def get_many_with_ttl(self, keys: list[str]) -> list[tuple[str | None, float | None]]:
+        """MGET и PTTL каждого ключа одним конвейером."""
+        async with self.connection.pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            for key in keys:
+                pipe.pttl(key)
+            values, *pttls = await pipe.execute()
+        return [(data, pttl / 1000 if pttl >= 0 else None) for data, pttl in zip(values, pttls)]
+
+    async def set_many(self, items: dict[str, Any], expired_time: int, channel: str | None = None) -> None:
+        """Записывает значения одним конвейером, с channel - публикует туда каждый ключ."""
+        async with self.connection.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, expired_time)
+                if channel:
+                    pipe.publish(channel, key)
+            await pipe.execute()
+
+    async def set_if_absent(self, key: str, value: Any, expired_ms: int) -> bool:
+        return bool(await self.connection.set(key, value, px=expired_ms, nx=True))
+
+    async def exists(self, key: str) -> bool:
+        return bool(await self.connection.exists(key))
+
+    async def eval(self, script: str, keys: list[str], args: list[Any]) -> Any:
+        return await self.connection.eval(script, len(keys), *keys, *args)
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self.connection.publish(channel, message)
+
+    def pubsub(self) -> PubSub:
+        return self.connection.pubsub()
+
     async def pipeline(self):
         return await self.connection.pipeline()
 
     async def close(self):
         await self.connection.close()
+
+
+class TwoTierCache(ICache):
+    """
+    Кеш из двух уровней: локальный LRU с уже разобранными объектами перед Redis.
+
+    Попадание в локальный уровень не требует ни сетевого запроса, ни валидации JSON.
+    При записи ключа воркер публикует его в канал инвалидации, и все воркеры удаляют
+    свою локальную копию. Локальная запись живет не дольше local_ttl секунд, что
+    ограничивает устаревание, если сообщение об инвалидации было потеряно.
+    Разобранные объекты общие для всех запросов воркера, изменять их нельзя.
+
+    Запись хранится в Redis на stale_ttl секунд дольше запрошенного срока. В это время
+    она считается устаревшей: ее по-прежнему отдают, но вызывают on_stale, чтобы
+    обновить значение в фоне, а в локальный уровень не кладут.
+    """
+
+    def __init__(
+        self,
+        remote: RedisCache,
+        local_maxsize: int,
+        local_ttl: float,
+        channel: str = 'cache_invalidation',
+        reconnect_delay: float = 1.0,
+        stale_ttl: int = 0
+    ) -> None:
+        self.remote = remote
+        self.local = LRUCache(local_maxsize, local_ttl)
+        self.channel = channel
+        self.stale_ttl = stale_ttl
+        self.reconnect_delay = reconnect_delay
+        self._task: asyncio.Task | None = None
+
+    async def get(self, key: str) -> str | None:
+        return await self.remote.get(key)
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return await self.remote.get_many(keys)
+
+    async def get_parsed(
+        self,
+        key: str,
+        parse: Callable[[str | bytes], T],
+        on_stale: Callable[[], None] | None = None
+    ) -> T | None:
+        value = self.local.get(key)
+        if value is not None:
+            metrics.LOCAL_TIER_HIT.inc()
+            return value
+        metrics.LOCAL_TIER_MISS.inc()
+
+        data, ttl = await self.remote.get_with_ttl(key)
+        value = parse_cached(key, data, parse) if data else None
+        if value is None:
+            metrics.REDIS_TIER_MISS.inc()
+            if data:
+                await self.remote.delete(key)
+            return None
+        metrics.REDIS_TIER_HIT.inc()
+
+        if not self._keep_local(key, value, ttl) and on_stale is not None:
+            on_stale()
+        return value
+
+    async def get_parsed_many(
+        self,
+        keys: list[str],
+        parse: Callable[[str | bytes], T],
+        on_stale: Callable[[str], None] | None = None
+    ) -> list[T | None]:
+        values: list[T | None] = [self.local.get(key) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        metrics.LOCAL_TIER_HIT.inc(len(keys) - len(missing))
+        metrics.LOCAL_TIER_MISS.inc(len(missing))
+        if not missing:
+            return values
+
+        entries = await self.remote.get_many_with_ttl([keys[i] for i in missing])
+        undecodable = []
+        for i, (data, ttl) in zip(missing, entries):
+            values[i] = parse_cached(keys[i], data, parse) if data else None
+            if values[i] is None:
+                metrics.REDIS_TIER_MISS.inc()
+                if data:
+                    undecodable.append(keys[i])
+                continue
+            metrics.REDIS_TIER_HIT.inc()
+            if not self._keep_local(keys[i], values[i], ttl) and on_stale is not None:
+                on_stale(keys[i])
+        await self.remote.delete(*undecodable)
+        return values
+
+    def _keep_local(self, key: str, value: Any, ttl: float | None) -> bool:
+        """Кладет свежее значение в локальный уровень. False - значение устарело."""
+        fresh_for = self.local.ttl if ttl is None else ttl - self.stale_ttl
+        if fresh_for <= 0:
+            return False
+        # локальная копия не должна пережить свежую запись в Redis
+        self.local.set(key, value, min(self.local.ttl, fresh_for))
+        return True
+
+    async def set(self, key: str, value: Any, expired_time: int) -> None:
+        await self.remote.set(key, value, expired_time + self.stale_ttl)
+        self.local.delete(key)
+        await self.remote.publish(self.channel, key)
+
+    async def delete(self, *keys: str) -> None:
+        await self.remote.delete(*keys)
+        for key in keys:
+            self.local.delete(key)
+
+    async def set_many(self, items: dict[str, Any], expired_time: int) -> None:
+        await self.remote.set_many(items, expired_time + self.stale_ttl, channel=self.channel)
+        for key in items:
+            self.local.delete(key)
+
+    async def pipeline(self):
+        return await self.remote.pipeline()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.remote.close()
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.remote.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # пока подписки не было, сообщения об инвалидации могли потеряться
+                self.local.clear()
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    key = message['data']
+                    self.local.delete(key.decode() if isinstance(key, bytes) else key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error('Cache invalidation subscription failed: %s', e)
+            finally:
+                await pubsub.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+
+class RedisLock:
+    """
+    Блокировка загрузки ключа между воркерами (SET NX PX).
+
+    Блокировку берет воркер, который идет за значением в хранилище, остальные ждут,
+    пока он запишет кеш. Время жизни снимает блокировку, если воркер упал, не отпустив ее.
+    """
+
+    RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(
+        self,
+        cache: RedisCache,
+        ttl: float,
+        wait_timeout: float,
+        poll_interval: float,
+        prefix: str = 'lock:'
+    ) -> None:
+        self.cache = cache
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+
+    async def acquire(self, key: str) -> str | None:
+        """Возвращает токен владельца или None, если блокировку держит другой воркер."""
+        token = uuid.uuid4().hex
+        if await self.cache.set_if_absent(self.prefix + key, token, int(self.ttl * 1000)):
+            return token
+        return None
+
+    async def release(self, key: str, token: str) -> None:
+        # снимаем только свою блокировку: чужую могли взять после истечения нашей
+        await self.cache.eval(self.RELEASE_SCRIPT, [self.prefix + key], [token])
+
+    async def wait(self, key: str) -> bool:
+        """Ждет снятия блокировки не дольше wait_timeout секунд. False - не дождались."""
+        deadline = time.monotonic() + self.wait_timeout
+        while await self.cache.exists(self.prefix + key):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval)
+        return True
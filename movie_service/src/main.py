@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from datetime import datetime
 
@@ -6,33 +7,68 @@ import uvicorn
 from fastapi import FastAPI
 from fastapi import Request, status
 from fastapi.responses import JSONResponse
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
+from api import metrics as metrics_api
 from api.v1 import films, genres, persons
+from core import metrics
 from core.config import settings
+from core.tracer import configure_tracer
 
-from db.redis import RedisCache
+from db.redis import RedisCache, RedisLock, TwoTierCache
 from db.elastic import ElasticStorage
 
 from db import cache
 from db import storage
+from services import jwks
+from services.jwks import JWKSClient
 
 
 REQUEST_LIMIT_PER_MINUTE = 20
+METRICS_PATH = '/metrics'
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    cache.cache = RedisCache(
-        host=settings.redis_host, port=settings.redis_port
+    redis_cache = RedisCache(host=settings.redis_host, port=settings.redis_port)
+    cache.cache = TwoTierCache(
+        redis_cache,
+        local_maxsize=settings.local_cache_size,
+        local_ttl=settings.local_cache_ttl,
+        channel=settings.cache_invalidation_channel,
+        stale_ttl=settings.cache_stale_ttl
     )
+    if settings.cache_lock_enabled:
+        cache.cache_lock = RedisLock(
+            redis_cache,
+            ttl=settings.cache_lock_ttl,
+            wait_timeout=settings.cache_lock_wait,
+            poll_interval=settings.cache_lock_poll_interval
+        )
+    await cache.cache.start()
     storage.es = ElasticStorage(
-        hosts=[f'{settings.es_host}:{settings.es_port}', ]
+        hosts=[f'{settings.es_host}:{settings.es_port}', ],
+        maxsize=settings.es_pool_maxsize
     )
+    metrics.ES_POOL_SIZE.set(settings.es_pool_maxsize)
+    loop_monitor = asyncio.create_task(metrics.monitor_event_loop(settings.metrics_sample_interval))
+    jwks.jwks_client = JWKSClient(
+        settings.jwks_url,
+        min_refresh_interval=settings.jwks_refresh_interval,
+        headers={'X-Request-Id': settings.project_name}
+    )
+    await jwks.jwks_client.refresh()
     yield
+    loop_monitor.cancel()
+    await asyncio.gather(loop_monitor, return_exceptions=True)
     await cache.cache.close()
     await storage.es.close()
 
 
+if settings.enable_tracer:
+    configure_tracer()
+
+
 app = FastAPI(
     description='Информация о фильмах, жанрах и людях, участвовавших в создании произведения',
     version='1.0.0',
@@ -49,6 +85,9 @@ app = FastAPI(
 
 @app.middleware('http')
 async def rate_limit(request: Request, call_next):
+    # сбор метрик Prometheus не ограничиваем
+    if request.url.path == METRICS_PATH:
+        return await call_next(request)
     response = await call_next(request)
     request_id = request.headers.get('X-Request-Id')
     pipe = await cache.cache.pipeline()
@@ -65,6 +104,10 @@ async def rate_limit(request: Request, call_next):
     return response
 
 
+FastAPIInstrumentor.instrument_app(app)
+app.add_middleware(metrics.MetricsMiddleware)
+
+app.include_router(metrics_api.router, prefix=METRICS_PATH)
 app.include_router(films.router, prefix='/movie_service/api/v1/films', tags=['films'])
 app.include_router(persons.router, prefix='/movie_service/api/v1/persons', tags=['persons'])
 app.include_router(genres.router, prefix='/movie_service/api/v1/genres', tags=['genres'])
@@ -1,11 +1,14 @@
 import uuid
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, Field, validator
 
 from models.base import BaseProjectModel
 from models.genre import Genres
 
 
+FILM_BATCH_MAX_SIZE = 300
+
+
 class IdName(BaseModel):
     id: uuid.UUID
     name: str
@@ -38,3 +41,11 @@ class Film(FilmShort):
     actors: list[IdName] | None = None
     writers: list[IdName] | None = None
     directors: list[IdName] | None = None
+
+
+class FilmBatch(BaseModel):
+    """
+    Тело запроса для:
+    /api/v1/films/batch
+    """
+    ids: list[uuid.UUID] = Field(min_length=1, max_length=FILM_BATCH_MAX_SIZE)
@@ -0,0 +1,40 @@
+"""
+Ключи кеша. Префикс определяет тип значения, поэтому ключи разных сущностей
+и разных запросов не пересекаются, а блокировки загрузки берутся по тем же ключам.
+"""
+import uuid
+
+
+GENRES_KEY = 'genres:all'
+
+
+def film_key(film_id: uuid.UUID | str) -> str:
+    return f'film:{film_id}'
+
+
+def films_search_key(query: str, page_size: int, page_number: int) -> str:
+    return f'films:search:{page_size}:{page_number}:{query}'
+
+
+def films_sort_key(sort: str, page_size: int, page_number: int) -> str:
+    return f'films:sort:{sort}:{page_size}:{page_number}'
+
+
+def films_genre_key(genre_id: uuid.UUID | str, sort: str, page_size: int, page_number: int) -> str:
+    return f'films:genre:{genre_id}:{sort}:{page_size}:{page_number}'
+
+
+def person_films_key(person_id: uuid.UUID | str) -> str:
+    return f'films:person:{person_id}'
+
+
+def person_key(person_id: uuid.UUID | str) -> str:
+    return f'person:{person_id}'
+
+
+def persons_search_key(query: str, page_size: int, page_number: int) -> str:
+    return f'persons:search:{page_size}:{page_number}:{query}'
+
+
+def genre_key(genre_id: uuid.UUID | str) -> str:
+    return f'genre:{genre_id}'
@@ -1,20 +1,25 @@
-import json
 import uuid
 from functools import lru_cache
-from typing import Any
+from typing import Callable, TypeVar
 from abc import ABC, abstractmethod
 
 from fastapi import Depends
 
-from db.cache import get_cache
-from db.redis import ICache
+from db.codec import Codec, create_codec
+from db.cache import get_cache, get_cache_lock
+from db.redis import ICache, RedisLock
 from db.storage import get_elastic
 from db.elastic import ElasticStorage, IStorage
 from models.film import Film
 from models.person import Person
+from core import metrics
 from core.config import settings
+from services import cache_keys
+from services.single_flight import SingleFlight
 
 
+T = TypeVar('T')
+
 FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
 
 
@@ -79,25 +84,78 @@ class StorageFilmHandler(ABC):
     ) -> list[Film] | None:
         pass
 
+    @abstractmethod
+    async def get_many_films(
+        self,
+        film_ids: list[uuid.UUID]
+    ) -> list[Film | None]:
+        pass
+
 
 class CacheFilmHandler:
-    """Класс CacheFilmHandler отвечает за работу с кешом по информации о фильмах."""
+    """
+    Класс CacheFilmHandler отвечает за работу с кешом по информации о фильмах.
+    Аргументы передаются только по имени, чтобы ключ и значение нельзя было перепутать.
+    """
 
     def __init__(self, cache: ICache, expired_time: int) -> None:
         self.cache = cache
         self.expired_time = expired_time
+        self.film_codec = create_codec(Film, settings.cache_codec, settings.cache_compress_threshold)
+        self.films_codec = create_codec(list[Film], settings.cache_codec, settings.cache_compress_threshold)
 
-    async def get_film(self, key: str) -> None | Film | list[Film] | Any:
-        data = await self.cache.get(key)
-        if not data:
-            return None
+    async def get_film(
+        self,
+        *,
+        key: str,
+        on_stale: Callable[[], None] | None = None
+    ) -> Film | None:
+        return await self._get(key, self.film_codec, on_stale)
 
-        if '/' not in key:
-            return Film.model_validate_json(data)
-        return [Film.model_validate_json(obj) for obj in json.loads(data)]
+    async def get_films(
+        self,
+        *,
+        key: str,
+        on_stale: Callable[[], None] | None = None
+    ) -> list[Film] | None:
+        return await self._get(key, self.films_codec, on_stale)
 
-    async def put_film(self, key: str, value: Any):
-        await self.cache.set(key, value, self.expired_time)
+    async def put_film(self, *, key: str, value: Film) -> None:
+        await self.cache.set(key, self.film_codec.dumps(value), self.expired_time)
+
+    async def put_films(self, *, key: str, value: list[Film]) -> None:
+        await self.cache.set(key, self.films_codec.dumps(value), self.expired_time)
+
+    async def get_many_films(
+        self,
+        *,
+        keys: list[str],
+        on_stale: Callable[[str], None] | None = None
+    ) -> list[Film | None]:
+        films = await self.cache.get_parsed_many(keys, self.film_codec.loads, on_stale)
+        hits = sum(1 for film in films if film)
+        metrics.FILM_CACHE_HIT.inc(hits)
+        metrics.FILM_CACHE_MISS.inc(len(films) - hits)
+        return films
+
+    async def put_many_films(self, *, values: dict[str, Film]) -> None:
+        await self.cache.set_many(
+            {key: self.film_codec.dumps(film) for key, film in values.items()},
+            self.expired_time
+        )
+
+    async def _get(
+        self,
+        key: str,
+        codec: Codec[T],
+        on_stale: Callable[[], None] | None
+    ) -> T | None:
+        value = await self.cache.get_parsed(key, codec.loads, on_stale)
+        if not value:
+            metrics.FILM_CACHE_MISS.inc()
+            return None
+        metrics.FILM_CACHE_HIT.inc()
+        return value
 
 
 class ElasticFilmHandler(StorageFilmHandler):
@@ -223,6 +281,15 @@ class ElasticFilmHandler(StorageFilmHandler):
             return None
         return [Film(**doc) for doc in docs]
 
+    async def get_many_films(
+        self,
+        film_ids: list[uuid.UUID]
+    ) -> list[Film | None]:
+        docs = await self.storage.get_many(
+            index=settings.es_movies_index, ids=[str(film_id) for film_id in film_ids]
+        )
+        return [Film(**doc) if doc else None for doc in docs]
+
 
 class FilmService:
     """Класс FilmService содержит бизнес-логику по работе с фильмами."""
@@ -230,21 +297,44 @@ class FilmService:
     def __init__(
         self,
         cache_handler: CacheFilmHandler,
-        storage_handler: ElasticFilmHandler
+        storage_handler: ElasticFilmHandler,
+        single_flight: SingleFlight | None = None
     ) -> None:
         self.cache_handler = cache_handler
         self.storage_handler = storage_handler
+        self.single_flight = single_flight or SingleFlight()
 
     async def get_film_by_id(self, film_id: uuid.UUID) -> Film | None:
-        film = await self.cache_handler.get_film(str(film_id))
-        if not film:
-            film = await self.storage_handler.get_film_by_id(film_id)
-            if not film:
-                return None
-
-            await self.cache_handler.put_film(film.model_dump_json(), str(film_id))
+        return await self.single_flight.get_cached(
+            cache_keys.film_key(film_id),
+            get=self.cache_handler.get_film,
+            put=self.cache_handler.put_film,
+            fetch=lambda: self.storage_handler.get_film_by_id(film_id)
+        )
 
-        return film
+    async def get_films_by_id_list(self, film_ids: list[uuid.UUID]) -> list[Film | None]:
+        """
+        Фильмы в порядке film_ids, None - для ненайденных. Кеш читается одним MGET,
+        промахи и устаревшие записи загружаются одним mget из Elasticsearch.
+        """
+        unique_ids = list(dict.fromkeys(film_ids))
+        keys = [cache_keys.film_key(film_id) for film_id in unique_ids]
+        stale: set[str] = set()
+        cached = await self.cache_handler.get_many_films(keys=keys, on_stale=stale.add)
+
+        films = dict(zip(unique_ids, cached))
+        to_fetch = [
+            film_id for film_id, key in zip(unique_ids, keys)
+            if films[film_id] is None or key in stale
+        ]
+        if to_fetch:
+            fetched = await self.storage_handler.get_many_films(to_fetch)
+            films.update(zip(to_fetch, fetched))
+            found = {cache_keys.film_key(film.id): film for film in fetched if film}
+            if found:
+                await self.cache_handler.put_many_films(values=found)
+
+        return [films[film_id] for film_id in film_ids]
 
     async def get_films_by_query(
         self,
@@ -252,19 +342,15 @@ class FilmService:
         page_size: int,
         page_number: int
     ) -> list[Film]:
-        key = f'{query}/{page_size}/{page_number}'
-        films = await self.cache_handler.get_film(key)
-        if not films:
-            films = await self.storage_handler.get_films_by_query(
+        films = await self.single_flight.get_cached(
+            cache_keys.films_search_key(query, page_size, page_number),
+            get=self.cache_handler.get_films,
+            put=self.cache_handler.put_films,
+            fetch=lambda: self.storage_handler.get_films_by_query(
                 query, page_size, page_number
             )
-
-            if not films:
-                return []
-            value = json.dumps([film.model_dump_json() for film in films])
-            await self.cache_handler.put_film(key, value)
-
-        return films
+        )
+        return films or []
 
     async def get_films_with_sort(
         self,
@@ -272,18 +358,15 @@ class FilmService:
         page_size: int,
         page_number: int
     ) -> list[Film]:
-        key = f'{sort}/{page_size}/{page_number}'
-        films = await self.cache_handler.get_film(key)
-        if not films:
-            films = await self.storage_handler.get_films_with_sort(
+        films = await self.single_flight.get_cached(
+            cache_keys.films_sort_key(sort, page_size, page_number),
+            get=self.cache_handler.get_films,
+            put=self.cache_handler.put_films,
+            fetch=lambda: self.storage_handler.get_films_with_sort(
                 sort, page_size, page_number
             )
-            if not films:
-                return []
-            value = json.dumps([film.model_dump_json() for film in films])
-            await self.cache_handler.put_film(value, key)
-
-        return films
+        )
+        return films or []
 
     async def get_films_by_genre_id_with_sort(
         self,
@@ -292,47 +375,37 @@ class FilmService:
         page_size: int,
         page_number: int
     ) -> list[Film]:
-        key = f'{genre_id}/{sort}/{page_size}/{page_number}'
-        films = await self.cache_handler.get_film(key)
-        if not films:
-            films = await self.storage_handler.get_films_by_genre_id_with_sort(
+        films = await self.single_flight.get_cached(
+            cache_keys.films_genre_key(genre_id, sort, page_size, page_number),
+            get=self.cache_handler.get_films,
+            put=self.cache_handler.put_films,
+            fetch=lambda: self.storage_handler.get_films_by_genre_id_with_sort(
                 genre_id, sort, page_size, page_number
             )
-            if not films:
-                return []
-            value = json.dumps([film.model_dump_json() for film in films])
-            await self.cache_handler.put_film(value, key)
-
-        return films
+        )
+        return films or []
 
     async def get_person_films(
         self,
         person: Person,
     ) -> list[Film]:
-
         film_ids = [str(film.id) for film in person.films]
-
-        key = '/'.join(film_ids)
-        films = await self.cache_handler.get_film(key)
-        if not films:
-            films = await self.storage_handler.get_films_by_ids(film_ids)
-            if not films:
-                return []
-            if len(films) == 1:
-                value = films[0].model_dump_json()
-            else:
-                value = json.dumps([film.model_dump_json() for film in films])
-            await self.cache_handler.put_film(key, value)
-
-        return films if type(films) == list else [films]
+        films = await self.single_flight.get_cached(
+            cache_keys.person_films_key(person.id),
+            get=self.cache_handler.get_films,
+            put=self.cache_handler.put_films,
+            fetch=lambda: self.storage_handler.get_films_by_ids(film_ids)
+        )
+        return films or []
 
 
 @lru_cache()
 def get_film_service(
     cache: ICache = Depends(get_cache),
     elastic: ElasticStorage = Depends(get_elastic),
+    cache_lock: RedisLock | None = Depends(get_cache_lock),
 ) -> FilmService:
     cache_handler = CacheFilmHandler(cache, FILM_CACHE_EXPIRE_IN_SECONDS)
     storage_handler = ElasticFilmHandler(elastic)
 
-    return FilmService(cache_handler, storage_handler)
+    return FilmService(cache_handler, storage_handler, SingleFlight(cache_lock))
@@ -1,19 +1,24 @@
-import json
 import uuid
 from functools import lru_cache
-from typing import Any
+from typing import Callable, TypeVar
 from abc import ABC, abstractmethod
 
 from fastapi import Depends
 
-from db.cache import get_cache
-from db.redis import ICache
+from db.codec import Codec, create_codec
+from db.cache import get_cache, get_cache_lock
+from db.redis import ICache, RedisLock
 from db.storage import get_elastic
 from db.elastic import ElasticStorage, IStorage
 from models.genre import Genres
+from core import metrics
 from core.config import settings
+from services import cache_keys
+from services.single_flight import SingleFlight
 
 
+T = TypeVar('T')
+
 GENRE_CACHE_EXPIRE_IN_SECONDS = 5 * 60  # 5 min
 
 
@@ -31,23 +36,51 @@ class StorageGenreHandler(ABC):
 
 
 class CacheGenreHandler:
-    """Класс CacheGenreHandler отвечает за работу с кешом по информации о жанрах."""
+    """
+    Класс CacheGenreHandler отвечает за работу с кешом по информации о жанрах.
+    Аргументы передаются только по имени, чтобы ключ и значение нельзя было перепутать.
+    """
 
     def __init__(self, cache: ICache, expired_time: int) -> None:
         self.cache = cache
         self.expired_time = expired_time
+        self.genre_codec = create_codec(Genres, settings.cache_codec, settings.cache_compress_threshold)
+        self.genres_codec = create_codec(list[Genres], settings.cache_codec, settings.cache_compress_threshold)
 
-    async def get_genre(self, key: str) -> None | Genres | list[Genres] | Any:
-        data = await self.cache.get(key)
-        if not data:
-            return None
+    async def get_genre(
+        self,
+        *,
+        key: str,
+        on_stale: Callable[[], None] | None = None
+    ) -> Genres | None:
+        return await self._get(key, self.genre_codec, on_stale)
 
-        if key != 'genres':
-            return Genres.model_validate_json(data)
-        return [Genres.model_validate_json(obj) for obj in json.loads(data)]
+    async def get_genres(
+        self,
+        *,
+        key: str,
+        on_stale: Callable[[], None] | None = None
+    ) -> list[Genres] | None:
+        return await self._get(key, self.genres_codec, on_stale)
 
-    async def put_genre(self, value: Any, key: str):
-        await self.cache.set(value, key, self.expired_time)
+    async def put_genre(self, *, key: str, value: Genres) -> None:
+        await self.cache.set(key, self.genre_codec.dumps(value), self.expired_time)
+
+    async def put_genres(self, *, key: str, value: list[Genres]) -> None:
+        await self.cache.set(key, self.genres_codec.dumps(value), self.expired_time)
+
+    async def _get(
+        self,
+        key: str,
+        codec: Codec[T],
+        on_stale: Callable[[], None] | None
+    ) -> T | None:
+        value = await self.cache.get_parsed(key, codec.loads, on_stale)
+        if not value:
+            metrics.GENRE_CACHE_MISS.inc()
+            return None
+        metrics.GENRE_CACHE_HIT.inc()
+        return value
 
 
 class ElasticGenreHandler(StorageGenreHandler):
@@ -89,41 +122,40 @@ class GenreService:
     def __init__(
         self,
         cache_handler: CacheGenreHandler,
-        storage_handler: ElasticGenreHandler
+        storage_handler: ElasticGenreHandler,
+        single_flight: SingleFlight | None = None
     ) -> None:
         self.cache_handler = cache_handler
         self.storage_handler = storage_handler
+        self.single_flight = single_flight or SingleFlight()
 
     async def get_genre_by_id(
         self,
         genre_id: uuid.UUID
     ) -> Genres | None:
-        genre = await self.cache_handler.get_genre(str(genre_id))
-        if not genre:
-            genre = await self.storage_handler.get_genre_by_id(genre_id)
-            if not genre:
-                return None
-
-            await self.cache_handler.put_genre(genre.model_dump_json(), str(genre_id))
-        return genre
+        return await self.single_flight.get_cached(
+            cache_keys.genre_key(genre_id),
+            get=self.cache_handler.get_genre,
+            put=self.cache_handler.put_genre,
+            fetch=lambda: self.storage_handler.get_genre_by_id(genre_id)
+        )
 
     async def get_genres(self) -> list[Genres]:
-        genres = await self.cache_handler.get_genre('genres')
-        if not genres:
-            genres = await self.storage_handler.get_genres()
-            if not genres:
-                return []
-            value = json.dumps([genre.model_dump_json() for genre in genres])
-            await self.cache_handler.put_genre(value, 'genres')
-
-        return genres
+        genres = await self.single_flight.get_cached(
+            cache_keys.GENRES_KEY,
+            get=self.cache_handler.get_genres,
+            put=self.cache_handler.put_genres,
+            fetch=self.storage_handler.get_genres
+        )
+        return genres or []
 
 
 @lru_cache()
 def get_genre_service(
     cache: ICache = Depends(get_cache),
     elastic: ElasticStorage = Depends(get_elastic),
+    cache_lock: RedisLock | None = Depends(get_cache_lock),
 ) -> GenreService:
     cache_handler = CacheGenreHandler(cache, GENRE_CACHE_EXPIRE_IN_SECONDS)
     storage_handler = ElasticGenreHandler(elastic)
-    return GenreService(cache_handler, storage_handler)
+    return GenreService(cache_handler, storage_handler, SingleFlight(cache_lock))
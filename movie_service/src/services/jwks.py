@@ -0,0 +1,76 @@
+import asyncio
+import json
+import logging
+import time
+import urllib.request
+from typing import Any
+
+import jwt
+from opentelemetry import propagate
+
+
+class JWKSClient:
+    """
+    Клиент JWKS сервиса авторизации.
+
+    Открытые ключи хранятся в памяти процесса по kid, поэтому проверка токена не требует
+    сетевых запросов. Набор ключей перезапрашивается, когда встречается неизвестный kid
+    (ротация ключей), но не чаще раза в min_refresh_interval секунд.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            timeout: float = 5,
+            min_refresh_interval: float = 10,
+            headers: dict[str, str] | None = None,
+    ) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.min_refresh_interval = min_refresh_interval
+        self.headers = headers or {}
+        self.keys: dict[str, Any] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get_key(self, kid: str | None) -> Any | None:
+        key = self.keys.get(kid)
+        if key is not None or kid is None:
+            return key
+
+        async with self._lock:
+            # ключ мог загрузить другой запрос, пока мы ждали блокировку
+            if kid not in self.keys and time.monotonic() - self._fetched_at >= self.min_refresh_interval:
+                await self.refresh()
+        return self.keys.get(kid)
+
+    async def refresh(self) -> None:
+        self._fetched_at = time.monotonic()
+        try:
+            jwks = await asyncio.to_thread(self._fetch)
+        except Exception as e:
+            logging.error('Failed to fetch JWKS from %s: %s', self.url, e)
+            return
+
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            try:
+                keys[jwk['kid']] = jwt.PyJWK(jwk).key
+            except (KeyError, jwt.PyJWKError) as e:
+                logging.warning('Skipping invalid JWK: %s', e)
+        self.keys = keys
+
+    def _fetch(self) -> dict:
+        headers = dict(self.headers)
+        # передаем контекст трейса, чтобы запрос ключей попал в трейс сервиса авторизации
+        propagate.inject(headers)
+        request = urllib.request.Request(self.url, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+jwks_client: JWKSClient | None = None
+
+
+async def get_jwks_client() -> JWKSClient:
+    return jwks_client
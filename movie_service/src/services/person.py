@@ -1,19 +1,24 @@
-import json
 import uuid
 
 from functools import lru_cache
-from typing import Any
+from typing import Callable, TypeVar
 from abc import ABC, abstractmethod
 from fastapi import Depends
 
 from db.storage import get_elastic
-from db.cache import get_cache
+from db.codec import Codec, create_codec
+from db.cache import get_cache, get_cache_lock
 from db.elastic import ElasticStorage, IStorage
-from db.redis import ICache
+from db.redis import ICache, RedisLock
 from models.person import Person
+from core import metrics
 from core.config import settings
+from services import cache_keys
+from services.single_flight import SingleFlight
 
 
+T = TypeVar('T')
+
 PERSON_CACHE_EXPIRE_IN_SECONDS = 5 * 60  # 5 min
 
 
@@ -22,23 +27,51 @@ def calculate_offset(page_size: int, page_number: int) -> int:
 
 
 class CachePersonHandler:
-    """Класс CachePersonHandler отвечает за работу с кешом по информации о персонах."""
+    """
+    Класс CachePersonHandler отвечает за работу с кешом по информации о персонах.
+    Аргументы передаются только по имени, чтобы ключ и значение нельзя было перепутать.
+    """
 
     def __init__(self, cache: ICache, expired_time: int) -> None:
         self.cache = cache
         self.expired_time = expired_time
+        self.person_codec = create_codec(Person, settings.cache_codec, settings.cache_compress_threshold)
+        self.persons_codec = create_codec(list[Person], settings.cache_codec, settings.cache_compress_threshold)
 
-    async def get_person(self, key: str) -> None | Person | list[Person] | Any:
-        data = await self.cache.get(key)
-        if not data:
-            return None
+    async def get_person(
+        self,
+        *,
+        key: str,
+        on_stale: Callable[[], None] | None = None
+    ) -> Person | None:
+        return await self._get(key, self.person_codec, on_stale)
 
-        if '/' not in key:
-            return Person.model_validate_json(data)
-        return [Person.model_validate_json(obj) for obj in json.loads(data)]
+    async def get_persons(
+        self,
+        *,
+        key: str,
+        on_stale: Callable[[], None] | None = None
+    ) -> list[Person] | None:
+        return await self._get(key, self.persons_codec, on_stale)
 
-    async def put_person(self, key: str, value: Any):
-        await self.cache.set(key, value, self.expired_time)
+    async def put_person(self, *, key: str, value: Person) -> None:
+        await self.cache.set(key, self.person_codec.dumps(value), self.expired_time)
+
+    async def put_persons(self, *, key: str, value: list[Person]) -> None:
+        await self.cache.set(key, self.persons_codec.dumps(value), self.expired_time)
+
+    async def _get(
+        self,
+        key: str,
+        codec: Codec[T],
+        on_stale: Callable[[], None] | None
+    ) -> T | None:
+        value = await self.cache.get_parsed(key, codec.loads, on_stale)
+        if not value:
+            metrics.PERSON_CACHE_MISS.inc()
+            return None
+        metrics.PERSON_CACHE_HIT.inc()
+        return value
 
 
 class StoragePersonHandler(ABC):
@@ -112,24 +145,24 @@ class PersonService:
     def __init__(
         self,
         cache_handler: CachePersonHandler,
-        storage_handler: ElasticPersonHandler
+        storage_handler: ElasticPersonHandler,
+        single_flight: SingleFlight | None = None
     ) -> None:
         self.cache_handler = cache_handler
         self.storage_handler = storage_handler
+        self.single_flight = single_flight or SingleFlight()
 
     async def get_person_by_id(self, person_id: uuid.UUID) -> Person | None:
         """
         Функция возвращает объект персоны.
         Он опционален, так как персона может отсутствовать в базе.
         """
-        person = await self.cache_handler.get_person(str(person_id))
-        if not person:
-            person = await self.storage_handler.get_person_by_id(person_id)
-            if not person:
-                return None
-            await self.cache_handler.put_person(str(person_id), person.model_dump_json())
-
-        return person
+        return await self.single_flight.get_cached(
+            cache_keys.person_key(person_id),
+            get=self.cache_handler.get_person,
+            put=self.cache_handler.put_person,
+            fetch=lambda: self.storage_handler.get_person_by_id(person_id)
+        )
 
     async def get_persons_by_query(
         self,
@@ -138,28 +171,24 @@ class PersonService:
         page_number: int
     ) -> list[Person]:
         """Функция возвращает список персон на основании запроса."""
-        key = f'{query}/{page_size}/{page_number}'
-        persons = await self.cache_handler.get_person(key)
-        if not persons:
-            persons = await self.storage_handler.get_persons_by_query(
+        persons = await self.single_flight.get_cached(
+            cache_keys.persons_search_key(query, page_size, page_number),
+            get=self.cache_handler.get_persons,
+            put=self.cache_handler.put_persons,
+            fetch=lambda: self.storage_handler.get_persons_by_query(
                 query, page_size, page_number
             )
-
-            if not persons:
-                return []
-            value = json.dumps([person.model_dump_json()
-                               for person in persons])
-            await self.cache_handler.put_person(key, value)
-
-        return persons
+        )
+        return persons or []
 
 
 @lru_cache()
 def get_person_service(
     cache: ICache = Depends(get_cache),
     elastic: ElasticStorage = Depends(get_elastic),
+    cache_lock: RedisLock | None = Depends(get_cache_lock),
 ) -> PersonService:
     cache_handler = CachePersonHandler(cache, PERSON_CACHE_EXPIRE_IN_SECONDS)
     storage_handler = ElasticPersonHandler(elastic)
 
-    return PersonService(cache_handler, storage_handler)
+    return PersonService(cache_handler, storage_handler, SingleFlight(cache_lock))
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from functools import partial
+from typing import Awaitable, Callable, TypeVar
+
+from core import metrics
+from db.redis import RedisLock
+
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные загрузки одного ключа из хранилища.
+
+    Пока ключ загружается, остальные запросы воркера ждут результат этой загрузки,
+    а не отправляют в Elasticsearch такой же запрос. С блокировкой в Redis ключ загружает
+    один воркер из всех: остальные дожидаются, пока он запишет кеш, и читают значение оттуда.
+    """
+
+    def __init__(self, lock: RedisLock | None = None) -> None:
+        self.lock = lock
+        self._calls: dict[str, asyncio.Task] = {}
+
+    async def do(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[T]],
+        reload: Callable[[], Awaitable[T | None]]
+    ) -> T:
+        """
+        load читает значение из хранилища и записывает его в кеш,
+        reload читает кеш после того, как ключ загрузил другой воркер.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._start(key, self._load(key, load, reload))
+        else:
+            metrics.CACHE_FILL_COALESCED.inc()
+        # отмена одного запроса не должна прерывать загрузку для остальных
+        return await asyncio.shield(task)
+
+    async def get_cached(
+        self,
+        key: str,
+        *,
+        get: Callable[..., Awaitable[T | None]],
+        put: Callable[..., Awaitable[None]],
+        fetch: Callable[[], Awaitable[T | None]]
+    ) -> T | None:
+        """
+        Читает значение из кеша методом get. При промахе загружает его через fetch
+        один раз на все одновременные запросы и записывает методом put,
+        устаревшее значение обновляет в фоне.
+        """
+        async def load() -> T | None:
+            value = await fetch()
+            if value:
+                await put(key=key, value=value)
+            return value
+
+        value = await get(key=key, on_stale=lambda: self.refresh(key, load))
+        if not value:
+            value = await self.do(key, load, lambda: get(key=key))
+        return value
+
+    def refresh(self, key: str, load: Callable[[], Awaitable[T]]) -> None:
+        """Обновляет устаревшее значение в фоне, если ключ еще не загружается."""
+        if key in self._calls:
+            return
+        metrics.CACHE_FILL_STALE.inc()
+        self._start(key, self._refresh(key, load))
+
+    def _start(self, key: str, coro: Awaitable[T]) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._calls[key] = task
+        task.add_done_callback(partial(self._done, key))
+        return task
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # все ожидавшие могли отмениться, тогда ошибку загрузки никто не заберет
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[T]],
+        reload: Callable[[], Awaitable[T | None]]
+    ) -> T:
+        token = None
+        if self.lock is not None:
+            token = await self.lock.acquire(key)
+            if token is None and await self.lock.wait(key):
+                value = await reload()
+                if value:
+                    metrics.CACHE_FILL_WAITED.inc()
+                    return value
+            # не дождались или другой воркер ничего не нашел: идем в хранилище сами
+
+        metrics.CACHE_FILL_FETCHED.inc()
+        try:
+            return await load()
+        finally:
+            if token is not None:
+                await self.lock.release(key, token)
+
+    async def _refresh(self, key: str, load: Callable[[], Awaitable[T]]) -> None:
+        token = None
+        try:
+            if self.lock is not None:
+                token = await self.lock.acquire(key)
+                if token is None:
+                    # ключ уже обновляет другой воркер
+                    return
+            await load()
+        except Exception as e:
+            logging.error('Background refresh of %s failed: %s', key, e)
+        finally:
+            if token is not None:
+                await self.lock.release(key, token)
@@ -0,0 +1,57 @@
+import hashlib
+import time
+from dataclasses import dataclass
+
+from core import metrics
+from db.lru import LRUCache
+
+
+@dataclass
+class TokenCacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class VerifiedTokenCache:
+    """
+    Ограниченный LRU кеш уже проверенных токенов: sha256(токена) -> claims.
+
+    Запись живет до exp токена, поэтому повторные запросы с тем же токеном
+    не проверяют подпись заново. Сам токен в памяти не хранится.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.stats = TokenCacheStats()
+        # срок жизни задается для каждой записи при set
+        self._data = LRUCache(maxsize, ttl=0)
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        claims = self._data.get(self._digest(token))
+        if claims is None:
+            self.stats.misses += 1
+            metrics.TOKEN_CACHE_MISS.inc()
+            return None
+
+        self.stats.hits += 1
+        metrics.TOKEN_CACHE_HIT.inc()
+        return claims
+
+    def set(self, token: str, claims: dict) -> None:
+        # токены без exp не кешируем: их нельзя вытеснить по времени
+        if 'exp' not in claims:
+            return
+        ttl = claims['exp'] - time.time()
+        if ttl > 0:
+            self._data.set(self._digest(token), claims, ttl)
+
+    def __len__(self) -> int:
+        return len(self._data)
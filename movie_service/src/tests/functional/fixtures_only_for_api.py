@@ -22,3 +22,21 @@ def make_get_request(fastapi_session: aiohttp.ClientSession):
             }
             return response
     return inner
+
+
+@pytest_asyncio.fixture(scope='function')
+def make_post_request(fastapi_session: aiohttp.ClientSession):
+    async def inner(endpoint: str, json_data: dict):
+        url = test_settings.service_url + f'/api/v1/{endpoint}'
+        async with fastapi_session.post(url, json=json_data) as response:
+            body = await response.json() if response.headers['Content-type'] == 'application/json' else response.text()
+            headers = response.headers
+            status = response.status
+
+            response = {
+                'body': body,
+                'headers': headers,
+                'status': status
+            }
+            return response
+    return inner
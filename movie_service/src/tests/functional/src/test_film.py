@@ -209,6 +209,44 @@ async def test_get_films_by_genre_id_negative(
     ), 'При передаче невалидных данных ответ должен быть равным HTTP_422'
 
 
+@pytest.mark.parametrize(
+    'batch_data, expected_answer',
+    [
+        (
+            {'ids': [es_films_data[1]['id'], str(uuid.uuid4()), es_films_data[0]['id'], es_films_data[1]['id']]},
+            {'status': HTTP_200, 'body': [FILMS_RESPONSE_DATA[1], None, FILMS_RESPONSE_DATA[0], FILMS_RESPONSE_DATA[1]]}
+        ),
+        (
+            {'ids': []},
+            {'status': HTTP_422, 'body': None}
+        ),
+        (
+            {'ids': [str(uuid.uuid4()) for _ in range(301)]},
+            {'status': HTTP_422, 'body': None}
+        ),
+    ]
+)
+async def test_films_batch(
+    make_post_request,
+    es_write_data,
+    batch_data,
+    expected_answer
+):
+    await es_write_data(es_films_data, index=test_settings.es_movies_index)
+
+    # второй запрос обслуживается из кеша и должен вернуть то же самое
+    for _ in range(2):
+        response = await make_post_request('films/batch', batch_data)
+
+        assert (
+            response.get('status') == expected_answer.get('status')
+        ), 'Пакетный запрос должен возвращать HTTP_200, при пустом или слишком длинном списке - HTTP_422'
+        if expected_answer.get('status') == HTTP_200:
+            assert (
+                response.get('body') == expected_answer.get('body')
+            ), 'Фильмы должны возвращаться в порядке запроса, ненайденные - null'
+
+
 async def test_get_film_from_cache():
     storage_handler_mock = Mock(spec=ElasticFilmHandler)
     cache_handler_mock = Mock(spec=CacheFilmHandler)
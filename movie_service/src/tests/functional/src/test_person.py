@@ -154,7 +154,7 @@ async def test_person_cach(
     await es_write_data(person_cache_data, test_settings.es_persons_index)
     await make_get_request(f'persons/{query_data.get("id")}', {})
 
-    key = str(query_data.get('id'))
+    key = f'person:{query_data.get("id")}'
     value = await redis_client.get(key)
 
     assert json.loads(value) == expected_answer.get('body')
@@ -180,7 +180,7 @@ async def test_person_cache(
             {'uuid': value.get('films')[0].get('id'), 'roles': ['Writer']},
         ]
     }
-    await redis_client.set(key, json.dumps(value))
+    await redis_client.set(f'person:{key}', json.dumps(value))
     response = await make_get_request(f"persons/{key}", {})
 
     assert response.get('status') == HTTP_200
@@ -218,7 +218,7 @@ async def test_person_films_cache(
 
     await make_get_request(f'persons/{query_data.get("id")}/film', {})
 
-    key = str(expected_answer.get('body').get('id'))
+    key = f'films:person:{query_data.get("id")}'
     value = await redis_client.get(key)
 
-    assert json.loads(value) == expected_answer.get('body')
+    assert json.loads(value) == [expected_answer.get('body')]
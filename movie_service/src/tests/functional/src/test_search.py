@@ -258,7 +258,7 @@ async def test_search_films_negative(
 
 
 @pytest.mark.parametrize(
-    'query_data, expected_answer, endpoint, data, index',
+    'query_data, expected_answer, endpoint, data, index, key_prefix',
     [
         # дефолтная пагинация
         (
@@ -267,6 +267,7 @@ async def test_search_films_negative(
             'films/search',
             es_films_data,
             test_settings.es_movies_index,
+            'films:search',
         ),
         (
             {'query': 'Mat', 'page_size': 10, 'page_number': 1},
@@ -274,6 +275,7 @@ async def test_search_films_negative(
             'persons/search',
             es_persons_data,
             test_settings.es_persons_index,
+            'persons:search',
         ),
     ]
 )
@@ -285,18 +287,19 @@ async def test_search_with_cache(
     expected_answer,
     endpoint,
     data,
-    index
+    index,
+    key_prefix
 ):
-    key_string = f'{query_data.get("query")}/{query_data.get("page_size")}/{query_data.get("page_number")}'
+    key_string = (
+        f'{key_prefix}:{query_data.get("page_size")}:{query_data.get("page_number")}:{query_data.get("query")}'
+    )
     key = bytes(key_string, 'utf-8')
     await redis_client.set(key, '')
 
     await make_get_request(endpoint, query_data)
 
     value = await redis_client.get(key)
-    str1 = value.decode('UTF-8')
-    dict_str = json.loads(str1)
-    list_of_dicts = [json.loads(s) for s in dict_str]
+    list_of_dicts = json.loads(value)
 
     assert (
         list_of_dicts == data[:query_data.get('page_size')]
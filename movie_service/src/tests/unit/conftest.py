@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# модульные тесты работают в памяти процесса и не требуют Elasticsearch и Redis из tests/functional
+sys.path.append(str(Path(__file__).resolve().parents[2]))
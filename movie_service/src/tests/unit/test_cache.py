@@ -0,0 +1,246 @@
+import asyncio
+import json
+import uuid
+import pytest
+
+from typing import Any
+from unittest.mock import Mock
+
+from db.codec import ZSTD_MAGIC
+from db.redis import ICache
+from models.film import Film
+from models.genre import Genres
+from models.person import Person
+from services.film import (
+    FilmService,
+    CacheFilmHandler,
+    ElasticFilmHandler
+)
+from services.genre import (
+    GenreService,
+    CacheGenreHandler,
+    ElasticGenreHandler
+)
+from services.person import (
+    PersonService,
+    CachePersonHandler,
+    ElasticPersonHandler
+)
+
+
+CALLS = 10
+
+FILM_ID = uuid.uuid4()
+GENRE_ID = uuid.uuid4()
+PERSON_ID = uuid.uuid4()
+
+FILM = Film(id=FILM_ID, title='Star Wars', imdb_rating=8.6, description='A long time ago')
+GENRE = Genres(id=GENRE_ID, name='Sci-Fi')
+PERSON = Person(
+    id=PERSON_ID,
+    full_name='Mark Hamill',
+    films=[{'id': FILM_ID, 'roles': ['actor']}]
+)
+
+
+class DictCache(ICache):
+    """Кеш в памяти процесса, считающий попадания."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> str | None:
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any, expired_time: int) -> None:
+        self.data[key] = value
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def close(self):
+        pass
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses)
+
+
+def make_film_service(cache: ICache) -> tuple[FilmService, Mock]:
+    storage_handler_mock = Mock(spec=ElasticFilmHandler)
+    storage_handler_mock.get_film_by_id.return_value = FILM
+    storage_handler_mock.get_films_by_query.return_value = [FILM]
+    storage_handler_mock.get_films_with_sort.return_value = [FILM]
+    storage_handler_mock.get_films_by_genre_id_with_sort.return_value = [FILM]
+    storage_handler_mock.get_films_by_ids.return_value = [FILM]
+    return FilmService(CacheFilmHandler(cache, 60), storage_handler_mock), storage_handler_mock
+
+
+def make_person_service(cache: ICache) -> tuple[PersonService, Mock]:
+    storage_handler_mock = Mock(spec=ElasticPersonHandler)
+    storage_handler_mock.get_person_by_id.return_value = PERSON
+    storage_handler_mock.get_persons_by_query.return_value = [PERSON]
+    return PersonService(CachePersonHandler(cache, 60), storage_handler_mock), storage_handler_mock
+
+
+def make_genre_service(cache: ICache) -> tuple[GenreService, Mock]:
+    storage_handler_mock = Mock(spec=ElasticGenreHandler)
+    storage_handler_mock.get_genre_by_id.return_value = GENRE
+    storage_handler_mock.get_genres.return_value = [GENRE]
+    return GenreService(CacheGenreHandler(cache, 60), storage_handler_mock), storage_handler_mock
+
+
+@pytest.mark.parametrize(
+    'make_service, method, args, storage_method, key',
+    [
+        (make_film_service, 'get_film_by_id', (FILM_ID,), 'get_film_by_id', f'film:{FILM_ID}'),
+        (
+            make_film_service, 'get_films_by_query', ('Star', 10, 1),
+            'get_films_by_query', 'films:search:10:1:Star'
+        ),
+        (
+            make_film_service, 'get_films_with_sort', ('-imdb_rating', 10, 1),
+            'get_films_with_sort', 'films:sort:-imdb_rating:10:1'
+        ),
+        (
+            make_film_service, 'get_films_by_genre_id_with_sort', (GENRE_ID, '-imdb_rating', 10, 1),
+            'get_films_by_genre_id_with_sort', f'films:genre:{GENRE_ID}:-imdb_rating:10:1'
+        ),
+        (make_film_service, 'get_person_films', (PERSON,), 'get_films_by_ids', f'films:person:{PERSON_ID}'),
+        (make_person_service, 'get_person_by_id', (PERSON_ID,), 'get_person_by_id', f'person:{PERSON_ID}'),
+        (
+            make_person_service, 'get_persons_by_query', ('Mark', 10, 1),
+            'get_persons_by_query', 'persons:search:10:1:Mark'
+        ),
+        (make_genre_service, 'get_genre_by_id', (GENRE_ID,), 'get_genre_by_id', f'genre:{GENRE_ID}'),
+        (make_genre_service, 'get_genres', (), 'get_genres', 'genres:all'),
+    ]
+)
+async def test_cache_hit_rate(make_service, method, args, storage_method, key):
+    """Повторные запросы обслуживаются из кеша: в хранилище уходит только первый."""
+    cache = DictCache()
+    service, storage_handler_mock = make_service(cache)
+
+    results = [await getattr(service, method)(*args) for _ in range(CALLS)]
+
+    assert (
+        getattr(storage_handler_mock, storage_method).call_count == 1
+    ), 'Хранилище должно запрашиваться только при первом промахе'
+    assert (
+        cache.hit_rate == (CALLS - 1) / CALLS
+    ), 'Все запросы, кроме первого, должны попадать в кеш'
+    assert (
+        list(cache.data) == [key]
+    ), 'Значение должно записываться в кеш под ключом своего типа'
+    assert (
+        all(result == results[0] for result in results)
+    ), 'Ответ из кеша должен совпадать с ответом хранилища'
+
+
+async def test_concurrent_misses_fetch_once():
+    """Одновременные промахи по одному ключу ждут один запрос в хранилище."""
+    cache = DictCache()
+    film_service, storage_handler_mock = make_film_service(cache)
+
+    async def slow_get_film_by_id(film_id):
+        await asyncio.sleep(0.01)
+        return FILM
+
+    storage_handler_mock.get_film_by_id.side_effect = slow_get_film_by_id
+
+    results = await asyncio.gather(*(film_service.get_film_by_id(FILM_ID) for _ in range(CALLS)))
+
+    assert (
+        storage_handler_mock.get_film_by_id.call_count == 1
+    ), 'Одновременные промахи должны объединяться в один запрос к хранилищу'
+    assert (
+        all(result == FILM for result in results)
+    ), 'Все запросы должны получить загруженный фильм'
+
+
+async def test_search_keys_do_not_collide():
+    """Поиск фильмов и персон по одной строке кешируется под разными ключами."""
+    cache = DictCache()
+    film_service, _ = make_film_service(cache)
+    person_service, _ = make_person_service(cache)
+
+    films = await film_service.get_films_by_query('Star', 10, 1)
+    persons = await person_service.get_persons_by_query('Star', 10, 1)
+
+    assert films == [FILM] and persons == [PERSON], 'Поиск должен вернуть свои сущности'
+    assert (
+        await film_service.get_films_by_query('Star', 10, 1) == [FILM]
+    ), 'Кеш поиска фильмов не должен перезаписываться поиском персон'
+
+
+async def test_films_batch_hit_rate():
+    """Пакетный запрос читает кеш одним вызовом и загружает из хранилища только промахи."""
+    cache = DictCache()
+    film_service, storage_handler_mock = make_film_service(cache)
+    missing_id = uuid.uuid4()
+
+    async def get_many_films(film_ids):
+        return [FILM if film_id == FILM_ID else None for film_id in film_ids]
+
+    storage_handler_mock.get_many_films.side_effect = get_many_films
+
+    for _ in range(CALLS):
+        films = await film_service.get_films_by_id_list([FILM_ID, missing_id, FILM_ID])
+        assert films == [FILM, None, FILM], 'Фильмы должны возвращаться в порядке запроса'
+
+    assert (
+        storage_handler_mock.get_many_films.call_count == CALLS
+    ), 'Каждый пакетный запрос должен делать не больше одного запроса к хранилищу'
+    assert (
+        all(call.args[0] == [missing_id] for call in storage_handler_mock.get_many_films.call_args_list[1:])
+    ), 'После первого запроса из хранилища должны загружаться только промахи'
+    assert (
+        list(cache.data) == [f'film:{FILM_ID}']
+    ), 'Найденные фильмы должны записываться в кеш под ключом фильма'
+
+
+@pytest.mark.parametrize(
+    'cached_value',
+    [
+        # прежний формат списков: JSON-массив строк с JSON каждого фильма
+        json.dumps([FILM.model_dump_json()]),
+        b'\x92\x81\xa2id',
+        ZSTD_MAGIC + b'not a zstd frame',
+    ]
+)
+async def test_undecodable_value_is_a_miss(cached_value):
+    """Значение в прежнем или чужом формате считается промахом и перезаписывается."""
+    cache = DictCache()
+    film_service, storage_handler_mock = make_film_service(cache)
+    key = 'films:search:10:1:Star'
+    cache.data[key] = cached_value
+
+    assert await film_service.get_films_by_query('Star', 10, 1) == [FILM]
+    assert storage_handler_mock.get_films_by_query.call_count == 1, 'Фильмы должны загружаться из хранилища'
+    assert json.loads(cache.data[key])[0]['id'] == str(FILM_ID), 'Значение должно перезаписываться в новом формате'
+
+    assert await film_service.get_films_by_query('Star', 10, 1) == [FILM]
+    assert storage_handler_mock.get_films_by_query.call_count == 1, 'Перезаписанное значение должно читаться из кеша'
+
+
+async def test_undecodable_value_in_batch_is_a_miss():
+    cache = DictCache()
+    film_service, storage_handler_mock = make_film_service(cache)
+    cache.data[f'film:{FILM_ID}'] = '{"id": "broken"}'
+
+    async def get_many_films(film_ids):
+        return [FILM for _ in film_ids]
+
+    storage_handler_mock.get_many_films.side_effect = get_many_films
+
+    assert await film_service.get_films_by_id_list([FILM_ID]) == [FILM]
+    assert storage_handler_mock.get_many_films.call_args.args[0] == [FILM_ID]
+    assert json.loads(cache.data[f'film:{FILM_ID}'])['title'] == FILM.title
@@ -0,0 +1,173 @@
+import asyncio
+import uuid
+import pytest
+
+from typing import Any
+
+from db.redis import TwoTierCache
+from models.film import Film
+
+
+FILM = Film(id=uuid.uuid4(), title='Star Wars', imdb_rating=8.6, description='A long time ago')
+KEY = f'film:{FILM.id}'
+LOCAL_TTL = 30
+STALE_TTL = 60
+
+
+class FakePubSub:
+    def __init__(self, redis: 'FakeRedis') -> None:
+        self.redis = redis
+        self.messages: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, channel: str) -> None:
+        self.redis.subscribers.append(self.messages)
+        self.messages.put_nowait({'type': 'subscribe', 'data': 1})
+
+    async def listen(self):
+        while True:
+            yield await self.messages.get()
+
+    async def close(self) -> None:
+        self.redis.subscribers.remove(self.messages)
+
+
+class FakeRedis:
+    """Redis в памяти процесса, общий для нескольких воркеров: значения с TTL и рассылка pub/sub."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, tuple[Any, float | None]] = {}
+        self.subscribers: list[asyncio.Queue] = []
+        self.reads = 0
+
+    async def get_with_ttl(self, key: str) -> tuple[Any, float | None]:
+        self.reads += 1
+        return self.data.get(key, (None, None))
+
+    async def get_many_with_ttl(self, keys: list[str]) -> list[tuple[Any, float | None]]:
+        self.reads += 1
+        return [self.data.get(key, (None, None)) for key in keys]
+
+    async def set(self, key: str, value: Any, expired_time: int) -> None:
+        self.data[key] = (value, expired_time)
+
+    async def set_many(self, items: dict[str, Any], expired_time: int, channel: str | None = None) -> None:
+        for key, value in items.items():
+            await self.set(key, value, expired_time)
+            if channel:
+                await self.publish(channel, key)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def publish(self, channel: str, message: str) -> None:
+        for messages in self.subscribers:
+            messages.put_nowait({'type': 'message', 'data': message.encode()})
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self)
+
+    async def close(self) -> None:
+        pass
+
+
+def make_cache(redis: FakeRedis) -> TwoTierCache:
+    return TwoTierCache(redis, local_maxsize=100, local_ttl=LOCAL_TTL, stale_ttl=STALE_TTL)
+
+
+async def wait_for(condition) -> None:
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError('Condition was not met')
+
+
+@pytest.fixture
+def redis() -> FakeRedis:
+    redis = FakeRedis()
+    redis.data[KEY] = (FILM.model_dump_json(), STALE_TTL + 300)
+    return redis
+
+
+async def test_local_hit_skips_redis_and_parsing(redis: FakeRedis):
+    cache = make_cache(redis)
+
+    first = await cache.get_parsed(KEY, Film.model_validate_json)
+    second = await cache.get_parsed(KEY, Film.model_validate_json)
+
+    assert first == FILM
+    assert second is first, 'Из локального уровня возвращается уже разобранный объект'
+    assert redis.reads == 1
+
+
+async def test_batch_reads_only_local_misses(redis: FakeRedis):
+    cache = make_cache(redis)
+    await cache.get_parsed(KEY, Film.model_validate_json)
+
+    assert await cache.get_parsed_many([KEY, 'film:missing'], Film.model_validate_json) == [FILM, None]
+    assert redis.reads == 2
+    assert await cache.get_parsed_many([KEY], Film.model_validate_json) == [FILM]
+    assert redis.reads == 2, 'Пакет из одних локальных попаданий не должен ходить в Redis'
+
+
+async def test_set_invalidates_other_workers(redis: FakeRedis):
+    writer, reader = make_cache(redis), make_cache(redis)
+    await reader.start()
+    await wait_for(lambda: redis.subscribers)
+    await reader.get_parsed(KEY, Film.model_validate_json)
+
+    updated = FILM.model_copy(update={'title': 'The Empire Strikes Back'})
+    await writer.set(KEY, updated.model_dump_json(), 300)
+    await wait_for(lambda: reader.local.get(KEY) is None)
+
+    assert await reader.get_parsed(KEY, Film.model_validate_json) == updated
+    await reader.close()
+
+
+async def test_resubscribe_clears_local_tier(redis: FakeRedis):
+    """Пока подписки не было, инвалидации могли потеряться: локальный уровень очищается."""
+    cache = make_cache(redis)
+    await cache.get_parsed(KEY, Film.model_validate_json)
+
+    await cache.start()
+    await wait_for(lambda: redis.subscribers)
+
+    assert len(cache.local) == 0
+    await cache.close()
+
+
+async def test_local_copy_does_not_outlive_fresh_redis_entry(redis: FakeRedis):
+    cache = make_cache(redis)
+    redis.data[KEY] = (FILM.model_dump_json(), STALE_TTL + 0.05)
+
+    assert await cache.get_parsed(KEY, Film.model_validate_json) == FILM
+    assert cache.local.get(KEY) == FILM
+    await asyncio.sleep(0.06)
+
+    assert cache.local.get(KEY) is None, 'Локальная копия живет не дольше свежей записи в Redis'
+
+
+async def test_stale_value_is_not_kept_locally(redis: FakeRedis):
+    cache = make_cache(redis)
+    redis.data[KEY] = (FILM.model_dump_json(), STALE_TTL - 1)
+    stale = []
+
+    assert await cache.get_parsed(KEY, Film.model_validate_json, on_stale=lambda: stale.append(KEY)) == FILM
+
+    assert stale == [KEY]
+    assert cache.local.get(KEY) is None
+
+
+@pytest.mark.parametrize('method', ['get_parsed', 'get_parsed_many'])
+async def test_undecodable_redis_value_is_a_miss(redis: FakeRedis, method: str):
+    cache = make_cache(redis)
+    redis.data[KEY] = ('{"id": "broken"}', STALE_TTL + 300)
+
+    if method == 'get_parsed':
+        assert await cache.get_parsed(KEY, Film.model_validate_json) is None
+    else:
+        assert await cache.get_parsed_many([KEY], Film.model_validate_json) == [None]
+
+    assert KEY not in redis.data, 'Неразбираемое значение удаляется из Redis'
+    assert cache.local.get(KEY) is None